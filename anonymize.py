@@ -0,0 +1,124 @@
+"""Roster-wide name scrubbing for exported text.
+
+``NameAnonymizer`` compiles every student's first, last, preferred and full
+names into a single regular expression shaped like a trie (names sharing a
+prefix share a branch), so a note is scanned once no matter how many
+students are on the roster. A flat ``Ann|Anna|Annie|...`` alternation would
+retry every name at every position; the trie only follows the branch that
+matches the next character, so the cost grows with the length of the text
+rather than with the roster.
+
+Matches are whole words and case-sensitive, longest name first ("Ann Lee"
+before "Ann"), and are replaced by the student's id. A name shared by
+several students is replaced by the id of the note's own student when that
+student is one of them, otherwise by ``AMBIGUOUS_TOKEN``.
+"""
+
+import random
+import re
+import string
+import time
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+
+from models import Student
+
+AMBIGUOUS_TOKEN = '[student]'
+MIN_NAME_LENGTH = 2
+
+BenchmarkResult = namedtuple('BenchmarkResult', ['students', 'text_kb', 'seconds'])
+
+
+def _trie_pattern(words):
+    """Regex source matching exactly ``words``, factored as a trie."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        terminal = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # Greedy optional suffix: prefer the longer name, fall back to the prefix
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+
+class NameAnonymizer:
+    """Replace every roster name in a text with the matching student id."""
+
+    def __init__(self, students):
+        """``students`` yields ``(student_id, first_name, last_name, preferred_name)``."""
+        owners = defaultdict(set)
+        for student_id, first, last, preferred in students:
+            names = {first, last, preferred}
+            names.update(f"{given} {last}" for given in (first, preferred) if given and last)
+            for name in names:
+                name = ' '.join((name or '').split())
+                if len(name) >= MIN_NAME_LENGTH:
+                    owners[name].add(student_id)
+        self.owners = {name: frozenset(ids) for name, ids in owners.items()}
+        self.pattern = (
+            re.compile(rf"\b{_trie_pattern(self.owners)}\b") if self.owners else None
+        )
+
+    @classmethod
+    def from_session(cls, session):
+        """Build from the ``student`` table via a SQLAlchemy session or connection."""
+        return cls(session.execute(
+            select(Student.student_id, Student.first_name, Student.last_name, Student.preferred_name)
+        ))
+
+    def scrub(self, text, student_id=None):
+        """Return ``text`` with names replaced; ``student_id`` breaks ties for shared names."""
+        if not text or self.pattern is None:
+            return text
+
+        def replace(match):
+            ids = self.owners[match.group()]
+            if len(ids) == 1:
+                return str(next(iter(ids)))
+            return str(student_id) if student_id in ids else AMBIGUOUS_TOKEN
+
+        return self.pattern.sub(replace, text)
+
+
+def _fake_roster(size, rng):
+    def name():
+        return rng.choice(string.ascii_uppercase) + ''.join(
+            rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))
+        )
+    return [(i, name(), name(), None) for i in range(1, size + 1)]
+
+
+def benchmark(roster_sizes=(10, 100, 1000, 10000), text_sizes_kb=(16, 128, 1024), seed=0):
+    """Time ``scrub`` over synthetic notes; return a list of ``BenchmarkResult``.
+
+    Texts mix lower-case filler with capitalized words and real roster names
+    at a fixed rate, so the per-KB time should stay flat across both axes.
+    """
+    rng = random.Random(seed)
+    filler = ['the', 'student', 'was', 'able', 'to', 'Visual', 'cues', 'with', 'accuracy', 'Session']
+    results = []
+    for size in roster_sizes:
+        roster = _fake_roster(size, rng)
+        anonymizer = NameAnonymizer(roster)
+        names = [first for _, first, _, _ in roster]
+        for kb in text_sizes_kb:
+            words, length = [], 0
+            while length < kb * 1024:
+                word = rng.choice(names) if rng.random() < 0.05 else rng.choice(filler)
+                words.append(word)
+                length += len(word) + 1
+            text = ' '.join(words)
+            started = time.perf_counter()
+            anonymizer.scrub(text)
+            results.append(BenchmarkResult(size, kb, time.perf_counter() - started))
+    return results
@@ -1,7 +1,10 @@
 """Flask application entry point for the Student Database app."""
 
 import os
+import atexit
 import logging
+import time
+import uuid
 from datetime import datetime
 from pathlib import Path
 
@@ -11,6 +14,15 @@ from flask_migrate import Migrate
 from routes import routes_bp
 from models import db
 from config import config
+from template_cache import init_template_cache
+from db_backup import init_backup_scheduler
+from query_profiler import init_query_profiler
+from metrics import init_metrics
+from trial_snapshot import ensure_change_counter
+from trial_stats import ensure_generated_columns
+from write_coordination import init_write_coordination
+from clinicians import init_clinician_routing
+from log_handlers import JsonFormatter, build_file_handler, build_queue_logging
 
 def create_app(config_name=None):
     """Application factory pattern for better organization."""
@@ -26,11 +38,18 @@ def create_app(config_name=None):
     
     # Initialize extensions
     db.init_app(app)
+    init_write_coordination(app, db)
+    init_clinician_routing(app, db)
     migrate = Migrate(app, db)
+    init_query_profiler(app, db)
+    init_metrics(app, db)
     
     # Register blueprints
     app.register_blueprint(routes_bp)
     
+    # Template fragment and bytecode caching
+    init_template_cache(app, db)
+    
     # Setup logging for production
     if not app.debug:
         setup_logging(app)
@@ -44,32 +63,61 @@ def create_app(config_name=None):
     # Create database tables and instance folder
     with app.app_context():
         db.create_all()
+        # Databases created before the trial_log generated columns and the
+        # snapshot's change counter existed
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as conn:
+                ensure_generated_columns(conn.exec_driver_sql)
+                ensure_change_counter(conn.exec_driver_sql)
+    
+    # Background backups (opt-in via BACKUP_SCHEDULER)
+    init_backup_scheduler(app, db)
     
     return app
 
 def setup_logging(app):
-    """Configure logging for production use."""
+    """Configure logging for production use.
+    
+    Requests only enqueue records; a listener thread writes, rotates and
+    compresses the log file so disk I/O never blocks a request.
+    """
     log_dir = Path(app.instance_path) / 'logs'
     log_dir.mkdir(exist_ok=True)
     
     # Restrict log file permissions
     log_file = log_dir / 'app.log'
     
-    # Configure file handler
-    handler = logging.FileHandler(log_file)
+    # Configure rotating file handler
+    handler = build_file_handler(
+        log_file,
+        rotation=app.config.get('LOG_ROTATION', 'size'),
+        max_bytes=app.config.get('LOG_MAX_BYTES', 5 * 1024 * 1024),
+        backup_count=app.config.get('LOG_BACKUP_COUNT', 10),
+        when=app.config.get('LOG_ROTATE_WHEN', 'midnight'),
+        compress=app.config.get('LOG_COMPRESS', True),
+    )
     handler.setLevel(logging.INFO)
     
     # Format logs
-    formatter = logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    )
+    if app.config.get('LOG_FORMAT') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s %(levelname)s [%(request_id)s]: %(message)s [in %(pathname)s:%(lineno)d]',
+            defaults={'request_id': '-'},
+        )
     handler.setFormatter(formatter)
     
-    app.logger.addHandler(handler)
+    queue_handler, listener = build_queue_logging(handler)
+    app.logger.addHandler(queue_handler)
     app.logger.setLevel(logging.INFO)
+    listener.start()
+    atexit.register(listener.stop)
+    app.extensions['log_listener'] = listener
     
     # Restrict log file permissions (Mac/Unix)
-    if hasattr(os, 'chmod') and log_file.exists():
+    log_file.touch(exist_ok=True)
+    if hasattr(os, 'chmod'):
         os.chmod(log_file, 0o600)
 
 def setup_security_middleware(app):
@@ -81,9 +129,21 @@ def setup_security_middleware(app):
         # Ensure session is fresh (extend timeout on activity)
         session.permanent = True
         
-        # Log sensitive operations
+        # Tag the request for log correlation
+        g.request_id = uuid.uuid4().hex[:12]
+        g.request_start = time.perf_counter()
+    
+    @app.after_request
+    def log_sensitive_operations(response):
+        """Log sensitive operations with their outcome and latency."""
+        response.headers['X-Request-ID'] = g.get('request_id', '')
         if request.method in ['POST', 'PUT', 'DELETE']:
-            app.logger.info(f"Sensitive operation: {request.method} {request.path}")
+            latency_ms = round((time.perf_counter() - g.get('request_start', time.perf_counter())) * 1000, 2)
+            app.logger.info(
+                f"Sensitive operation: {request.method} {request.path} -> {response.status_code} in {latency_ms} ms",
+                extra={'status': response.status_code, 'latency_ms': latency_ms},
+            )
+        return response
 
 def setup_error_handlers(app):
     """Setup comprehensive error handling."""
@@ -113,4 +173,5 @@ if __name__ == '__main__':
         app.run(host='127.0.0.1', port=5000, debug=True)
     else:
         print("For production use, please use a proper WSGI server like gunicorn")
-        print("Example: gunicorn -w 1 -b 127.0.0.1:5000 app:app")
\ No newline at end of file
+        print("Example: gunicorn -w 4 -b 127.0.0.1:5000 app:app")
+        print("(with several workers, /metrics reports only the worker that answers)")
\ No newline at end of file
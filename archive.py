@@ -0,0 +1,252 @@
+"""Hot/cold tiering: move closed school years into an attached archive database.
+
+``archive_closed_years`` moves sessions, trial logs, SOAP notes and monthly
+quotas dated before a cutoff (by default the start of the current school
+year) into ``archive.db``, followed by inactive students with nothing left in
+the live database. Rows are copied and deleted in batched transactions with
+both files attached to one connection, so every batch is atomic. Archived
+ids are kept out of reuse through ``sqlite_sequence`` (the archived tables
+are AUTOINCREMENT).
+
+Routes keep querying the models as usual and only see the hot database.
+History views opt in to archived rows with ``history_entity(Model)``, which
+maps the model onto ``main.<table> UNION ALL archive.<table>``.
+"""
+
+import re
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import MetaData, select
+from sqlalchemy.orm import aliased
+
+from clinicians import shard_path
+from models import db
+from trial_stats import ensure_generated_columns
+
+ARCHIVE_SCHEMA = 'archive'
+SCHOOL_YEAR_START_MONTH = 9
+
+# (table, primary key, column compared against the cutoff)
+DATED_TABLES = (
+    ('events', 'event_id', 'date_of_session'),
+    ('trial_log', 'trial_log_id', 'date_of_session'),
+    ('soap_notes', 'soap_note_id', 'note_date'),
+    ('monthly_quota', 'id', 'month'),
+)
+
+
+def school_year_start(day=None):
+    """Return the first day of the school year containing ``day``."""
+    day = day or date.today()
+    year = day.year if day.month >= SCHOOL_YEAR_START_MONTH else day.year - 1
+    return date(year, SCHOOL_YEAR_START_MONTH, 1)
+
+
+def _insertable_columns(conn, schema, table):
+    """Column names of ``schema.table``, excluding generated columns."""
+    return [
+        row[1] for row in conn.execute(f'PRAGMA {schema}.table_xinfo("{table}")')
+        if row[6] == 0
+    ]
+
+
+def ensure_archive_schema(conn):
+    """Create missing archive tables/indexes and columns from the main schema."""
+    existing = {
+        row[0] for row in conn.execute(
+            f"SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type IN ('table', 'index')"
+        )
+    }
+    objects = conn.execute(
+        "SELECT type, name, sql FROM main.sqlite_master "
+        "WHERE type IN ('table', 'index') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY type DESC"
+    ).fetchall()
+    def create(name, sql):
+        # Qualify the created object's name; index targets stay unqualified
+        pattern = r'^(CREATE\s+(?:UNIQUE\s+)?(?:TABLE|INDEX))\s+("?)' + re.escape(name) + r'\2'
+        conn.execute(re.sub(pattern, rf'\1 {ARCHIVE_SCHEMA}."{name}"', sql, count=1, flags=re.I))
+
+    for kind, name, sql in objects:
+        if kind == 'table' and name not in existing:
+            create(name, sql)
+
+    # Columns added to main since the archive tables were created
+    for kind, table, sql in objects:
+        if kind != 'table' or table not in existing:
+            continue
+        archived = set(_insertable_columns(conn, ARCHIVE_SCHEMA, table))
+        for row in conn.execute(f'PRAGMA main.table_xinfo("{table}")').fetchall():
+            cid, column, col_type, notnull, default, pk, hidden = row
+            if hidden == 0 and column not in archived:
+                conn.execute(f'ALTER TABLE {ARCHIVE_SCHEMA}."{table}" ADD COLUMN "{column}" {col_type}')
+    ensure_generated_columns(conn.execute, ARCHIVE_SCHEMA)
+
+    # Indexes last, once every column they cover exists
+    existing = {
+        row[0] for row in conn.execute(
+            f"SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type = 'index'"
+        )
+    }
+    for kind, name, sql in objects:
+        if kind == 'index' and name not in existing:
+            create(name, sql)
+
+
+def _has_autoincrement(conn, table):
+    sql = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return sql is not None and 'AUTOINCREMENT' in sql[0].upper()
+
+
+def raise_high_water(conn, table, pk):
+    """Make main's ``sqlite_sequence`` cover every id in the archived ``table``.
+
+    Does nothing for tables without AUTOINCREMENT, which have no sequence.
+    """
+    if not _has_autoincrement(conn, table):
+        return
+    archived = conn.execute(f'SELECT MAX("{pk}") FROM {ARCHIVE_SCHEMA}."{table}"').fetchone()[0]
+    if archived is None:
+        return
+    seq = conn.execute("SELECT seq FROM main.sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    if seq is None:
+        conn.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)", (table, archived))
+    elif seq[0] < archived:
+        conn.execute("UPDATE main.sqlite_sequence SET seq = ? WHERE name = ?", (archived, table))
+
+
+def _move_rows(conn, table, pk, where, params, batch_size, dry_run):
+    """Move rows matching ``where`` into the archive; return the number moved.
+
+    Archived ids must never be handed out again, or the UNION views would
+    see two rows with the same key. AUTOINCREMENT tables guarantee that
+    through ``sqlite_sequence``, which is raised to the archive's highest id
+    in every batch. In databases not yet migrated to AUTOINCREMENT the row
+    with the highest primary key is kept hot instead, since SQLite assigns
+    new ids as max(id) + 1 there.
+    """
+    autoincrement = _has_autoincrement(conn, table)
+    if autoincrement:
+        condition = f'({where})'
+    else:
+        max_pk = conn.execute(f'SELECT MAX("{pk}") FROM main."{table}"').fetchone()[0]
+        if max_pk is None:
+            return 0
+        condition = f'({where}) AND "{pk}" < {int(max_pk)}'
+    if dry_run:
+        return conn.execute(f'SELECT COUNT(*) FROM main."{table}" WHERE {condition}', params).fetchone()[0]
+
+    columns = ', '.join(f'"{c}"' for c in _insertable_columns(conn, 'main', table))
+    moved = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [
+                row[0] for row in conn.execute(
+                    f'SELECT "{pk}" FROM main."{table}" WHERE {condition} ORDER BY "{pk}" LIMIT ?',
+                    (*params, batch_size),
+                )
+            ]
+            if ids:
+                marks = ', '.join('?' * len(ids))
+                conn.execute(
+                    f'INSERT INTO {ARCHIVE_SCHEMA}."{table}" ({columns}) '
+                    f'SELECT {columns} FROM main."{table}" WHERE "{pk}" IN ({marks})', ids,
+                )
+                conn.execute(f'DELETE FROM main."{table}" WHERE "{pk}" IN ({marks})', ids)
+            if autoincrement:
+                raise_high_water(conn, table, pk)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
+
+
+def archive_closed_years(db_path, archive_path, before=None, batch_size=500, dry_run=False):
+    """Move rows dated before ``before`` and fully-archived inactive students.
+
+    Returns ``{table: rows moved}`` (rows that would move when ``dry_run``).
+    """
+    before = before or school_year_start()
+    cutoff = before.isoformat()
+    counts = {}
+
+    conn = sqlite3.connect(str(db_path), isolation_level=None, timeout=30)
+    try:
+        # A dry run works against a throwaway in-memory archive
+        target = ':memory:' if dry_run else str(archive_path)
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (target,))
+        ensure_archive_schema(conn)
+
+        for table, pk, column in DATED_TABLES:
+            value = cutoff[:7] if column == 'month' else cutoff
+            counts[table] = _move_rows(
+                conn, table, pk, f'"{column}" < ?', (value,), batch_size, dry_run,
+            )
+
+        # Inactive students whose dated records have all been archived
+        idle_students = (
+            "SELECT student_id FROM main.student WHERE active = 0"
+            + "".join(
+                f" AND student_id NOT IN (SELECT student_id FROM main.{table} "
+                f"WHERE student_id IS NOT NULL)"
+                for table, _, _ in DATED_TABLES
+            )
+        )
+        counts['quarterly_reports'] = _move_rows(
+            conn, 'quarterly_reports', 'id', f"student_id IN ({idle_students})", (), batch_size, dry_run,
+        )
+        counts['objective'] = _move_rows(
+            conn, 'objective', 'objective_id',
+            f"goal_id IN (SELECT goal_id FROM main.goal WHERE student_id IN ({idle_students}))",
+            (), batch_size, dry_run,
+        )
+        counts['goal'] = _move_rows(
+            conn, 'goal', 'goal_id', f"student_id IN ({idle_students})", (), batch_size, dry_run,
+        )
+        counts['student'] = _move_rows(
+            conn, 'student', 'student_id', f"student_id IN ({idle_students})", (), batch_size, dry_run,
+        )
+    finally:
+        conn.close()
+    return counts
+
+
+_archive_metadata = MetaData()
+
+
+def archive_attached():
+    """Attach the archive to the session's connection; False if there is none."""
+    path = shard_path('ARCHIVE_DATABASE_PATH')
+    if not path or not Path(path).exists():
+        return False
+    conn = db.session.connection()
+    attached = {row[1] for row in conn.exec_driver_sql("PRAGMA database_list")}
+    if ARCHIVE_SCHEMA not in attached:
+        conn.exec_driver_sql(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(path),))
+    return True
+
+
+def history_entity(model):
+    """Return ``model`` mapped over hot and archived rows, or ``model`` itself.
+
+    Use the returned entity in place of the model class when building the
+    query, e.g. ``Log = history_entity(TrialLog)`` then
+    ``db.session.query(Log).filter(Log.student_id == student_id)``.
+    """
+    if not archive_attached():
+        return model
+    table = model.__table__
+    key = f"{ARCHIVE_SCHEMA}.{table.name}"
+    archived = _archive_metadata.tables.get(key)
+    if archived is None:
+        archived = table.to_metadata(_archive_metadata, schema=ARCHIVE_SCHEMA)
+    rows = select(table).union_all(select(archived)).subquery(f"{table.name}_history")
+    return aliased(model, rows)
@@ -0,0 +1,260 @@
+"""Deduplicated, content-addressed snapshot store for the SQLite database.
+
+A snapshot is an online backup of the database split into page-aligned
+chunks. Each chunk is stored once under its SHA-256 hash and every snapshot
+is a small JSON manifest listing its chunk hashes, so frequent snapshots only
+cost the pages that changed since the previous one. Encrypted chunks are
+named by an HMAC-SHA256 under a subkey of the backup key instead, so listing
+the folder cannot confirm that a known page is in a backup.
+
+Layout under the store root::
+
+    chunks/ab/abcdef...   zlib-compressed chunk contents
+    chunks/12/123abc.enc  encrypted chunk named by its keyed hash (stores opened with a key)
+    snapshots/<id>.json   manifest per snapshot
+    .lock                 shared by snapshots in progress, exclusive for gc
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from backup_crypto import chunk_name_key, decrypt_blob, encrypt_blob, key_id
+from db_backup import online_backup
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+# Manifest ``chunk_names`` of snapshots whose chunk and file digests are keyed;
+# encrypted snapshots without it predate keyed names and use plain SHA-256
+KEYED_NAMES = 'hmac-sha256'
+
+SnapshotResult = namedtuple(
+    'SnapshotResult',
+    ['snapshot_id', 'size', 'chunks', 'new_chunks', 'new_bytes', 'seconds'],
+)
+
+
+def sqlite_page_size(path):
+    """Read the page size from a SQLite database file header."""
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    if len(header) < 18 or not header.startswith(b'SQLite format 3\x00'):
+        raise ValueError(f"Not a SQLite database: {path}")
+    page_size = int.from_bytes(header[16:18], 'big')
+    return 65536 if page_size == 1 else page_size
+
+
+class SnapshotStore:
+    """Chunk repository with per-snapshot manifests.
+
+    With a ``key``, new snapshots store their chunks AES-GCM encrypted and
+    name them by a keyed hash; the name is authenticated with the chunk so
+    chunks cannot be swapped.
+    """
+
+    def __init__(self, root, chunk_pages=16, key=None):
+        self.root = Path(root)
+        self.chunk_dir = self.root / 'chunks'
+        self.snapshot_dir = self.root / 'snapshots'
+        self.chunk_pages = chunk_pages
+        self.key = key
+        self.name_key = chunk_name_key(key) if key is not None else None
+
+    def _ensure_dirs(self):
+        for path in (self.root, self.chunk_dir, self.snapshot_dir):
+            path.mkdir(parents=True, exist_ok=True)
+            if hasattr(os, 'chmod'):
+                os.chmod(path, 0o700)
+
+    def _hash(self, keyed):
+        if keyed:
+            return hmac.new(self.name_key, digestmod=hashlib.sha256)
+        return hashlib.sha256()
+
+    def _chunk_path(self, digest, encrypted=False):
+        return self.chunk_dir / digest[:2] / (f"{digest}.enc" if encrypted else digest)
+
+    def _chunk_names(self, manifest):
+        suffix = '.enc' if manifest.get('encrypted') else ''
+        return {digest + suffix for digest in manifest['chunks']}
+
+    def _manifest_path(self, snapshot_id):
+        return self.snapshot_dir / f"{snapshot_id}.json"
+
+    def _write_atomic(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @contextmanager
+    def _locked(self, exclusive):
+        # Chunks are written before the manifest that references them, so gc
+        # must not run while any snapshot is being taken
+        with open(self.root / '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _new_snapshot_id(self):
+        base = datetime.now().strftime('%Y%m%d_%H%M%S')
+        snapshot_id, n = base, 1
+        while self._manifest_path(snapshot_id).exists():
+            snapshot_id = f"{base}_{n}"
+            n += 1
+        return snapshot_id
+
+    def create_snapshot(self, db_path, pages=-1, throttle=0.0):
+        """Take an online backup of ``db_path`` and store it as a new snapshot."""
+        self._ensure_dirs()
+        with self._locked(exclusive=False):
+            return self._create_snapshot(db_path, pages, throttle)
+
+    def _create_snapshot(self, db_path, pages, throttle):
+        started = time.perf_counter()
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.snapshot-', suffix='.db')
+        os.close(fd)
+        try:
+            online_backup(db_path, tmp, pages=pages, throttle=throttle)
+            page_size = sqlite_page_size(tmp)
+            chunk_size = page_size * self.chunk_pages
+
+            digests, new_chunks, new_bytes = [], 0, 0
+            encrypted = self.key is not None
+            file_hash = self._hash(encrypted)
+            with open(tmp, 'rb') as f:
+                while chunk := f.read(chunk_size):
+                    file_hash.update(chunk)
+                    chunk_hash = self._hash(encrypted)
+                    chunk_hash.update(chunk)
+                    digest = chunk_hash.hexdigest()
+                    digests.append(digest)
+                    chunk_path = self._chunk_path(digest, encrypted)
+                    if not chunk_path.exists():
+                        data = zlib.compress(chunk, 1)
+                        if encrypted:
+                            data = encrypt_blob(data, self.key, digest.encode())
+                        self._write_atomic(chunk_path, data)
+                        new_chunks += 1
+                        new_bytes += len(data)
+            size = os.path.getsize(tmp)
+        finally:
+            os.unlink(tmp)
+
+        snapshot_id = self._new_snapshot_id()
+        manifest = {
+            'id': snapshot_id,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'size': size,
+            'page_size': page_size,
+            'chunk_size': chunk_size,
+            'chunks': digests,
+        }
+        if encrypted:
+            manifest.update(
+                hmac_sha256=file_hash.hexdigest(), encrypted=True,
+                key_id=key_id(self.key).hex(), chunk_names=KEYED_NAMES,
+            )
+        else:
+            manifest['sha256'] = file_hash.hexdigest()
+        self._write_atomic(self._manifest_path(snapshot_id), json.dumps(manifest).encode())
+        return SnapshotResult(
+            snapshot_id, size, len(digests), new_chunks, new_bytes,
+            time.perf_counter() - started,
+        )
+
+    def list_snapshots(self):
+        """Return manifests (without chunk lists) from oldest to newest."""
+        snapshots = []
+        for path in sorted(self.snapshot_dir.glob('*.json')):
+            manifest = json.loads(path.read_text())
+            manifest['chunk_count'] = len(manifest.pop('chunks'))
+            snapshots.append(manifest)
+        return snapshots
+
+    def load_manifest(self, snapshot_id):
+        path = self._manifest_path(snapshot_id)
+        if not path.exists():
+            raise FileNotFoundError(f"Snapshot not found: {snapshot_id}")
+        return json.loads(path.read_text())
+
+    def restore_snapshot(self, snapshot_id, dest_path):
+        """Reassemble a snapshot into ``dest_path`` and verify its checksum."""
+        manifest = self.load_manifest(snapshot_id)
+        encrypted = manifest.get('encrypted', False)
+        if encrypted and (self.key is None or key_id(self.key).hex() != manifest['key_id']):
+            raise ValueError(f"Snapshot {snapshot_id} is encrypted with a key that is not configured")
+        keyed = manifest.get('chunk_names') == KEYED_NAMES
+        dest_path = Path(dest_path)
+        file_hash = self._hash(keyed)
+        fd, tmp = tempfile.mkstemp(dir=dest_path.parent, prefix='.restore-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for digest in manifest['chunks']:
+                    data = self._chunk_path(digest, encrypted).read_bytes()
+                    if encrypted:
+                        data = decrypt_blob(data, self.key, digest.encode())
+                    chunk = zlib.decompress(data)
+                    chunk_hash = self._hash(keyed)
+                    chunk_hash.update(chunk)
+                    if not hmac.compare_digest(chunk_hash.hexdigest(), digest):
+                        raise ValueError(f"Corrupt chunk {digest} in snapshot {snapshot_id}")
+                    file_hash.update(chunk)
+                    out.write(chunk)
+            expected = manifest['hmac_sha256' if keyed else 'sha256']
+            if not hmac.compare_digest(file_hash.hexdigest(), expected):
+                raise ValueError(f"Checksum mismatch restoring snapshot {snapshot_id}")
+            if hasattr(os, 'chmod'):
+                os.chmod(tmp, 0o600)
+            os.replace(tmp, dest_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return dest_path
+
+    def delete_snapshot(self, snapshot_id):
+        self._manifest_path(snapshot_id).unlink()
+
+    def prune(self, keep):
+        """Delete all but the ``keep`` newest manifests; return the removed ids."""
+        ids = [path.stem for path in sorted(self.snapshot_dir.glob('*.json'))]
+        removed = ids[:-keep] if len(ids) > keep else []
+        for snapshot_id in removed:
+            self.delete_snapshot(snapshot_id)
+        return removed
+
+    def gc(self):
+        """Delete chunks no manifest references; return (chunks, bytes) freed."""
+        self._ensure_dirs()
+        with self._locked(exclusive=True):
+            return self._gc()
+
+    def _gc(self):
+        referenced = set()
+        for path in self.snapshot_dir.glob('*.json'):
+            referenced.update(self._chunk_names(json.loads(path.read_text())))
+
+        removed, freed = 0, 0
+        for chunk_path in self.chunk_dir.glob('*/*'):
+            if chunk_path.name not in referenced:
+                freed += chunk_path.stat().st_size
+                chunk_path.unlink()
+                removed += 1
+        return removed, freed
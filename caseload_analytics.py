@@ -0,0 +1,118 @@
+"""Vectorized caseload aggregations over a ``TrialSnapshot``.
+
+Everything here works on whole columns with ``np.unique``/``np.bincount``
+instead of iterating over ORM rows, so a group-by across millions of trial
+logs takes milliseconds and never touches SQLite. Grouping keys are either
+snapshot columns (``student_id``, ``objective_id``) or a per-student
+attribute such as grade supplied as a ``{student_id: value}`` mapping.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from models import percent
+from trial_snapshot import COUNT_COLUMNS
+
+LEGACY_COUNTS = COUNT_COLUMNS[:6]
+NEW_COUNTS = COUNT_COLUMNS[6:]
+
+GroupStat = namedtuple('GroupStat', ['key', 'logs', 'trials', 'independent', 'percent_independent'])
+
+
+def _column(snapshot, name, mask):
+    column = snapshot[name]
+    return column[mask] if mask is not None else np.asarray(column)
+
+
+def session_mask(snapshot, start=None, end=None):
+    """Boolean row mask for logs dated within ``[start, end]`` (dates or None)."""
+    if start is None and end is None:
+        return None
+    days = snapshot['day']
+    mask = np.ones(len(snapshot), dtype=bool)
+    if start is not None:
+        mask &= days >= np.datetime64(start, 'D')
+    if end is not None:
+        mask &= days <= np.datetime64(end, 'D')
+    return mask
+
+
+def student_keys(snapshot, mapping, mask=None):
+    """Map each row's student to ``mapping[student_id]``; return ``(labels, codes)``.
+
+    Students missing from ``mapping`` get code -1. ``labels[code]`` is the
+    attribute value for a code.
+    """
+    labels = sorted({value for value in mapping.values() if value is not None}, key=str)
+    code_of = {label: code for code, label in enumerate(labels)}
+    student_ids = _column(snapshot, 'student_id', mask)
+    size = max(int(student_ids.max()) if len(student_ids) else 0, max(mapping, default=0)) + 1
+    lookup = np.full(size, -1, dtype=np.int32)
+    for student_id, value in mapping.items():
+        if value is not None:
+            lookup[student_id] = code_of[value]
+    return labels, lookup[student_ids]
+
+
+def group_sums(keys, columns):
+    """Sum each array in ``columns`` per distinct key.
+
+    Returns ``(unique_keys, row_counts, {name: sums})`` with the sums aligned
+    to ``unique_keys``. Integer keys of -1 and up (ids, codes) are counted
+    with ``bincount`` directly; anything else is factorized first.
+    """
+    keys = np.asarray(keys)
+    if keys.dtype.kind in 'iu' and (not len(keys) or keys.min() >= -1):
+        slots = keys.astype(np.int64) + 1
+        counts = np.bincount(slots)
+        present = np.flatnonzero(counts)
+        unique, counts = present - 1, counts[present]
+        sums = {
+            name: np.bincount(slots, weights=values)[present].astype(np.int64)
+            for name, values in columns.items()
+        }
+        return unique, counts, sums
+
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    sums = {
+        name: np.bincount(inverse, weights=values, minlength=len(unique)).astype(np.int64)
+        for name, values in columns.items()
+    }
+    return unique, counts, sums
+
+
+def independence_by(snapshot, by='objective_id', mapping=None, start=None, end=None):
+    """Percent of new-system trials done independently, per group.
+
+    ``by`` is a snapshot column; with ``mapping`` the rows are grouped by
+    ``mapping[student_id]`` instead (e.g. grade). Only logs scored with the
+    new support levels count. Returns ``GroupStat`` rows sorted by key.
+    """
+    mask = session_mask(snapshot, start, end)
+    totals = sum(_column(snapshot, name, mask).astype(np.int64) for name in NEW_COUNTS)
+    scored = totals > 0
+    if mapping is not None:
+        labels, keys = student_keys(snapshot, mapping, mask)
+    else:
+        labels, keys = None, _column(snapshot, by, mask)
+    keys = keys[scored]
+    unique, logs, sums = group_sums(keys, {
+        'trials': totals[scored],
+        'independent': _column(snapshot, 'independent', mask)[scored],
+    })
+
+    stats = []
+    for index, key in enumerate(unique.tolist()):
+        if labels is not None:
+            if key < 0:
+                continue
+            key = labels[key]
+        trials, independent = int(sums['trials'][index]), int(sums['independent'][index])
+        stats.append(GroupStat(
+            key, int(logs[index]), trials, independent,
+            percent(independent, trials) if trials else 0.0,
+        ))
+    return stats
+
@@ -0,0 +1,222 @@
+"""Caseload-wide dashboard: quota shortfalls, stalled objectives, grade rollups.
+
+``caseload_dashboard`` loads this month's sessions with one query, counts
+them per student and status with a single ``bincount``, and takes
+trial-log metrics from the memory-mapped ``trial_snapshot``, so the cost
+does not grow with one query per student. The finished ``Dashboard`` is
+cached under the data versions of the tables it reads and the snapshot
+version, and is reused until one of them changes. The snapshot is
+refreshed in a background thread when ``trial_log`` changes, and the last
+one is served meanwhile.
+"""
+
+import threading
+import time
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, text
+
+from caseload_analytics import independence_by
+from clinicians import shard_path
+from models import Event, MonthlyQuota, db, percent
+from objective_trends import OBJECTIVE_SQL, objective_details, stalled_objectives
+from roster import active_students
+from shards import current_shard
+from template_cache import FragmentCache, data_version
+from trial_snapshot import CHANGES_TABLE, load_snapshot, refresh_snapshot
+
+EVENT_STATUSES = ('Scheduled', 'Completed', 'Excused Absence', 'Makeup Needed')
+DASHBOARD_TABLES = ('student', 'events', 'monthly_quota', 'trial_log', 'objective', 'goal')
+TREND_WINDOW_DAYS = 30
+
+QuotaRow = namedtuple('QuotaRow', [
+    'student_id', 'student_name', 'grade', 'expected', 'credited', 'upcoming',
+    'unrecorded', 'makeup_needed', 'short_by',
+])
+GradeRow = namedtuple('GradeRow', [
+    'grade', 'students', 'sessions', 'completed', 'completion_rate', 'trials', 'percent_independent',
+])
+Dashboard = namedtuple('Dashboard', [
+    'today', 'below_quota', 'stalled', 'by_grade', 'students', 'trial_logs', 'seconds',
+])
+
+_cache = FragmentCache(max_entries=8)
+_snapshot_lock = threading.Lock()
+_snapshots = {}  # shard -> (trial_log marker, TrialSnapshot)
+_refreshing = set()  # shards with a refresh running
+
+
+def _trial_log_marker():
+    """Highest id and change count: moves with every ``trial_log`` insert, edit or delete."""
+    return tuple(db.session.execute(text(
+        f"SELECT (SELECT max(trial_log_id) FROM trial_log), (SELECT changes FROM {CHANGES_TABLE})"
+    )).one())
+
+
+def _refresh_in_background(shard, marker, db_path, snapshot_dir, logger):
+    def run():
+        try:
+            refresh_snapshot(db_path, snapshot_dir)
+            snapshot = load_snapshot(snapshot_dir)
+            with _snapshot_lock:
+                _snapshots[shard] = (marker, snapshot)
+        except Exception as e:
+            logger.error(f"Analytics snapshot refresh failed: {e}")
+        finally:
+            with _snapshot_lock:
+                _refreshing.discard(shard)
+
+    _refreshing.add(shard)
+    threading.Thread(target=run, name='snapshot-refresh', daemon=True).start()
+
+
+def current_snapshot():
+    """Trial log snapshot; a stale one is served while it refreshes in the background.
+
+    Only the first use with no snapshot on disk builds it inside the request.
+    """
+    shard = current_shard()
+    marker = _trial_log_marker()
+    snapshot_dir = shard_path('ANALYTICS_SNAPSHOT_DIR')
+    db_path = db.session.get_bind().url.database
+    with _snapshot_lock:
+        loaded = _snapshots.get(shard)
+        if loaded is None:
+            snapshot = load_snapshot(snapshot_dir)
+            if snapshot is not None:
+                # Left by an earlier run; may be behind the database
+                loaded = _snapshots[shard] = (None, snapshot)
+        if loaded is None:
+            refresh_snapshot(db_path, snapshot_dir)
+            loaded = _snapshots[shard] = (marker, load_snapshot(snapshot_dir))
+        elif loaded[0] != marker and shard not in _refreshing:
+            _refresh_in_background(shard, marker, db_path, snapshot_dir, current_app.logger)
+        return loaded[1]
+
+
+def _expected_sessions(students, month):
+    """Required sessions per student: the month's quota, else ``monthly_services``."""
+    quotas = dict(db.session.execute(
+        select(MonthlyQuota.student_id, MonthlyQuota.required_sessions)
+        .where(MonthlyQuota.month == month)
+    ).all())
+    expected = np.zeros(len(students), dtype=np.int64)
+    for index, student in enumerate(students):
+        if student.student_id in quotas:
+            expected[index] = quotas[student.student_id]
+        else:
+            try:
+                expected[index] = int(student.monthly_services)
+            except (TypeError, ValueError):
+                pass
+    return expected
+
+
+def _session_counts(students, first, last, today):
+    """Return ``(counts, upcoming)`` arrays for this month's sessions.
+
+    ``counts[i, s]`` is the number of sessions of student ``i`` with status
+    ``EVENT_STATUSES[s]``; ``upcoming[i]`` counts scheduled sessions from
+    ``today`` on. Makeup sessions are left out, as in the monthly report.
+    """
+    rows = db.session.execute(
+        select(Event.student_id, Event.status, Event.date_of_session)
+        .where(
+            Event.event_type == 'Session',
+            Event.active.is_(True),
+            Event.is_makeup.is_(False),
+            Event.date_of_session >= first,
+            Event.date_of_session <= last,
+            Event.student_id.is_not(None),
+        )
+    ).all()
+    width = len(EVENT_STATUSES)
+    if not rows:
+        return np.zeros((len(students), width), dtype=np.int64), np.zeros(len(students), dtype=np.int64)
+
+    position = {student.student_id: index for index, student in enumerate(students)}
+    status_code = {status: code for code, status in enumerate(EVENT_STATUSES)}
+    student_index = np.array([position.get(student_id, -1) for student_id, _, _ in rows])
+    status = np.array([status_code.get(value, -1) for _, value, _ in rows])
+    future = np.array([day >= today for _, _, day in rows])
+    keep = (student_index >= 0) & (status >= 0)
+    cells = student_index[keep] * width + status[keep]
+    counts = np.bincount(cells, minlength=len(students) * width).reshape(len(students), width)
+    upcoming = np.bincount(
+        student_index[keep], weights=(future[keep] & (status[keep] == 0)), minlength=len(students),
+    ).astype(np.int64)
+    return counts, upcoming
+
+
+def build_dashboard(today, snapshot):
+    """Compute the dashboard for the month containing ``today`` from ``snapshot``."""
+    started = time.perf_counter()
+    students = active_students()
+    first = today.replace(day=1)
+    last = today.replace(day=monthrange(today.year, today.month)[1])
+
+    expected = _expected_sessions(students, first.strftime('%Y-%m'))
+    counts, upcoming = _session_counts(students, first, last, today)
+    scheduled, completed, excused, makeup = counts.T
+    credited = completed + excused
+    short_by = expected - credited - upcoming
+    below_quota = [
+        QuotaRow(
+            student.student_id, f"{student.first_name} {student.last_name}", student.grade,
+            int(expected[i]), int(credited[i]), int(upcoming[i]),
+            int(scheduled[i] - upcoming[i]), int(makeup[i]), int(short_by[i]),
+        )
+        for i, student in enumerate(students)
+        if short_by[i] > 0
+    ]
+    below_quota.sort(key=lambda row: (-row.short_by, row.student_name))
+
+    grades = {student.student_id: student.grade or 'No grade' for student in students}
+    independence = {
+        stat.key: stat
+        for stat in independence_by(snapshot, mapping=grades, start=today - timedelta(days=TREND_WINDOW_DAYS - 1), end=today)
+    }
+
+    # Completion counts sessions dated up to today; later ones cannot be done yet
+    held = counts.sum(axis=1) - upcoming
+    labels = sorted(set(grades.values()))
+    grade_code = np.array([labels.index(grades[student.student_id]) for student in students], dtype=np.int64)
+    per_grade = {
+        name: np.bincount(grade_code, weights=values, minlength=len(labels)).astype(np.int64)
+        for name, values in (('students', np.ones(len(students))), ('held', held), ('completed', completed))
+    } if students else {}
+    by_grade = []
+    for code, grade in enumerate(labels):
+        held_sessions = int(per_grade['held'][code])
+        done = int(per_grade['completed'][code])
+        stat = independence.get(grade)
+        by_grade.append(GradeRow(
+            grade, int(per_grade['students'][code]), held_sessions, done,
+            percent(done, held_sessions) if held_sessions else None,
+            stat.trials if stat else 0,
+            stat.percent_independent if stat else None,
+        ))
+
+    objectives = objective_details(db.session.execute(text(OBJECTIVE_SQL)))
+    stalled = stalled_objectives(snapshot, objectives, end=today)
+
+    return Dashboard(
+        today, below_quota, stalled, by_grade, len(students), len(snapshot),
+        time.perf_counter() - started,
+    )
+
+
+def caseload_dashboard(today=None):
+    """Return the cached ``Dashboard`` for ``today``, building it if stale."""
+    today = today or date.today()
+    snapshot = current_snapshot()
+    key = (current_shard(), today, data_version(*DASHBOARD_TABLES), snapshot.version)
+    dashboard = _cache.get(key)
+    if dashboard is None:
+        dashboard = build_dashboard(today, snapshot)
+        _cache.set(key, dashboard)
+    return dashboard
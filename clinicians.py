@@ -0,0 +1,236 @@
+"""One SQLite database per clinician, picked per request.
+
+With ``CLINICIAN_SHARDING`` on, the clinicians listed in
+``<CLINICIANS_FOLDER>/clinicians.json`` each get a folder laid out like
+``instance/``, holding their own ``student_database.db``, ``archive.db`` and
+``analytics/`` snapshot:
+
+    {"jdoe": {"name": "Jane Doe", "signature": "Jane Doe, MA CCC-SLP",
+              "license": "MD License #01234"}}
+
+Each request's clinician comes from the ``CLINICIAN_HEADER`` header. The
+header is only believed from ``CLINICIAN_TRUSTED_PROXIES``: the proxy in
+front of the app authenticates the user and sets it, overwriting any value
+the browser sent. Requests without a trusted clinician get a 403, and an
+unknown clinician a 404. Its engine is taken from an ``EngineCache``. That
+cache is an LRU with a size limit that disposes of engines idle longer than
+``CLINICIAN_ENGINE_IDLE_SECONDS``, so a server hosting many clinicians only
+keeps connections open for the active ones. Every shard engine gets the
+same write coordination as the main database, and the hooks registered
+with ``shards.on_shard_engine``. The schema is created the first time an
+engine is opened.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+from flask import abort, current_app, g, request
+from sqlalchemy import create_engine
+
+from models import db
+from shards import current_shard
+from trial_snapshot import ensure_change_counter
+from trial_stats import ensure_generated_columns
+from write_coordination import WriteCoordinator, WriteLock, lock_path_for
+
+CLINICIAN_SLUG = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+REGISTRY_FILENAME = 'clinicians.json'
+DATABASE_FILENAME = 'student_database.db'
+
+Clinician = namedtuple('Clinician', ['slug', 'name', 'signature', 'license'])
+
+
+def clinician_dir(folder, slug):
+    """Folder holding ``slug``'s database, archive and analytics snapshot."""
+    if not CLINICIAN_SLUG.match(slug):
+        raise ValueError(f"Invalid clinician id: {slug!r}")
+    return Path(folder) / slug
+
+
+def load_clinicians(folder):
+    """Return ``{slug: Clinician}`` from ``clinicians.json`` in ``folder``."""
+    path = Path(folder) / REGISTRY_FILENAME
+    if not path.exists():
+        return {}
+    entries = json.loads(path.read_text())
+    return {
+        slug: Clinician(slug, entry.get('name', slug), entry.get('signature', ''), entry.get('license', ''))
+        for slug, entry in entries.items()
+        if CLINICIAN_SLUG.match(slug)
+    }
+
+
+class ClinicianRegistry:
+    """``clinicians.json``, reloaded when the file changes."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._clinicians = {}
+
+    def all(self):
+        path = self.folder / REGISTRY_FILENAME
+        mtime = path.stat().st_mtime if path.exists() else None
+        with self._lock:
+            if mtime != self._mtime:
+                self._clinicians = load_clinicians(self.folder)
+                self._mtime = mtime
+            return self._clinicians
+
+    def get(self, slug):
+        return self.all().get(slug)
+
+
+class EngineCache:
+    """LRU of per-clinician engines with a size limit and idle eviction.
+
+    ``open_engine(slug)`` builds a ready engine; evicted engines are
+    disposed, which closes their pooled connections once they are returned.
+    """
+
+    def __init__(self, open_engine, max_engines=16, idle_seconds=900):
+        self.open_engine = open_engine
+        self.max_engines = max_engines
+        self.idle_seconds = idle_seconds
+        self._engines = OrderedDict()  # slug -> (engine, last used)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    def get(self, slug):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.pop(slug, None)
+            evicted = self._evict_idle(now)
+            if entry is None:
+                entry = (self.open_engine(slug), now)
+                self.opened += 1
+            self._engines[slug] = (entry[0], now)
+            while len(self._engines) > self.max_engines:
+                evicted.append(self._engines.popitem(last=False)[1][0])
+            self.evicted += len(evicted)
+        for engine in evicted:
+            engine.dispose()
+        return entry[0]
+
+    def _evict_idle(self, now):
+        evicted = []
+        # Least recently used first, so stop at the first engine still in use
+        while self._engines:
+            slug, (engine, used) = next(iter(self._engines.items()))
+            if now - used < self.idle_seconds:
+                break
+            del self._engines[slug]
+            evicted.append(engine)
+        return evicted
+
+    def __contains__(self, slug):
+        return slug in self._engines
+
+    def __len__(self):
+        return len(self._engines)
+
+    def dispose_all(self):
+        with self._lock:
+            engines = [engine for engine, _ in self._engines.values()]
+            self._engines.clear()
+        for engine in engines:
+            engine.dispose()
+
+
+def shard_path(name):
+    """``app.config[name]``, a per-database path, moved into the clinician's folder."""
+    path = current_app.config.get(name)
+    shard = current_shard()
+    if shard is None or path is None:
+        return path
+    return clinician_dir(current_app.config['CLINICIANS_FOLDER'], shard) / Path(path).name
+
+
+def current_clinician():
+    """The request's ``Clinician``, or one built from the single-clinician settings."""
+    clinician = g.get('clinician_record')
+    if clinician is None:
+        config = current_app.config
+        clinician = Clinician(None, '', config.get('CLINICIAN_SIGNATURE', ''), config.get('CLINICIAN_LICENSE', ''))
+    return clinician
+
+
+def note_signature():
+    """Signature closing the P section of SOAP notes."""
+    return current_clinician().signature
+
+
+def report_signature():
+    """Signature with license number, closing quarterly reports."""
+    clinician = current_clinician()
+    return ' '.join(part for part in (clinician.signature, clinician.license) if part)
+
+
+def init_clinician_routing(app, db):
+    """Route requests to per-clinician databases if ``CLINICIAN_SHARDING`` is set."""
+    app.jinja_env.globals.update(note_signature=note_signature, report_signature=report_signature)
+    if not app.config.get('CLINICIAN_SHARDING'):
+        return None
+
+    folder = Path(app.config['CLINICIANS_FOLDER'])
+    folder.mkdir(parents=True, exist_ok=True)
+    registry = ClinicianRegistry(folder)
+    header = app.config.get('CLINICIAN_HEADER', 'X-Clinician')
+    trusted_proxies = set(app.config.get('CLINICIAN_TRUSTED_PROXIES', ('127.0.0.1', '::1')))
+    # Kept across engine evictions: one lock file handle per clinician
+    locks = {}
+
+    def open_engine(slug):
+        directory = clinician_dir(folder, slug)
+        directory.mkdir(exist_ok=True)
+        path = directory / DATABASE_FILENAME
+        engine = create_engine(f"sqlite:///{path.as_posix()}")
+        if app.config.get('SQLITE_WRITE_LOCK', True):
+            lock = locks.setdefault(
+                slug, WriteLock(lock_path_for(path), timeout=app.config.get('SQLITE_WRITE_LOCK_TIMEOUT', 30)),
+            )
+            WriteCoordinator(
+                engine, lock,
+                busy_timeout_ms=app.config.get('SQLITE_BUSY_TIMEOUT_MS', 10000),
+                commit_retries=app.config.get('SQLITE_COMMIT_RETRIES', 5),
+                logger=app.logger,
+            ).install(journal_mode=app.config.get('SQLITE_JOURNAL_MODE', 'wal'))
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            ensure_generated_columns(conn.exec_driver_sql)
+            ensure_change_counter(conn.exec_driver_sql)
+        for hook in app.extensions.get('shard_engine_hooks', ()):
+            hook(slug, engine)
+        return engine
+
+    engines = EngineCache(
+        open_engine,
+        max_engines=app.config.get('CLINICIAN_ENGINE_CACHE_SIZE', 16),
+        idle_seconds=app.config.get('CLINICIAN_ENGINE_IDLE_SECONDS', 900),
+    )
+
+    @app.before_request
+    def _route_to_clinician():
+        if request.endpoint in ('static', 'metrics'):
+            return None
+        # A client reaching the app directly could name any clinician
+        slug = request.headers.get(header) if request.remote_addr in trusted_proxies else None
+        if not slug:
+            abort(403)
+        clinician = registry.get(slug)
+        if clinician is None:
+            abort(404)
+        g.clinician = clinician.slug
+        g.clinician_record = clinician
+        g.shard_engine = engines.get(clinician.slug)
+        return None
+
+    app.extensions['clinician_engines'] = engines
+    app.extensions['clinician_registry'] = registry
+    return engines
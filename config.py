@@ -20,6 +20,45 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Closed school years moved out by `manage.py archive`; history views
+    # attach this file on demand
+    ARCHIVE_DATABASE_PATH = INSTANCE_FOLDER / "archive.db"
+    
+    # Let several gunicorn workers share the SQLite file: WAL so reads run
+    # alongside writes, and write transactions queue on a lock file next to
+    # the database; COMMITs that still find it busy retry with backoff
+    SQLITE_WRITE_LOCK = os.environ.get("SQLITE_WRITE_LOCK", "1").lower() in {"1", "true", "yes"}
+    SQLITE_JOURNAL_MODE = "wal"
+    SQLITE_BUSY_TIMEOUT_MS = 10000
+    SQLITE_WRITE_LOCK_TIMEOUT = 30
+    SQLITE_COMMIT_RETRIES = 5
+    
+    # Name and credentials closing SOAP notes, plus the license number on
+    # quarterly reports; with sharding these come from clinicians.json
+    CLINICIAN_SIGNATURE = os.environ.get("CLINICIAN_SIGNATURE", "Sean Hendricks, MA CCC-SLP")
+    CLINICIAN_LICENSE = os.environ.get("CLINICIAN_LICENSE", "MD License #07304")
+    
+    # Optional per-clinician databases: instance/clinicians/<id>/ holds each
+    # clinician's database, archive and analytics snapshot. The clinician is
+    # read from CLINICIAN_HEADER, which the authenticating proxy must set,
+    # and only on requests from CLINICIAN_TRUSTED_PROXIES (comma-separated);
+    # any other request is refused. At most CLINICIAN_ENGINE_CACHE_SIZE
+    # engines stay open; idle ones close.
+    CLINICIAN_SHARDING = os.environ.get("CLINICIAN_SHARDING", "0").lower() in {"1", "true", "yes"}
+    CLINICIANS_FOLDER = INSTANCE_FOLDER / "clinicians"
+    CLINICIAN_HEADER = "X-Clinician"
+    CLINICIAN_TRUSTED_PROXIES = [
+        address.strip()
+        for address in os.environ.get("CLINICIAN_TRUSTED_PROXIES", "127.0.0.1,::1").split(",")
+        if address.strip()
+    ]
+    CLINICIAN_ENGINE_CACHE_SIZE = 16
+    CLINICIAN_ENGINE_IDLE_SECONDS = 900
+    
+    # Memory-mapped columnar copy of trial_log for caseload analytics,
+    # refreshed incrementally by trial_snapshot.refresh_snapshot
+    ANALYTICS_SNAPSHOT_DIR = INSTANCE_FOLDER / "analytics"
+    
     # Security headers
     SECURITY_HEADERS = {
         'X-Content-Type-Options': 'nosniff',
@@ -46,6 +85,47 @@ class Config:
     BACKUP_FOLDER = BASE_DIR / "backups"
     BACKUP_FOLDER.mkdir(exist_ok=True)
     
+    # AES-GCM key shared with manage.py; once it exists (or
+    # BACKUP_ENCRYPTION_KEY is set) scheduled backups are encrypted
+    BACKUP_KEY_PATH = INSTANCE_FOLDER / "backup.key"
+    
+    # Optional in-app backup scheduler: online backups in throttled page
+    # batches after BACKUP_EVERY_WRITES commits or BACKUP_EVERY_MINUTES.
+    # With several workers only the one holding backups/.scheduler.lock runs
+    # it, and BACKUP_EVERY_WRITES counts that worker's commits only
+    BACKUP_SCHEDULER_ENABLED = os.environ.get("BACKUP_SCHEDULER", "0").lower() in {"1", "true", "yes"}
+    BACKUP_EVERY_WRITES = 200
+    BACKUP_EVERY_MINUTES = 60
+    BACKUP_PAGES_PER_STEP = 256
+    BACKUP_STEP_SLEEP = 0.01
+    BACKUP_KEEP = 10
+    
+    # Opt-in SQL profiler; totals are written to instance/query_stats.json,
+    # one entry per worker process
+    SQL_PROFILER_ENABLED = os.environ.get("SQL_PROFILER", "0").lower() in {"1", "true", "yes"}
+    SQL_PROFILER_FLUSH_SECONDS = 30
+    
+    # Request metrics at /metrics (Prometheus text format), loopback only
+    # unless METRICS_ALLOW_REMOTE is set. Kept per worker process, so with
+    # several workers a scrape covers only the worker that answers it
+    METRICS_ENABLED = True
+    METRICS_ALLOW_REMOTE = os.environ.get("METRICS_ALLOW_REMOTE", "0").lower() in {"1", "true", "yes"}
+    
+    # Production logging: written by a background thread, rotated by size
+    # ("size") or at LOG_ROTATE_WHEN ("time"), rolled files gzipped
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()  # "text" or "json"
+    LOG_ROTATION = os.environ.get("LOG_ROTATION", "size").lower()
+    LOG_MAX_BYTES = 5 * 1024 * 1024
+    LOG_ROTATE_WHEN = "midnight"
+    LOG_BACKUP_COUNT = 10
+    LOG_COMPRESS = True
+    
+    # Template caching: rendered fragments are kept in memory (keyed by data
+    # version) and compiled templates are persisted across restarts
+    TEMPLATE_FRAGMENT_CACHE = True
+    TEMPLATE_FRAGMENT_CACHE_SIZE = 512
+    JINJA_BYTECODE_CACHE_DIR = INSTANCE_FOLDER / "jinja_cache"
+    
     @staticmethod
     def init_app(app):
         """Initialize app with security settings."""
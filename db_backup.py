@@ -0,0 +1,370 @@
+"""Online SQLite backups shared by ``manage.py`` and the running app.
+
+``online_backup`` copies the database through the SQLite backup API in
+batches of ``pages`` pages, sleeping ``throttle`` seconds between batches so
+that the live app can keep reading and writing while a large file is copied.
+``BackupScheduler`` runs those backups from a background thread after a
+number of committed writes or an elapsed interval, encrypted whenever a
+backup key is configured. With several workers only the one holding
+``.scheduler.lock`` in the backup folder takes and prunes backups. ``restore_online`` writes
+a verified backup back into the live database through the same API.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from shards import current_shard, on_shard_engine
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process runs its own scheduler
+    fcntl = None
+
+BACKUP_PREFIX = "student_db_backup_"
+SCHEDULER_LOCK = ".scheduler.lock"
+
+
+class BackupResult(namedtuple('BackupResult', ['path', 'pages', 'bytes', 'seconds'])):
+    """Outcome of a single backup run."""
+
+    __slots__ = ()
+
+    @property
+    def mb_per_sec(self):
+        return (self.bytes / 1024 / 1024) / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"{self.pages} pages, {self.bytes / 1024 / 1024:.1f} MB "
+            f"in {self.seconds:.2f}s ({self.mb_per_sec:.1f} MB/s)"
+        )
+
+
+def backup_filename(timestamp=None, encrypted=False):
+    """Return the timestamped file name used for full database backups."""
+    timestamp = timestamp or datetime.now()
+    suffix = ".db.enc" if encrypted else ".db"
+    return f"{BACKUP_PREFIX}{timestamp.strftime('%Y%m%d_%H%M%S')}{suffix}"
+
+
+def list_backups(backup_dir):
+    """Return plain and encrypted full backups in ``backup_dir``, oldest first."""
+    backups = [
+        path for path in Path(backup_dir).glob(f"{BACKUP_PREFIX}*")
+        if path.name.endswith((".db", ".db.enc"))
+    ]
+    return sorted(backups, key=lambda path: path.name)
+
+
+def online_backup(db_path, backup_path, pages=-1, throttle=0.0):
+    """Copy ``db_path`` to ``backup_path`` with the SQLite online backup API.
+
+    With ``pages=-1`` the whole file is copied in one step. A positive
+    ``pages`` copies that many pages per step and sleeps ``throttle`` seconds
+    between steps, releasing the source database in between.
+    """
+    page_count = 0
+
+    def progress(status, remaining, total):
+        nonlocal page_count
+        page_count = total
+        if remaining and throttle > 0:
+            time.sleep(throttle)
+
+    started = time.perf_counter()
+    source = sqlite3.connect(str(db_path))
+    try:
+        # The connection's own context manager commits but does not close
+        with closing(sqlite3.connect(str(backup_path))) as backup:
+            source.backup(backup, pages=pages, progress=progress)
+        if not page_count:
+            page_count = source.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        source.close()
+    seconds = time.perf_counter() - started
+
+    if hasattr(os, 'chmod'):
+        os.chmod(backup_path, 0o600)
+    return BackupResult(Path(backup_path), page_count, Path(backup_path).stat().st_size, seconds)
+
+
+VerifyResult = namedtuple('VerifyResult', ['ok', 'problems', 'row_counts', 'seconds'])
+
+
+def table_row_counts(conn):
+    """Return ``{table: row count}`` for every user table on ``conn``."""
+    tables = [
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    return {
+        table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        for table in tables
+    }
+
+
+def verify_database(path, quick=False):
+    """Run ``integrity_check`` (or ``quick_check``) and count rows per table."""
+    started = time.perf_counter()
+    conn = sqlite3.connect(f"file:{Path(path).as_posix()}?mode=ro", uri=True)
+    try:
+        pragma = "quick_check" if quick else "integrity_check"
+        problems = [row[0] for row in conn.execute(f"PRAGMA {pragma}") if row[0] != "ok"]
+        row_counts = table_row_counts(conn) if not problems else {}
+    except sqlite3.DatabaseError as e:
+        problems, row_counts = [str(e)], {}
+    finally:
+        conn.close()
+    return VerifyResult(not problems, problems, row_counts, time.perf_counter() - started)
+
+
+def restore_online(backup_path, db_path, timeout=30.0):
+    """Replace the contents of ``db_path`` with ``backup_path`` in one step.
+
+    The backup API copies every page under a single write lock on the live
+    database, so open connections see either the old or the restored data,
+    never a partially copied file. Returns a ``BackupResult``.
+    """
+    started = time.perf_counter()
+    source = sqlite3.connect(f"file:{Path(backup_path).as_posix()}?mode=ro", uri=True)
+    try:
+        with closing(sqlite3.connect(str(db_path), timeout=timeout)) as target:
+            source.backup(target, pages=-1)
+        page_count = source.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        source.close()
+    if hasattr(os, 'chmod'):
+        os.chmod(db_path, 0o600)
+    return BackupResult(
+        Path(db_path), page_count, Path(backup_path).stat().st_size,
+        time.perf_counter() - started,
+    )
+
+
+def prune_backups(backup_dir, keep=10):
+    """Delete all but the ``keep`` most recent full backups; return the removed paths."""
+    backups = list_backups(backup_dir)
+    removed = backups[:-keep] if len(backups) > keep else []
+    for backup in removed:
+        backup.unlink()
+    return removed
+
+
+class BackupScheduler:
+    """Background thread taking an online backup after N writes or T minutes.
+
+    Each worker process starts one, but only the process holding
+    ``SCHEDULER_LOCK`` runs backups; the others keep trying to take it, so
+    another takes over when that process exits. Writes are counted by
+    the process that commits them, so ``every_writes`` only sees the
+    leading worker's commits; the ``every_minutes`` timer also fires for
+    writes from other workers, seen through ``PRAGMA data_version``.
+    """
+
+    def __init__(self, db_path, backup_dir, every_writes=200, every_minutes=60,
+                 pages=256, throttle=0.01, keep=10, key=None, logger=None):
+        self.db_path = Path(db_path)
+        self.backup_dir = Path(backup_dir)
+        self.every_writes = every_writes
+        self.every_seconds = every_minutes * 60 if every_minutes else None
+        self.pages = pages
+        self.throttle = throttle
+        self.keep = keep
+        self.key = key
+        self.logger = logger
+        self.writes_since_backup = 0
+        self.last_result = None
+        self._last_backup = time.monotonic()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._leader_fd = None
+        self._version_conn = None
+        self._backup_version = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._version_conn is not None:
+            self._version_conn.close()
+            self._version_conn = None
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)
+            self._leader_fd = None
+
+    def notify_write(self):
+        """Record a committed write transaction."""
+        with self._lock:
+            self.writes_since_backup += 1
+            due = self.every_writes and self.writes_since_backup >= self.every_writes
+        if due:
+            self._wake.set()
+
+    def _lead(self):
+        """Take ``SCHEDULER_LOCK`` if no other process holds it; True once held."""
+        if fcntl is None or self._leader_fd is not None:
+            return True
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.backup_dir / SCHEDULER_LOCK, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        if self.logger:
+            self.logger.info(f"Backup scheduler running in process {os.getpid()}")
+        return True
+
+    def _data_version(self):
+        # Changes whenever another connection, in any process, commits
+        try:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(
+                    f"file:{self.db_path}?mode=rw", uri=True, check_same_thread=False,
+                )
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def _due(self):
+        if self.every_writes and self.writes_since_backup >= self.every_writes:
+            return True
+        if self.every_seconds and time.monotonic() - self._last_backup >= self.every_seconds:
+            return bool(self.writes_since_backup) or self._data_version() != self._backup_version
+        return False
+
+    def _run(self):
+        poll = min(self.every_seconds or 60, 60)
+        self._backup_version = self._data_version()
+        while not self._stop.is_set():
+            self._wake.wait(poll)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if self._due() and self._lead():
+                self.run_backup()
+
+    def run_backup(self):
+        """Take one backup now; errors are logged rather than raised."""
+        with self._lock:
+            pending = self.writes_since_backup
+            self.writes_since_backup = 0
+        self._last_backup = time.monotonic()
+        self._backup_version = self._data_version()
+        if not self.db_path.exists():
+            return None
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.key is not None:
+                # backup_crypto builds on this module
+                from backup_crypto import encrypted_backup
+                result = encrypted_backup(
+                    self.db_path, self.backup_dir / backup_filename(encrypted=True), self.key,
+                    pages=self.pages, throttle=self.throttle,
+                )
+            else:
+                result = online_backup(
+                    self.db_path, self.backup_dir / backup_filename(),
+                    pages=self.pages, throttle=self.throttle,
+                )
+            prune_backups(self.backup_dir, self.keep)
+        except Exception as e:
+            with self._lock:
+                self.writes_since_backup += pending
+            self._backup_version = None
+            if self.logger:
+                self.logger.error(f"Scheduled backup failed: {e}")
+            return None
+        self.last_result = result
+        if self.logger:
+            self.logger.info(f"Scheduled backup {result.path.name}: {result.summary()}")
+        return result
+
+
+def init_backup_scheduler(app, db):
+    """Start a ``BackupScheduler`` for ``app`` if ``BACKUP_SCHEDULER_ENABLED`` is set.
+
+    With clinician sharding each clinician's database gets its own
+    scheduler, started when its engine is first opened and writing to
+    ``<BACKUP_FOLDER>/clinicians/<id>/`` like ``manage.py --clinician``.
+    """
+    if not app.config.get('BACKUP_SCHEDULER_ENABLED'):
+        return None
+    # Under the debug reloader only the serving child process should back up
+    if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return None
+
+    with app.app_context():
+        db_path = db.engine.url.database
+    if not db_path or db_path == ':memory:':
+        return None
+
+    from backup_crypto import configured_key
+    key = configured_key(app.config['BACKUP_KEY_PATH'])
+
+    def start_scheduler(path, backup_dir):
+        return BackupScheduler(
+            path,
+            backup_dir,
+            every_writes=app.config.get('BACKUP_EVERY_WRITES', 200),
+            every_minutes=app.config.get('BACKUP_EVERY_MINUTES', 60),
+            pages=app.config.get('BACKUP_PAGES_PER_STEP', 256),
+            throttle=app.config.get('BACKUP_STEP_SLEEP', 0.01),
+            keep=app.config.get('BACKUP_KEEP', 10),
+            key=key,
+            logger=app.logger,
+        ).start()
+
+    schedulers = {None: start_scheduler(db_path, app.config['BACKUP_FOLDER'])}
+    schedulers_lock = threading.Lock()
+
+    def _start_shard_scheduler(slug, engine):
+        # Kept across engine evictions, like the shard's write lock
+        with schedulers_lock:
+            if slug not in schedulers:
+                schedulers[slug] = start_scheduler(
+                    engine.url.database, Path(app.config['BACKUP_FOLDER']) / 'clinicians' / slug,
+                )
+
+    on_shard_engine(app, _start_shard_scheduler)
+
+    @event.listens_for(Session, 'after_flush')
+    def _mark_write(session, flush_context):
+        session.info['backup_pending_write'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _count_write(session):
+        if session.info.pop('backup_pending_write', False):
+            scheduler = schedulers.get(current_shard())
+            if scheduler is not None:
+                scheduler.notify_write()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_write(session):
+        session.info.pop('backup_pending_write', None)
+
+    app.extensions['backup_scheduler'] = schedulers[None]
+    app.extensions['backup_schedulers'] = schedulers
+    return schedulers[None]
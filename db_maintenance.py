@@ -0,0 +1,114 @@
+"""Health statistics and routine maintenance for the SQLite database.
+
+``database_stats`` reports row and page counts per table and index (through
+the ``dbstat`` virtual table when SQLite provides it), freelist fragmentation
+and WAL size. ``run_maintenance`` refreshes planner statistics, reclaims free
+pages and checkpoints the WAL, timing each step.
+"""
+
+import sqlite3
+import time
+from collections import namedtuple
+from pathlib import Path
+
+ObjectStats = namedtuple('ObjectStats', ['name', 'kind', 'table', 'rows', 'pages', 'bytes'])
+MaintenanceStep = namedtuple('MaintenanceStep', ['name', 'seconds', 'detail'])
+
+
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def wal_path(db_path):
+    return Path(f"{db_path}-wal")
+
+
+def database_stats(db_path):
+    """Collect per-object and file-level statistics for ``db_path``."""
+    conn = sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+    try:
+        page_size = _pragma(conn, "page_size")
+        page_count = _pragma(conn, "page_count")
+        freelist = _pragma(conn, "freelist_count")
+        objects = conn.execute(
+            "SELECT name, type, tbl_name FROM sqlite_master "
+            "WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY tbl_name, type DESC, name"
+        ).fetchall()
+
+        try:
+            pages = {
+                name: (count, size) for name, count, size in conn.execute(
+                    "SELECT name, COUNT(*), SUM(pgsize) FROM dbstat GROUP BY name"
+                )
+            }
+        except sqlite3.OperationalError:
+            pages = None  # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+
+        row_counts = {
+            table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            for name, kind, table in objects if kind == 'table'
+        }
+        object_stats = []
+        for name, kind, table in objects:
+            page_info = pages.get(name, (0, 0)) if pages is not None else (None, None)
+            object_stats.append(ObjectStats(name, kind, table, row_counts.get(table), *page_info))
+
+        journal_mode = _pragma(conn, "journal_mode")
+        auto_vacuum = _pragma(conn, "auto_vacuum")
+    finally:
+        conn.close()
+
+    wal = wal_path(db_path)
+    return {
+        'file_bytes': Path(db_path).stat().st_size,
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_count': freelist,
+        'fragmentation': freelist / page_count if page_count else 0.0,
+        'journal_mode': journal_mode,
+        'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, str(auto_vacuum)),
+        'wal_bytes': wal.stat().st_size if wal.exists() else 0,
+        'has_dbstat': pages is not None,
+        'objects': object_stats,
+    }
+
+
+def run_maintenance(db_path, full_vacuum=False, timeout=30.0):
+    """Run ANALYZE, PRAGMA optimize, vacuuming and a WAL checkpoint.
+
+    Without ``full_vacuum`` free pages are only reclaimed when the database
+    uses ``auto_vacuum=INCREMENTAL``. ``full_vacuum`` rebuilds the file and
+    switches it to incremental auto-vacuum so later runs stay cheap.
+    Returns a list of ``MaintenanceStep``.
+    """
+    steps = []
+    conn = sqlite3.connect(str(db_path), timeout=timeout, isolation_level=None)
+
+    def step(name, sql, detail=None):
+        started = time.perf_counter()
+        rows = conn.execute(sql).fetchall()
+        steps.append(MaintenanceStep(name, time.perf_counter() - started, detail(rows) if detail else ''))
+
+    try:
+        step("ANALYZE", "ANALYZE")
+        step("PRAGMA optimize", "PRAGMA optimize")
+
+        before = _pragma(conn, "freelist_count")
+        if full_vacuum:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            step("VACUUM", "VACUUM", lambda rows: f"{before} free pages reclaimed")
+        elif _pragma(conn, "auto_vacuum") == 2:
+            step(
+                "incremental_vacuum", "PRAGMA incremental_vacuum",
+                lambda rows: f"{before - _pragma(conn, 'freelist_count')} free pages reclaimed",
+            )
+
+        if _pragma(conn, "journal_mode") == "wal":
+            step(
+                "wal_checkpoint", "PRAGMA wal_checkpoint(TRUNCATE)",
+                lambda rows: f"busy={rows[0][0]} log={rows[0][1]} checkpointed={rows[0][2]}",
+            )
+    finally:
+        conn.close()
+    return steps
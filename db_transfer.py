@@ -0,0 +1,273 @@
+"""Portable NDJSON export and import of every table in ``models.py``.
+
+``export_database`` writes one newline-delimited JSON file per table (gzip
+optional) plus a ``manifest.json`` listing the tables in foreign-key order.
+Tables are exported in parallel, each streaming rows from the database in
+``yield_per`` batches, so memory stays bounded by the batch size. Given the
+``archive.db`` path, the archived rows are exported too, as
+``archive.<table>`` files listed under ``archive_tables``.
+
+With ``anonymize`` every text column is passed through ``NameAnonymizer``
+and the student name columns are replaced by the student id, so the export
+can be shared without identifying anyone.
+
+``import_database`` loads an export into a database whose tables are empty:
+rows are inserted with batched executemany statements inside one
+transaction, and the main database's foreign keys are checked before the
+commit. Archived rows go into the attached archive in the same transaction;
+their references may point at hot rows, so they are not checked.
+"""
+
+import gzip
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from datetime import time as time_of_day
+from pathlib import Path
+
+from sqlalchemy import MetaData, create_engine, event, func, select
+from sqlalchemy.types import Date, DateTime, String, Time
+
+from anonymize import NameAnonymizer
+from archive import ARCHIVE_SCHEMA, ensure_archive_schema, raise_high_water
+from models import Student, db
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+TableResult = namedtuple('TableResult', ['table', 'file', 'rows', 'seconds'])
+
+
+def _engine(db_path, archive_path=None):
+    engine = create_engine(f"sqlite:///{Path(db_path).as_posix()}")
+
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_conn, record):
+        # Let SQLAlchemy, not the driver, decide where transactions begin;
+        # ATTACH has to run outside of one
+        dbapi_conn.isolation_level = None
+        if archive_path:
+            dbapi_conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(archive_path),))
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def _archive_tables(conn):
+    """Model tables present in the attached archive, as ``archive.<table>`` tables."""
+    present = {
+        row[0] for row in conn.exec_driver_sql(
+            f"SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type = 'table'"
+        )
+    }
+    metadata = MetaData()
+    return [
+        table.to_metadata(metadata, schema=ARCHIVE_SCHEMA)
+        for table in db.metadata.sorted_tables if table.name in present
+    ]
+
+
+def _columns(table):
+    """Columns that hold data; generated columns are recomputed on import."""
+    return [column for column in table.columns if column.computed is None]
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime, time_of_day)):
+        return value.isoformat()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def _open(path, mode):
+    if path.suffix == '.gz':
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8')
+
+
+def _anonymized(table, anonymizer):
+    """Return a function rewriting one exported row dict in place."""
+    text_columns = [column.name for column in _columns(table) if isinstance(column.type, String)]
+    if table.name == Student.__tablename__:
+        def rewrite(row):
+            row['first_name'] = row['last_name'] = str(row['student_id'])
+            row['preferred_name'] = None
+        return rewrite
+
+    def rewrite(row):
+        for name in text_columns:
+            row[name] = anonymizer.scrub(row[name], row.get('student_id'))
+    return rewrite
+
+
+def export_table(engine, table, out_dir, compress=False, batch_size=1000, anonymizer=None):
+    """Stream ``table`` to ``<table>.ndjson[.gz]``; return a ``TableResult``."""
+    started = time.perf_counter()
+    path = Path(out_dir) / f"{table.fullname}.ndjson{'.gz' if compress else ''}"
+    columns = _columns(table)
+    names = [column.name for column in columns]
+    primary_key = list(table.primary_key.columns)
+    rewrite = _anonymized(table, anonymizer) if anonymizer else None
+    rows = 0
+    with engine.connect() as conn, _open(path, 'w') as out:
+        result = conn.execution_options(yield_per=batch_size).execute(
+            select(*columns).order_by(*primary_key)
+        )
+        for partition in result.partitions():
+            records = [dict(zip(names, row)) for row in partition]
+            if rewrite:
+                for record in records:
+                    rewrite(record)
+            out.write(''.join(
+                json.dumps(record, default=_json_default, ensure_ascii=False) + '\n'
+                for record in records
+            ))
+            rows += len(partition)
+    return TableResult(table.fullname, path.name, rows, time.perf_counter() - started)
+
+
+def export_database(db_path, out_dir, compress=False, workers=4, batch_size=1000, anonymize=False,
+                    archive_path=None):
+    """Export every model table of ``db_path``, and of ``archive_path`` if it exists, into ``out_dir``."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if archive_path and not Path(archive_path).exists():
+        archive_path = None
+    engine = _engine(db_path, archive_path)
+    tables = db.metadata.sorted_tables
+    try:
+        with engine.connect() as conn:
+            archived = _archive_tables(conn) if archive_path else []
+            anonymizer = None
+            if anonymize:
+                # Archived students' names must be scrubbed from archived notes too
+                student_tables = [Student.__table__, *(t for t in archived if t.name == Student.__tablename__)]
+                anonymizer = NameAnonymizer([
+                    row for table in student_tables
+                    for row in conn.execute(select(
+                        table.c.student_id, table.c.first_name, table.c.last_name, table.c.preferred_name,
+                    ))
+                ])
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                lambda table: export_table(engine, table, out_dir, compress, batch_size, anonymizer),
+                [*tables, *archived],
+            ))
+    finally:
+        engine.dispose()
+
+    entries = [{'name': r.table, 'file': r.file, 'rows': r.rows} for r in results]
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'compression': 'gzip' if compress else None,
+        'anonymized': anonymize,
+        'tables': entries[:len(tables)],
+        'archive_tables': entries[len(tables):],
+    }
+    (out_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return results
+
+
+def _converters(table):
+    """Per-column parsers turning exported ISO strings back into Python values."""
+    parsers = {Date: date.fromisoformat, DateTime: datetime.fromisoformat, Time: time_of_day.fromisoformat}
+    converters = {}
+    for column in _columns(table):
+        for sql_type, parse in parsers.items():
+            if isinstance(column.type, sql_type):
+                converters[column.name] = parse
+    return converters
+
+
+def _read_rows(path, converters):
+    with _open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            for name, parse in converters.items():
+                if row.get(name) is not None:
+                    row[name] = parse(row[name])
+            yield row
+
+
+def import_database(db_path, in_dir, batch_size=1000, archive_path=None):
+    """Load the export in ``in_dir`` into ``db_path``; return ``TableResult`` list.
+
+    Missing tables are created from the models. Raises ``ValueError`` when a
+    target table already holds rows, so an import never merges into or
+    duplicates existing data, and when the export holds archived rows but
+    no ``archive_path`` is given.
+    """
+    in_dir = Path(in_dir)
+    manifest = json.loads((in_dir / MANIFEST).read_text())
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"unsupported export format {manifest.get('format_version')}")
+    tables = {table.name: table for table in db.metadata.sorted_tables}
+    archive_entries = manifest.get('archive_tables', [])
+    unknown = [
+        entry['name'] for entry in manifest['tables'] if entry['name'] not in tables
+    ] + [
+        entry['name'] for entry in archive_entries
+        if entry['name'].removeprefix(f"{ARCHIVE_SCHEMA}.") not in tables
+    ]
+    if unknown:
+        raise ValueError(f"export contains tables this version does not know: {', '.join(unknown)}")
+    if archive_entries and not archive_path:
+        raise ValueError("export contains archived rows; an archive database path is needed")
+
+    engine = _engine(db_path, archive_path if archive_entries else None)
+    results = []
+    try:
+        db.metadata.create_all(engine)
+        with engine.connect() as conn:
+            if archive_entries:
+                ensure_archive_schema(conn.connection.driver_connection)
+                tables.update((table.fullname, table) for table in _archive_tables(conn))
+            conn.commit()
+            entries = manifest['tables'] + archive_entries
+
+            with conn.begin():
+                for entry in entries:
+                    if conn.execute(select(func.count()).select_from(tables[entry['name']])).scalar():
+                        raise ValueError(f"table {entry['name']} is not empty; import needs an empty database")
+
+                for entry in entries:
+                    started = time.perf_counter()
+                    table = tables[entry['name']]
+                    insert = table.insert()
+                    batch, rows = [], 0
+                    for row in _read_rows(in_dir / entry['file'], _converters(table)):
+                        batch.append(row)
+                        if len(batch) >= batch_size:
+                            conn.execute(insert, batch)
+                            rows += len(batch)
+                            batch = []
+                    if batch:
+                        conn.execute(insert, batch)
+                        rows += len(batch)
+                    if rows != entry['rows']:
+                        raise ValueError(f"{entry['file']}: expected {entry['rows']} rows, read {rows}")
+                    results.append(TableResult(table.fullname, entry['file'], rows, time.perf_counter() - started))
+
+                for entry in archive_entries:
+                    # Archived ids must not be handed out again by the hot table
+                    table = tables[entry['name']]
+                    raise_high_water(
+                        conn.connection.driver_connection, table.name, table.primary_key.columns.values()[0].name,
+                    )
+
+                violations = conn.exec_driver_sql("PRAGMA main.foreign_key_check").fetchall()
+                if violations:
+                    table, rowid, parent, _ = violations[0]
+                    raise ValueError(
+                        f"{len(violations)} rows reference missing rows, e.g. {table} row {rowid} -> {parent}"
+                    )
+    finally:
+        engine.dispose()
+    return results
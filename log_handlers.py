@@ -0,0 +1,94 @@
+"""Logging building blocks used by ``app.setup_logging``.
+
+Request threads only put records on an in-memory queue; a ``QueueListener``
+thread formats them, writes the log file, rotates it by size or time and
+gzips rolled files. Records carry the request id, route, status and latency
+so the optional JSON format can be parsed line by line.
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+from datetime import datetime, timezone
+from logging.handlers import (
+    QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler,
+)
+
+from flask import g, has_request_context, request
+
+REQUEST_FIELDS = ('request_id', 'method', 'route', 'status', 'latency_ms')
+
+
+def gzip_namer(name):
+    return f"{name}.gz"
+
+
+def gzip_rotator(source, dest):
+    """Compress the rolled-over log file into ``dest`` and remove the original."""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+    if hasattr(os, 'chmod'):
+        os.chmod(dest, 0o600)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach request id, method and route to records logged during a request.
+
+    Runs in the logging thread's caller, before the record is queued, because
+    the request context is not available on the listener thread.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(record, 'request_id', None) or g.get('request_id')
+            record.method = getattr(record, 'method', None) or request.method
+            rule = request.url_rule
+            record.route = getattr(record, 'route', None) or (rule.rule if rule else request.path)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in REQUEST_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+def build_file_handler(log_file, rotation='size', max_bytes=5 * 1024 * 1024,
+                       backup_count=10, when='midnight', compress=True):
+    """Return a size- or time-rotating file handler, gzipping rolled files."""
+    if rotation == 'time':
+        handler = TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count, delay=True)
+    else:
+        handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    if compress:
+        handler.namer = gzip_namer
+        handler.rotator = gzip_rotator
+    return handler
+
+
+def build_queue_logging(file_handler):
+    """Return ``(queue_handler, listener)`` feeding ``file_handler`` off-thread."""
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    return queue_handler, listener
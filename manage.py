@@ -6,29 +6,63 @@ Handles setup, backups, and maintenance tasks.
 
 import os
 import sys
-import shutil
 import sqlite3
 import subprocess
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from backup_crypto import ENCRYPTED_SUFFIX, configured_key, decrypt_file, encrypted_backup, load_or_create_key
+from archive import archive_closed_years, school_year_start
+from roster_import import import_roster
+from clinicians import clinician_dir, load_clinicians
+from db_transfer import export_database, import_database
+from anonymize import benchmark as anonymizer_benchmark
+from write_coordination import WriteLock, lock_path_for
+from write_coordination import benchmark as concurrency_benchmark
+from trial_snapshot import load_snapshot, refresh_snapshot
+from caseload_analytics import independence_by
+from objective_trends import OBJECTIVE_SQL, objective_details, stalled_objectives
+from backup_store import SnapshotStore
+from db_maintenance import database_stats, run_maintenance
+from query_profiler import STATS_FILENAME, load_query_stats
+from db_backup import (
+    backup_filename, list_backups, online_backup, prune_backups,
+    restore_online, table_row_counts, verify_database,
+)
 
 class StudentDBManager:
-    def __init__(self):
+    def __init__(self, clinician=None):
         self.app_dir = Path(__file__).parent.absolute()
         self.instance_dir = self.app_dir / "instance"
         self.backup_dir = self.app_dir / "backups"
         self.venv_dir = self.app_dir / "venv"
+        self.key_path = self.instance_dir / "backup.key"
+        self.clinicians_dir = self.instance_dir / "clinicians"
+        self.clinician = clinician
+        if clinician:
+            # A clinician's folder is laid out like instance/; its backups
+            # go under backups/clinicians/<id>/ and share the backup key
+            self.instance_dir = clinician_dir(self.clinicians_dir, clinician)
+            self.backup_dir = self.backup_dir / "clinicians" / clinician
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
         self.db_path = self.instance_dir / "student_database.db"
+        self.archive_path = self.instance_dir / "archive.db"
+        self.analytics_dir = self.instance_dir / "analytics"
+        self.snapshot_store = SnapshotStore(self.backup_dir / "store", key=configured_key(self.key_path))
         
     def setup(self):
         """Complete setup for macOS."""
         print("🏥 Setting up Student Database on macOS...")
         
         # Create directories
-        self.instance_dir.mkdir(exist_ok=True)
-        self.backup_dir.mkdir(exist_ok=True)
+        self.instance_dir.mkdir(parents=True, exist_ok=True)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
         
         # Set secure permissions
         os.chmod(self.instance_dir, 0o700)
@@ -77,44 +111,157 @@ DATABASE_URL=sqlite:///{self.db_path}
         
         return True
     
-    def backup(self):
-        """Create encrypted backup of the database."""
+    def backup(self, pages=-1, throttle=0.0, encrypt=None):
+        """Create a backup of the database, encrypted with AES-GCM if ``encrypt``.
+        
+        ``encrypt=None`` encrypts whenever a backup key is configured;
+        ``True`` creates the key if needed. With ``pages`` > 0 the copy is done online in batches of that many
+        pages, sleeping ``throttle`` seconds between batches so a running
+        app is not blocked for the whole copy.
+        """
         if not self.db_path.exists():
             print("❌ No database found to backup")
             return False
             
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"student_db_backup_{timestamp}.db"
+        if encrypt is None:
+            encrypt = configured_key(self.key_path) is not None
+        backup_name = backup_filename(encrypted=encrypt)
         backup_path = self.backup_dir / backup_name
         
         print(f"💾 Creating backup: {backup_name}")
         
         # Create backup using sqlite3 backup API (safer than file copy)
         try:
-            # Connect to source database
-            source = sqlite3.connect(str(self.db_path))
-            
-            # Create backup
-            with sqlite3.connect(str(backup_path)) as backup:
-                source.backup(backup)
-            
-            source.close()
-            
-            # Secure permissions
-            os.chmod(backup_path, 0o600)
+            if encrypt:
+                key = self._backup_key()
+                result = encrypted_backup(self.db_path, backup_path, key, pages=pages, throttle=throttle)
+            else:
+                result = online_backup(self.db_path, backup_path, pages=pages, throttle=throttle)
             
             # Keep only last 10 backups
             self._cleanup_old_backups()
             
             print(f"✅ Backup created: {backup_path}")
+            print(f"⏱️  {result.summary()}")
             return True
             
         except Exception as e:
             print(f"❌ Backup failed: {e}")
             return False
     
-    def restore(self, backup_file):
-        """Restore from backup."""
+    def _shard_managers(self):
+        """This manager plus one per clinician in clinicians.json."""
+        return [self] + [StudentDBManager(slug) for slug in sorted(load_clinicians(self.clinicians_dir))]
+    
+    def backup_all(self, pages=-1, throttle=0.0, encrypt=None):
+        """Back up the main database and every clinician database in parallel."""
+        managers = [manager for manager in self._shard_managers() if manager.db_path.exists()]
+        if not managers:
+            print("❌ No databases found to backup")
+            return False
+        
+        if encrypt:
+            # Create the shared key once, before the backups race to do it
+            self._backup_key()
+        print(f"💾 Backing up {len(managers)} databases in parallel...")
+        with ThreadPoolExecutor(max_workers=min(len(managers), os.cpu_count() or 4)) as pool:
+            results = list(pool.map(
+                lambda manager: manager.backup(pages=pages, throttle=throttle, encrypt=encrypt), managers,
+            ))
+        failed = [manager.clinician or 'main' for manager, ok in zip(managers, results) if not ok]
+        if failed:
+            print(f"❌ Backups failed for: {', '.join(failed)}")
+            return False
+        print(f"✅ {len(managers)} databases backed up")
+        return True
+    
+    def migrate(self):
+        """Run ``flask db upgrade`` on the main database and every clinician database in parallel."""
+        managers = self._shard_managers()
+        python_path = self.venv_dir / "bin" / "python"
+        python = str(python_path) if python_path.exists() else sys.executable
+        
+        def upgrade(manager):
+            manager.instance_dir.mkdir(parents=True, exist_ok=True)
+            env = os.environ.copy()
+            env['FLASK_APP'] = 'app.py'
+            env['DATABASE_URL'] = f"sqlite:///{manager.db_path}"
+            env['CLINICIAN_SHARDING'] = '0'
+            started = time.perf_counter()
+            process = subprocess.run(
+                [python, "-m", "flask", "db", "upgrade"],
+                env=env, cwd=self.app_dir, capture_output=True, text=True,
+            )
+            return process, time.perf_counter() - started
+        
+        print(f"🗄️  Upgrading {len(managers)} databases in parallel...")
+        ok = True
+        with ThreadPoolExecutor(max_workers=min(len(managers), os.cpu_count() or 4)) as pool:
+            for manager, (process, seconds) in zip(managers, pool.map(upgrade, managers)):
+                name = manager.clinician or 'main'
+                if process.returncode == 0:
+                    print(f"   ✅ {name}: upgraded in {seconds:.1f}s")
+                else:
+                    ok = False
+                    print(f"   ❌ {name}: {(process.stderr or process.stdout).strip().splitlines()[-1:]}")
+        return ok
+    
+    def snapshot(self, pages=-1, throttle=0.0):
+        """Store a deduplicated snapshot: only chunks not already stored are written."""
+        if not self.db_path.exists():
+            print("❌ No database found to snapshot")
+            return False
+        
+        try:
+            result = self.snapshot_store.create_snapshot(self.db_path, pages=pages, throttle=throttle)
+        except Exception as e:
+            print(f"❌ Snapshot failed: {e}")
+            return False
+        
+        print(f"✅ Snapshot created: {result.snapshot_id}")
+        print(f"🧩 {result.new_chunks}/{result.chunks} new chunks "
+              f"({result.new_bytes / 1024 / 1024:.2f} MB stored) in {result.seconds:.2f}s")
+        return True
+    
+    def list_snapshots(self):
+        """List stored snapshots, oldest first."""
+        snapshots = self.snapshot_store.list_snapshots()
+        print(f"🧩 Snapshots ({len(snapshots)}):")
+        for snap in snapshots:
+            print(f"   • {snap['id']} ({snap['size'] / 1024 / 1024:.1f}MB, "
+                  f"{snap['chunk_count']} chunks, {snap['created']})")
+    
+    def gc_snapshots(self, keep=None):
+        """Optionally drop old snapshots, then delete chunks no snapshot references."""
+        if keep:
+            for snapshot_id in self.snapshot_store.prune(keep):
+                print(f"🗑️  Removed old snapshot: {snapshot_id}")
+        removed, freed = self.snapshot_store.gc()
+        print(f"🧹 Removed {removed} unreferenced chunks ({freed / 1024 / 1024:.2f} MB)")
+    
+    def restore_snapshot(self, snapshot_id, quick=False):
+        """Restore the database from a stored snapshot."""
+        tmp_path = self.backup_dir / f".snapshot_{snapshot_id}.db"
+        try:
+            self.snapshot_store.restore_snapshot(snapshot_id, tmp_path)
+        except Exception as e:
+            print(f"❌ Could not rebuild snapshot {snapshot_id}: {e}")
+            return False
+        try:
+            return self.restore(tmp_path, quick=quick)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    
+    def restore(self, backup_file, quick=False):
+        """Restore from backup into the live database.
+        
+        The backup is integrity-checked and counted in a worker while the
+        current database is copied aside, then written back through the
+        SQLite backup API so a running app does not need to be stopped: its
+        writers wait on the write lock until the restored row counts are
+        checked, and its caches notice the change through ``PRAGMA
+        data_version`` on the next request.
+        """
         backup_path = Path(backup_file)
         if not backup_path.exists():
             backup_path = self.backup_dir / backup_file
@@ -123,22 +270,113 @@ DATABASE_URL=sqlite:///{self.db_path}
             print(f"❌ Backup file not found: {backup_file}")
             return False
             
+        if backup_path.name.endswith(ENCRYPTED_SUFFIX):
+            return self._restore_encrypted(backup_path, quick=quick)
+            
         print(f"🔄 Restoring from: {backup_path}")
         
-        # Create backup of current database first
-        if self.db_path.exists():
-            current_backup = self.db_path.with_suffix(f".db.pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-            shutil.copy2(self.db_path, current_backup)
-            print(f"💾 Current database backed up to: {current_backup}")
+        # Verify the backup while taking a copy of the current database
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            verify_future = pool.submit(verify_database, backup_path, quick)
+            current_backup = None
+            if self.db_path.exists():
+                current_backup = self.db_path.with_suffix(f".db.pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+                pool.submit(online_backup, self.db_path, current_backup).result()
+                print(f"💾 Current database backed up to: {current_backup}")
+            verification = verify_future.result()
+        
+        if not verification.ok:
+            print(f"❌ Backup failed {'quick_check' if quick else 'integrity_check'}; database left unchanged:")
+            for problem in verification.problems[:10]:
+                print(f"   • {problem}")
+            return False
+        total_rows = sum(verification.row_counts.values())
+        print(f"🔍 Backup verified: {len(verification.row_counts)} tables, "
+              f"{total_rows} rows in {verification.seconds:.2f}s")
         
+        # Hold the app's write lock so no app write lands between the swap
+        # and the count check
+        lock = WriteLock(lock_path_for(self.db_path))
+        if not lock.acquire():
+            print(f"❌ Could not get the write lock within {lock.timeout}s; database left unchanged")
+            return False
         try:
-            shutil.copy2(backup_path, self.db_path)
-            os.chmod(self.db_path, 0o600)
-            print("✅ Database restored successfully")
-            return True
+            result = restore_online(backup_path, self.db_path)
+            with closing(sqlite3.connect(str(self.db_path))) as conn:
+                restored_counts = table_row_counts(conn)
+        except Exception as e:
+            print(f"❌ Restore failed: {e}")
+            return False
+        finally:
+            lock.release()
+        
+        if restored_counts != verification.row_counts:
+            print("❌ Row counts after restore do not match the backup")
+            if current_backup:
+                print(f"   Previous database is available at: {current_backup}")
+            return False
+        
+        print("✅ Database restored successfully")
+        print(f"⏱️  {result.summary()}")
+        return True
+    
+    def _restore_encrypted(self, backup_path, quick=False):
+        """Decrypt an encrypted backup next to the database, then restore it."""
+        print(f"🔐 Decrypting: {backup_path}")
+        fd, tmp_name = tempfile.mkstemp(dir=self.instance_dir, prefix=".restore-", suffix=".db")
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        try:
+            key = self._backup_key()
+            size, seconds = decrypt_file(backup_path, tmp_path, key)
+            rate = size / 1024 / 1024 / seconds if seconds > 0 else 0.0
+            print(f"⏱️  Decrypted {size / 1024 / 1024:.1f} MB in {seconds:.2f}s ({rate:.1f} MB/s)")
+            return self.restore(tmp_path, quick=quick)
         except Exception as e:
             print(f"❌ Restore failed: {e}")
             return False
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    
+    def benchmark_backup(self):
+        """Measure encrypted backup and restore throughput on the current database."""
+        if not self.db_path.exists():
+            print("❌ No database found to benchmark")
+            return False
+        
+        key = self._backup_key()
+        with tempfile.TemporaryDirectory(dir=self.instance_dir) as tmp:
+            encrypted_path = Path(tmp) / backup_filename(encrypted=True)
+            result = encrypted_backup(self.db_path, encrypted_path, key)
+            print(f"🔐 Encrypted backup: {result.summary()}")
+            
+            size, seconds = decrypt_file(encrypted_path, Path(tmp) / "restored.db", key)
+            rate = size / 1024 / 1024 / seconds if seconds > 0 else 0.0
+            print(f"🔓 Decrypt for restore: {size / 1024 / 1024:.1f} MB in {seconds:.2f}s ({rate:.1f} MB/s)")
+        return True
+    
+    def benchmark_anonymizer(self):
+        """Time export name scrubbing against roster and text size."""
+        print("🕶️  Name anonymizer: time per KB of note text")
+        for result in anonymizer_benchmark():
+            per_kb = result.seconds * 1e6 / result.text_kb
+            print(f"   {result.students:>6} students, {result.text_kb:>5} KB text: "
+                  f"{result.seconds * 1000:7.1f} ms ({per_kb:.0f} µs/KB)")
+        return True
+    
+    def benchmark_concurrency(self, seconds=3.0):
+        """Run mixed read/write load from several processes, with and without the write lock."""
+        if not self.db_path.exists():
+            print("❌ No database found to benchmark")
+            return False
+        
+        print(f"🚦 Mixed load (10% writes) for {seconds:.0f}s per run on a copy of the database")
+        for result in concurrency_benchmark(self.db_path, seconds=seconds):
+            print(f"   {result.mode:>13}, {result.workers} worker(s): "
+                  f"{result.reads / result.seconds:8.0f} reads/s, {result.writes / result.seconds:6.0f} writes/s, "
+                  f"{result.lock_errors} lock errors, {result.lock_waits} lock waits, "
+                  f"{result.commit_retries} commit retries")
+        return True
     
     def status(self):
         """Show system status."""
@@ -153,30 +391,256 @@ DATABASE_URL=sqlite:///{self.db_path}
             stat = self.db_path.stat()
             print(f"📏 Database Size: {stat.st_size / 1024 / 1024:.1f} MB")
             print(f"🕒 Last Modified: {datetime.fromtimestamp(stat.st_mtime)}")
+            self._print_db_health()
             
         print(f"🔧 Virtual Environment: {'Yes' if self.venv_dir.exists() else 'No'}")
         
         # List recent backups
         if self.backup_dir.exists():
-            backups = sorted(self.backup_dir.glob("student_db_backup_*.db"), reverse=True)[:5]
+            backups = list_backups(self.backup_dir)[::-1][:5]
             print(f"💾 Recent Backups ({len(backups)}):")
             for backup in backups:
                 size = backup.stat().st_size / 1024 / 1024
                 date = datetime.fromtimestamp(backup.stat().st_mtime)
                 print(f"   • {backup.name} ({size:.1f}MB, {date.strftime('%Y-%m-%d %H:%M')})")
+            snapshots = self.snapshot_store.list_snapshots()
+            if snapshots:
+                print(f"🧩 Snapshots: {len(snapshots)} (latest {snapshots[-1]['id']})")
+    
+    def maintain(self, full_vacuum=False):
+        """Refresh planner statistics, reclaim free pages and checkpoint the WAL."""
+        if not self.db_path.exists():
+            print("❌ No database found to maintain")
+            return False
+        
+        print("🛠️  Running database maintenance...")
+        before = self.db_path.stat().st_size
+        # VACUUM and ANALYZE write; queue with a running app's writers
+        # rather than holding SQLite's lock past their busy timeout
+        lock = WriteLock(lock_path_for(self.db_path))
+        if not lock.acquire():
+            print(f"❌ Could not get the write lock within {lock.timeout}s; nothing was changed")
+            return False
+        try:
+            steps = run_maintenance(self.db_path, full_vacuum=full_vacuum)
+        except sqlite3.Error as e:
+            print(f"❌ Maintenance failed: {e}")
+            return False
+        finally:
+            lock.release()
+        for step in steps:
+            detail = f" ({step.detail})" if step.detail else ""
+            print(f"   • {step.name}: {step.seconds:.3f}s{detail}")
+        
+        after = self.db_path.stat().st_size
+        print(f"📏 Database Size: {before / 1024 / 1024:.1f} MB → {after / 1024 / 1024:.1f} MB")
+        self._print_db_health()
+        print("✅ Maintenance complete")
+        return True
+    
+    def analytics(self, full=False):
+        """Refresh the trial log analytics snapshot and print independence by grade."""
+        if not self.db_path.exists():
+            print("❌ No database found")
+            return False
+        
+        print(f"📊 {'Rebuilding' if full else 'Refreshing'} analytics snapshot...")
+        try:
+            result = refresh_snapshot(self.db_path, self.analytics_dir, full=full)
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ Snapshot failed: {e}")
+            return False
+        print(f"   • v{result.version}: {result.rows} trial logs, {result.added} new "
+              f"({result.mode}, {result.seconds:.2f}s)")
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            grades = dict(conn.execute("SELECT student_id, grade FROM student"))
+        finally:
+            conn.close()
+        started = datetime.now()
+        stats = independence_by(load_snapshot(self.analytics_dir), mapping=grades)
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"🎯 Independence by grade ({seconds * 1000:.1f} ms):")
+        for stat in stats:
+            print(f"   {stat.key}: {stat.percent_independent}% of {stat.trials} trials ({stat.logs} logs)")
+        return True
+    
+    def stalled(self, last_n=8):
+        """List active objectives whose accuracy plateaued or declined."""
+        if not self.db_path.exists():
+            print("❌ No database found")
+            return False
+        
+        print(f"🔎 Scanning objectives over their last {last_n} sessions...")
+        started = datetime.now()
+        try:
+            refresh_snapshot(self.db_path, self.analytics_dir)
+            conn = sqlite3.connect(self.db_path)
+            try:
+                objectives = objective_details(conn.execute(OBJECTIVE_SQL))
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ Scan failed: {e}")
+            return False
+        stalled = stalled_objectives(load_snapshot(self.analytics_dir), objectives, last_n=last_n)
+        
+        symbols = {'declining': '📉', 'plateaued': '➖'}
+        for row in stalled:
+            print(f"   {symbols[row.status]} {row.student_name}: {row.objective}")
+            print(f"      {row.sessions} sessions, {row.slope:+.1f} pts/session, "
+                  f"recent {row.ewma}% vs target {row.target:g}% (last {row.last_session})")
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"✅ {len(stalled)} of {len(objectives)} active objectives stalled ({seconds:.2f}s)")
+        return True
+    
+    def archive(self, before=None, dry_run=False):
+        """Move closed school years (and idle inactive students) into archive.db."""
+        if not self.db_path.exists():
+            print("❌ No database found to archive")
+            return False
+        
+        cutoff = datetime.strptime(before, "%Y-%m-%d").date() if before else school_year_start()
+        action = "Would move" if dry_run else "Moved"
+        print(f"🗄️  Archiving records dated before {cutoff} into {self.archive_path}")
+        started = datetime.now()
+        # Queue with a running app's writers, as import_roster does
+        lock = WriteLock(lock_path_for(self.db_path))
+        if not dry_run and not lock.acquire():
+            print(f"❌ Could not get the write lock within {lock.timeout}s; nothing was archived")
+            return False
+        try:
+            counts = archive_closed_years(self.db_path, self.archive_path, before=cutoff, dry_run=dry_run)
+        except sqlite3.Error as e:
+            print(f"❌ Archiving failed: {e}")
+            return False
+        finally:
+            lock.release()
+        for table, count in counts.items():
+            print(f"   • {table}: {action.lower()} {count} rows")
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"✅ {action} {sum(counts.values())} rows in {seconds:.2f}s")
+        if hasattr(os, 'chmod') and self.archive_path.exists():
+            os.chmod(self.archive_path, 0o600)
+        return True
+    
+    def import_roster(self, roster_file, dry_run=False):
+        """Upsert students, goals and objectives from a CSV or JSON roster file."""
+        if not self.db_path.exists():
+            print("❌ No database found; run setup first")
+            return False
+        
+        print(f"📋 {'Checking' if dry_run else 'Importing'} roster from {roster_file}...")
+        started = datetime.now()
+        # Queue with a running app's writers rather than holding SQLite's
+        # lock past their busy timeout; the app's caches pick the new roster
+        # up through PRAGMA data_version
+        lock = WriteLock(lock_path_for(self.db_path))
+        if not dry_run and not lock.acquire():
+            print(f"❌ Could not get the write lock within {lock.timeout}s; nothing was imported")
+            return False
+        try:
+            plan = import_roster(self.db_path, roster_file, dry_run=dry_run)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"❌ Roster import failed: {e}")
+            return False
+        finally:
+            lock.release()
+        
+        symbols = {'add': '➕', 'update': '✏️ '}
+        for change in plan.changes:
+            detail = f": {change.detail}" if change.detail else ""
+            print(f"   {symbols[change.action]} {change.kind} {change.label}{detail}")
+        print("   " + ", ".join(f"{count} {label}" for label, count in plan.counts().items()))
+        seconds = (datetime.now() - started).total_seconds()
+        if dry_run:
+            print(f"🔍 Dry run: nothing was written ({seconds:.2f}s)")
+        else:
+            print(f"✅ Roster imported in {seconds:.2f}s")
+        return True
+    
+    def export_data(self, out_dir=None, compress=False, anonymize=False):
+        """Export every table as NDJSON into ``out_dir`` (one file per table)."""
+        if not self.db_path.exists():
+            print("❌ No database found to export")
+            return False
+        
+        out_dir = Path(out_dir) if out_dir else self.backup_dir / f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        print(f"📤 Exporting {'anonymized ' if anonymize else ''}database to {out_dir}...")
+        started = datetime.now()
+        try:
+            results = export_database(
+                self.db_path, out_dir, compress=compress, anonymize=anonymize, archive_path=self.archive_path,
+            )
+        except Exception as e:
+            print(f"❌ Export failed: {e}")
+            return False
+        
+        for result in results:
+            print(f"   📄 {result.file}: {result.rows} rows ({result.seconds:.2f}s)")
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"✅ Exported {sum(r.rows for r in results)} rows in {seconds:.2f}s")
+        return True
+    
+    def import_data(self, in_dir):
+        """Load an NDJSON export into the (empty) database."""
+        print(f"📥 Importing {in_dir} into {self.db_path}...")
+        started = datetime.now()
+        try:
+            results = import_database(self.db_path, in_dir, archive_path=self.archive_path)
+        except Exception as e:
+            print(f"❌ Import failed, no rows were written: {e}")
+            return False
+        
+        for result in results:
+            print(f"   📄 {result.file}: {result.rows} rows ({result.seconds:.2f}s)")
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"✅ Imported {sum(r.rows for r in results)} rows in {seconds:.2f}s")
+        return True
+    
+    def _print_db_health(self):
+        """Print per-table/index statistics, fragmentation, WAL size and top queries."""
+        stats = database_stats(self.db_path)
+        print(f"🧱 Pages: {stats['page_count']} x {stats['page_size']} B, "
+              f"{stats['freelist_count']} free ({stats['fragmentation']:.1%} fragmentation)")
+        print(f"📓 Journal: {stats['journal_mode']}, auto_vacuum: {stats['auto_vacuum']}, "
+              f"WAL size: {stats['wal_bytes'] / 1024 / 1024:.1f} MB")
+        if stats['fragmentation'] > 0.2:
+            print("   ⚠️  Over 20% of pages are free; run 'maintain --vacuum' to shrink the file")
+        
+        print("📋 Tables and indexes:")
+        for obj in stats['objects']:
+            rows = f"{obj.rows} rows, " if obj.kind == 'table' else ""
+            pages = f"{obj.pages} pages ({obj.bytes / 1024:.0f} KB)" if stats['has_dbstat'] else "pages n/a"
+            indent = "   • " if obj.kind == 'table' else "       ↳ "
+            print(f"{indent}{obj.name}: {rows}{pages}")
+        
+        top_queries = load_query_stats(self.instance_dir / STATS_FILENAME, limit=5)
+        if top_queries:
+            print("🐢 Top queries by total time:")
+            for q in top_queries:
+                sql = q['sql'] if len(q['sql']) <= 90 else q['sql'][:87] + '...'
+                print(f"   • {q['total_seconds'] * 1000:.1f} ms total, {q['count']} calls, "
+                      f"max {q['max_seconds'] * 1000:.1f} ms: {sql}")
     
     def _generate_secret_key(self):
         """Generate a secure secret key."""
         import secrets
         return secrets.token_hex(32)
     
+    def _backup_key(self):
+        """Load the backup encryption key, creating one on first use."""
+        key, created = load_or_create_key(self.key_path)
+        if created:
+            print(f"🔑 Created backup encryption key: {self.key_path}")
+            print("   Keep a copy somewhere safe - encrypted backups cannot be restored without it.")
+        return key
+    
     def _cleanup_old_backups(self, keep=10):
         """Keep only the most recent backups."""
-        backups = sorted(self.backup_dir.glob("student_db_backup_*.db"))
-        if len(backups) > keep:
-            for backup in backups[:-keep]:
-                backup.unlink()
-                print(f"🗑️  Removed old backup: {backup.name}")
+        for backup in prune_backups(self.backup_dir, keep):
+            print(f"🗑️  Removed old backup: {backup.name}")
     
     def _create_launch_script(self):
         """Create macOS launch script."""
@@ -207,22 +671,95 @@ export FLASK_APP=app.py
 
 def main():
     parser = argparse.ArgumentParser(description="Student Database Manager for macOS")
-    parser.add_argument('command', choices=['setup', 'backup', 'restore', 'status'], 
+    parser.add_argument('command', choices=['setup', 'backup', 'restore', 'status',
+                                            'snapshot', 'snapshots', 'gc', 'benchmark',
+                                            'maintain', 'archive', 'roster', 'export', 'import', 'analytics', 'stalled',
+                                            'migrate'], 
                        help='Command to execute')
-    parser.add_argument('--file', help='Backup file for restore command')
+    parser.add_argument('--file', help='Backup file for restore, CSV/JSON file for roster, or directory for export/import')
+    parser.add_argument('--snapshot', help='Snapshot id for restore command')
+    parser.add_argument('--keep', type=int, help='Snapshots to keep when running gc')
+    parser.add_argument('--pages', type=int, default=-1,
+                       help='Pages copied per backup step (-1 copies everything in one step)')
+    parser.add_argument('--throttle', type=float, default=0.0,
+                       help='Seconds to sleep between backup steps')
+    parser.add_argument('--quick', action='store_true',
+                       help='Verify backups with quick_check instead of integrity_check on restore')
+    parser.add_argument('--before', help='Archive records dated before YYYY-MM-DD (default: start of school year)')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Report what archive or roster would change without writing')
+    parser.add_argument('--vacuum', action='store_true',
+                       help='Run a full VACUUM during maintain and enable incremental auto-vacuum')
+    parser.add_argument('--encrypt', action=argparse.BooleanOptionalAction,
+                       help='Encrypt the backup (key from BACKUP_ENCRYPTION_KEY or instance/backup.key, '
+                            'created if missing); the default once a key exists')
+    parser.add_argument('--compress', action='store_true',
+                       help='Gzip the NDJSON files written by export')
+    parser.add_argument('--sessions', type=int, default=8,
+                       help='Recent sessions per objective used by stalled')
+    parser.add_argument('--full', action='store_true',
+                       help='Rebuild the analytics snapshot from scratch')
+    parser.add_argument('--anonymize', action='store_true',
+                       help='Replace student names with ids in export, or benchmark the name anonymizer')
+    parser.add_argument('--concurrency', action='store_true',
+                       help='Benchmark concurrent readers and writers with and without the write lock')
+    parser.add_argument('--clinician', help='Run the command on this clinician\'s database instead of the main one')
+    parser.add_argument('--all-clinicians', action='store_true',
+                       help='Back up the main database and every clinician database in parallel')
     
     args = parser.parse_args()
-    manager = StudentDBManager()
+    manager = StudentDBManager(clinician=args.clinician)
     
     if args.command == 'setup':
         manager.setup()
     elif args.command == 'backup':
-        manager.backup()
+        if args.all_clinicians:
+            manager.backup_all(pages=args.pages, throttle=args.throttle, encrypt=args.encrypt)
+        else:
+            manager.backup(pages=args.pages, throttle=args.throttle, encrypt=args.encrypt)
     elif args.command == 'restore':
+        if args.snapshot:
+            manager.restore_snapshot(args.snapshot, quick=args.quick)
+        elif args.file:
+            manager.restore(args.file, quick=args.quick)
+        else:
+            print("❌ Please specify backup file with --file or snapshot with --snapshot")
+            sys.exit(1)
+    elif args.command == 'snapshot':
+        manager.snapshot(pages=args.pages, throttle=args.throttle)
+    elif args.command == 'snapshots':
+        manager.list_snapshots()
+    elif args.command == 'gc':
+        manager.gc_snapshots(keep=args.keep)
+    elif args.command == 'benchmark':
+        if args.anonymize:
+            manager.benchmark_anonymizer()
+        elif args.concurrency:
+            manager.benchmark_concurrency()
+        else:
+            manager.benchmark_backup()
+    elif args.command == 'maintain':
+        manager.maintain(full_vacuum=args.vacuum)
+    elif args.command == 'archive':
+        manager.archive(before=args.before, dry_run=args.dry_run)
+    elif args.command == 'roster':
+        if not args.file:
+            print("❌ Please specify the roster file with --file")
+            sys.exit(1)
+        manager.import_roster(args.file, dry_run=args.dry_run)
+    elif args.command == 'export':
+        manager.export_data(args.file, compress=args.compress, anonymize=args.anonymize)
+    elif args.command == 'import':
         if not args.file:
-            print("❌ Please specify backup file with --file")
+            print("❌ Please specify the export directory with --file")
             sys.exit(1)
-        manager.restore(args.file)
+        manager.import_data(args.file)
+    elif args.command == 'analytics':
+        manager.analytics(full=args.full)
+    elif args.command == 'stalled':
+        manager.stalled(last_n=max(args.sessions, 2))
+    elif args.command == 'migrate':
+        manager.migrate()
     elif args.command == 'status':
         manager.status()
 
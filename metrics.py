@@ -0,0 +1,254 @@
+"""In-process request metrics exposed at ``/metrics``.
+
+Every request records its endpoint, status, latency, time spent in SQL and
+response size into fixed-bucket histograms; ``/metrics`` renders them in the
+Prometheus text exposition format together with p50/p95/p99 estimates and
+gauges for the database and WAL file sizes. Recording is a few additions
+under one lock, so it stays cheap enough to leave on.
+
+The histograms live in the worker process: with several gunicorn workers
+each scrape reports only the worker that answered it.
+"""
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+from db_maintenance import wal_path
+from shards import on_shard_engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+QUANTILES = (0.5, 0.95, 0.99)
+LOCAL_ADDRESSES = {'127.0.0.1', '::1', 'localhost'}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with bucket-interpolated quantiles."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower  # beyond the last bucket; report its bound
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else _number(bound)
+            yield f'{name}_bucket{_labels(labels, le=le)} {cumulative}'
+        yield f'{name}_sum{_labels(labels)} {_number(self.sum)}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    merged = {**labels, **extra}
+    if not merged:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in merged.items()) + '}'
+
+
+class Metrics:
+    """Thread-safe per-endpoint request statistics."""
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else None
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)  # (endpoint, method, status) -> count
+        self.latency = {}
+        self.sizes = {}
+        self.db_seconds = defaultdict(float)
+        self.db_queries = defaultdict(int)
+
+    def observe(self, endpoint, method, status, seconds, db_seconds, db_queries, size):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            latency = self.latency.get(endpoint)
+            if latency is None:
+                latency = self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.sizes[endpoint] = Histogram(SIZE_BUCKETS)
+            latency.observe(seconds)
+            if size is not None:
+                self.sizes[endpoint].observe(size)
+            self.db_seconds[endpoint] += db_seconds
+            self.db_queries[endpoint] += db_queries
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            requests = dict(self.requests)
+            latency = {k: _copy(h) for k, h in self.latency.items()}
+            sizes = {k: _copy(h) for k, h in self.sizes.items()}
+            db_seconds = dict(self.db_seconds)
+            db_queries = dict(self.db_queries)
+
+        out = [
+            '# HELP http_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            out.append(f'http_requests_total{_labels({"endpoint": endpoint, "method": method, "status": status})} {count}')
+
+        out += [
+            '# HELP http_request_duration_seconds Request latency.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for endpoint, hist in sorted(latency.items()):
+            out.extend(hist.lines('http_request_duration_seconds', {'endpoint': endpoint}))
+
+        out += [
+            '# HELP http_request_duration_quantile_seconds Latency quantiles estimated from the histogram.',
+            '# TYPE http_request_duration_quantile_seconds gauge',
+        ]
+        for endpoint, hist in sorted(latency.items()):
+            for q in QUANTILES:
+                labels = _labels({'endpoint': endpoint, 'quantile': q})
+                out.append(f'http_request_duration_quantile_seconds{labels} {_number(hist.quantile(q))}')
+
+        out += [
+            '# HELP http_request_db_seconds_total Time spent executing SQL.',
+            '# TYPE http_request_db_seconds_total counter',
+        ]
+        for endpoint, seconds in sorted(db_seconds.items()):
+            out.append(f'http_request_db_seconds_total{_labels({"endpoint": endpoint})} {_number(seconds)}')
+
+        out += [
+            '# HELP http_request_db_queries_total SQL statements executed.',
+            '# TYPE http_request_db_queries_total counter',
+        ]
+        for endpoint, count in sorted(db_queries.items()):
+            out.append(f'http_request_db_queries_total{_labels({"endpoint": endpoint})} {count}')
+
+        out += [
+            '# HELP http_request_db_time_ratio Share of request time spent in SQL.',
+            '# TYPE http_request_db_time_ratio gauge',
+        ]
+        for endpoint, hist in sorted(latency.items()):
+            ratio = db_seconds.get(endpoint, 0.0) / hist.sum if hist.sum else 0.0
+            out.append(f'http_request_db_time_ratio{_labels({"endpoint": endpoint})} {_number(ratio)}')
+
+        out += [
+            '# HELP http_response_size_bytes Response body size.',
+            '# TYPE http_response_size_bytes histogram',
+        ]
+        for endpoint, hist in sorted(sizes.items()):
+            out.extend(hist.lines('http_response_size_bytes', {'endpoint': endpoint}))
+
+        if self.db_path is not None:
+            wal = wal_path(self.db_path)
+            out += [
+                '# HELP sqlite_database_bytes Size of the database file.',
+                '# TYPE sqlite_database_bytes gauge',
+                f'sqlite_database_bytes {self.db_path.stat().st_size if self.db_path.exists() else 0}',
+                '# HELP sqlite_wal_bytes Size of the write-ahead log.',
+                '# TYPE sqlite_wal_bytes gauge',
+                f'sqlite_wal_bytes {wal.stat().st_size if wal.exists() else 0}',
+            ]
+
+        out += [
+            '# HELP process_uptime_seconds Seconds since the app started.',
+            '# TYPE process_uptime_seconds gauge',
+            f'process_uptime_seconds {_number(time.time() - self.started)}',
+        ]
+        return '\n'.join(out) + '\n'
+
+
+def _copy(hist):
+    clone = Histogram(hist.buckets)
+    clone.counts = list(hist.counts)
+    clone.count = hist.count
+    clone.sum = hist.sum
+    return clone
+
+
+def _time_queries(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        if has_request_context():
+            g.metrics_db_seconds = g.get('metrics_db_seconds', 0.0) + elapsed
+            g.metrics_db_queries = g.get('metrics_db_queries', 0) + 1
+
+
+def init_metrics(app, db):
+    """Record request metrics and serve them at ``/metrics`` if enabled."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+
+    with app.app_context():
+        engine = db.engine
+    db_path = engine.url.database if engine.url.get_backend_name() == 'sqlite' else None
+    metrics = Metrics(db_path if db_path and db_path != ':memory:' else None)
+
+    _time_queries(engine)
+    on_shard_engine(app, lambda slug, engine: _time_queries(engine))
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        started = g.get('metrics_start')
+        if started is not None:
+            rule = request.url_rule
+            metrics.observe(
+                rule.endpoint if rule else 'unmatched',
+                request.method,
+                response.status_code,
+                time.perf_counter() - started,
+                g.get('metrics_db_seconds', 0.0),
+                g.get('metrics_db_queries', 0),
+                response.calculate_content_length(),
+            )
+        return response
+
+    def metrics_view():
+        if not app.config.get('METRICS_ALLOW_REMOTE') and request.remote_addr not in LOCAL_ADDRESSES:
+            abort(404)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.extensions['metrics'] = metrics
+    return metrics
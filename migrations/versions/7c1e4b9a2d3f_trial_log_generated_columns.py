@@ -0,0 +1,82 @@
+"""trial_log generated accuracy columns
+
+Revision ID: 7c1e4b9a2d3f
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4b9a2d3f'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+LEGACY = (
+    'correct_no_support', 'correct_visual_cue', 'correct_verbal_cue',
+    'correct_visual_verbal_cue', 'correct_modeling', 'incorrect',
+)
+NEW = ('independent', 'minimal_support', 'moderate_support', 'maximal_support', 'incorrect_new')
+
+
+def _sum(*columns):
+    return ' + '.join(f'coalesce({column}, 0)' for column in columns)
+
+
+def _percent(part, total):
+    return f'CASE WHEN {_sum(*total)} > 0 THEN round(({_sum(*part)}) * 100.0 / ({_sum(*total)}), 1) ELSE 0 END'
+
+
+# SQLite can only ADD generated columns as VIRTUAL; the indexes below store
+# the computed values, so range scans and ORDER BY on them use the index.
+COLUMNS = (
+    ('scheme', 'VARCHAR(6)',
+     f"CASE WHEN {_sum(*NEW)} > 0 AND {_sum(*LEGACY)} > 0 THEN 'both' "
+     f"WHEN {_sum(*NEW)} > 0 THEN 'new' "
+     f"WHEN {_sum(*LEGACY)} > 0 THEN 'legacy' END"),
+    ('new_total', 'INTEGER', _sum(*NEW)),
+    ('legacy_total', 'INTEGER', _sum(*LEGACY)),
+    ('pct_independent', 'FLOAT', _percent(NEW[:1], NEW)),
+    ('pct_up_to_minimal', 'FLOAT', _percent(NEW[:2], NEW)),
+    ('pct_up_to_moderate', 'FLOAT', _percent(NEW[:3], NEW)),
+    ('pct_correct_new', 'FLOAT', _percent(NEW[:4], NEW)),
+    ('pct_no_support', 'FLOAT', _percent(LEGACY[:1], LEGACY)),
+    ('pct_correct_legacy', 'FLOAT', _percent(LEGACY[:5], LEGACY)),
+)
+
+INDEXES = (
+    ('ix_trial_log_scheme_date', ('scheme', 'date_of_session')),
+    ('ix_trial_log_pct_independent', ('pct_independent', 'date_of_session')),
+    ('ix_trial_log_pct_correct_new', ('pct_correct_new', 'date_of_session')),
+    ('ix_trial_log_pct_correct_legacy', ('pct_correct_legacy', 'date_of_session')),
+)
+
+
+def _existing_columns():
+    conn = op.get_bind()
+    return {row[1] for row in conn.exec_driver_sql('PRAGMA table_xinfo("trial_log")')}
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the columns
+    existing = _existing_columns()
+    for name, col_type, expression in COLUMNS:
+        if name not in existing:
+            op.execute(
+                f'ALTER TABLE trial_log ADD COLUMN "{name}" {col_type} '
+                f'GENERATED ALWAYS AS ({expression}) VIRTUAL'
+            )
+    for name, columns in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON trial_log ({", ".join(columns)})')
+
+
+def downgrade():
+    for name, columns in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS "{name}"')
+    existing = _existing_columns()
+    for name, col_type, expression in reversed(COLUMNS):
+        if name in existing:
+            op.execute(f'ALTER TABLE trial_log DROP COLUMN "{name}"')
@@ -0,0 +1,28 @@
+"""trial_log (student_id, date_of_session) index
+
+Revision ID: a4d2f6b8c1e3
+Revises: 7c1e4b9a2d3f
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d2f6b8c1e3'
+down_revision = '7c1e4b9a2d3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Per-student history is read newest first in keyset-paginated chunks
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_trial_log_student_date" '
+        'ON trial_log (student_id, date_of_session)'
+    )
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS "ix_trial_log_student_date"')
@@ -0,0 +1,80 @@
+"""AUTOINCREMENT primary keys on tables moved to archive.db
+
+Revision ID: d8e2a6c4b7f1
+Revises: a4d2f6b8c1e3
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e2a6c4b7f1'
+down_revision = 'a4d2f6b8c1e3'
+branch_labels = None
+depends_on = None
+
+# Rows of these tables can live in archive.db; AUTOINCREMENT keeps SQLite
+# from handing an archived id out again once the newest hot row is deleted
+TABLES = (
+    ('student', 'student_id'),
+    ('goal', 'goal_id'),
+    ('objective', 'objective_id'),
+    ('trial_log', 'trial_log_id'),
+    ('events', 'event_id'),
+    ('monthly_quota', 'id'),
+    ('soap_notes', 'soap_note_id'),
+    ('quarterly_reports', 'id'),
+)
+
+
+def _with_autoincrement(sql, pk):
+    sql, columns = re.subn(rf'(\n\s*"?{pk}"? INTEGER NOT NULL)', r'\1 PRIMARY KEY AUTOINCREMENT', sql, count=1)
+    sql, keys = re.subn(rf',\s*PRIMARY KEY \("?{pk}"?\)', '', sql, count=1)
+    return sql if columns and keys else None
+
+
+def _without_autoincrement(sql, pk):
+    sql, columns = re.subn(rf'(\n\s*"?{pk}"? INTEGER NOT NULL) PRIMARY KEY AUTOINCREMENT', r'\1', sql, count=1)
+    sql = re.sub(r'\n\)\s*$', f', \n\tPRIMARY KEY ({pk})\n)', sql)
+    return sql if columns else None
+
+
+def _rebuild(table, pk, transform):
+    # SQLite cannot change a primary key in place: copy into a table
+    # created from the edited DDL, then swap it in and recreate the indexes
+    conn = op.get_bind()
+    sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).scalar()
+    if sql is None:
+        return
+    new_sql = transform(sql, pk)
+    if new_sql is None:
+        return
+    indexes = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    ).scalars().all()
+    columns = ', '.join(
+        f'"{row[1]}"' for row in conn.exec_driver_sql(f'PRAGMA table_xinfo("{table}")') if row[6] == 0
+    )
+    tmp = f'_rebuild_{table}'
+    op.execute(re.sub(rf'^CREATE TABLE "?{table}"?', f'CREATE TABLE "{tmp}"', new_sql, count=1))
+    op.execute(f'INSERT INTO "{tmp}" ({columns}) SELECT {columns} FROM "{table}"')
+    op.execute(f'DROP TABLE "{table}"')
+    op.execute(f'ALTER TABLE "{tmp}" RENAME TO "{table}"')
+    for index_sql in indexes:
+        op.execute(index_sql)
+
+
+def upgrade():
+    for table, pk in TABLES:
+        _rebuild(table, pk, _with_autoincrement)
+
+
+def downgrade():
+    for table, pk in TABLES:
+        _rebuild(table, pk, _without_autoincrement)
@@ -0,0 +1,45 @@
+"""trial_log change counter for the analytics snapshot
+
+Revision ID: e5a1c7d3b9f2
+Revises: d8e2a6c4b7f1
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c7d3b9f2'
+down_revision = 'd8e2a6c4b7f1'
+branch_labels = None
+depends_on = None
+
+BUMP = "UPDATE trial_log_changes SET changes = changes + 1 WHERE id = 1;"
+
+# Edits, deletes and out-of-order inserts tell trial_snapshot to rebuild
+# instead of appending
+TRIGGERS = (
+    ('trial_log_changes_update', "AFTER UPDATE ON trial_log"),
+    ('trial_log_changes_delete', "AFTER DELETE ON trial_log"),
+    ('trial_log_changes_insert',
+     "AFTER INSERT ON trial_log WHEN NEW.trial_log_id < (SELECT max(trial_log_id) FROM trial_log)"),
+)
+
+
+def upgrade():
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS trial_log_changes ("
+        "id INTEGER PRIMARY KEY CHECK (id = 1), token TEXT NOT NULL, changes INTEGER NOT NULL)"
+    )
+    op.execute(
+        "INSERT OR IGNORE INTO trial_log_changes (id, token, changes) VALUES (1, lower(hex(randomblob(8))), 0)"
+    )
+    for name, when in TRIGGERS:
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {BUMP} END")
+
+
+def downgrade():
+    for name, _ in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS trial_log_changes")
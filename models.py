@@ -1,12 +1,20 @@
+import math
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from shards import ShardSession
+
+db = SQLAlchemy(session_options={'class_': ShardSession})
+
+# Tables whose rows `manage.py archive` can move to archive.db. AUTOINCREMENT
+# stops SQLite from reusing an archived id after the newest hot row is deleted
+ARCHIVED_TABLE_ARGS = {'sqlite_autoincrement': True}
 
 
 class Student(db.Model):
     """Represents a student with personal info and related records."""
     __tablename__ = 'student'
+    __table_args__ = ARCHIVED_TABLE_ARGS
     student_id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(255), nullable=False)
     last_name = db.Column(db.String(255), nullable=False)
@@ -24,6 +32,7 @@ class Student(db.Model):
 class Goal(db.Model):
     """Represents a goal set for a student, containing objectives."""
     __tablename__ = 'goal'
+    __table_args__ = ARCHIVED_TABLE_ARGS
     goal_id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=False)
     goal_description = db.Column(db.String(255), nullable=False)
@@ -35,6 +44,7 @@ class Goal(db.Model):
 class Objective(db.Model):
     """Represents an objective under a goal with related sessions and trial logs."""
     __tablename__ = 'objective'
+    __table_args__ = ARCHIVED_TABLE_ARGS
     objective_id = db.Column(db.Integer, primary_key=True)
     goal_id = db.Column(db.Integer, db.ForeignKey('goal.goal_id'), nullable=False)
     objective_description = db.Column(db.String(255), nullable=False)
@@ -45,6 +55,35 @@ class Objective(db.Model):
     goal = db.relationship('Goal', back_populates='objectives')
     trial_logs = db.relationship('TrialLog', back_populates='objective', cascade='all, delete-orphan')  # NEW RELATIONSHIP
 
+def percent(part, total):
+    """Return ``part`` as a percentage of ``total`` to one decimal, 0 when empty.
+
+    Computed as ``part * 100.0 / total`` and rounded half away from zero, the
+    same arithmetic as SQLite's ``round(part * 100.0 / total, 1)`` in the
+    generated columns and ``trial_stats``; Python's ``round`` rounds halves to
+    even and would show 6.2 where the SQL-backed pages show 6.3.
+    """
+    if not total:
+        return 0
+    return math.floor(part * 100.0 / total * 10 + 0.5) / 10
+
+
+def _sum_sql(*columns):
+    return ' + '.join(f'coalesce({column}, 0)' for column in columns)
+
+
+def _percent_sql(part_columns, total_columns):
+    total = _sum_sql(*total_columns)
+    return f'CASE WHEN {total} > 0 THEN round(({_sum_sql(*part_columns)}) * 100.0 / ({total}), 1) ELSE 0 END'
+
+
+_LEGACY_SQL = (
+    'correct_no_support', 'correct_visual_cue', 'correct_verbal_cue',
+    'correct_visual_verbal_cue', 'correct_modeling', 'incorrect',
+)
+_NEW_SQL = ('independent', 'minimal_support', 'moderate_support', 'maximal_support', 'incorrect_new')
+
+
 # New TrialLog Table
 class TrialLog(db.Model):
     """Represents trial log data for a student on a specific objective and session date."""
@@ -68,6 +107,33 @@ class TrialLog(db.Model):
     incorrect_new = db.Column(db.Integer, default=0)
     notes = db.Column(db.Text)
 
+    # Generated (virtual) columns so accuracy can be filtered, sorted and
+    # aggregated in SQL; existing databases get them from
+    # trial_stats.ensure_generated_columns
+    scheme = db.Column(db.String(6), db.Computed(
+        f"CASE WHEN {_sum_sql(*_NEW_SQL)} > 0 AND {_sum_sql(*_LEGACY_SQL)} > 0 THEN 'both' "
+        f"WHEN {_sum_sql(*_NEW_SQL)} > 0 THEN 'new' "
+        f"WHEN {_sum_sql(*_LEGACY_SQL)} > 0 THEN 'legacy' END",
+        persisted=False,
+    ))
+    new_total = db.Column(db.Integer, db.Computed(_sum_sql(*_NEW_SQL), persisted=False))
+    legacy_total = db.Column(db.Integer, db.Computed(_sum_sql(*_LEGACY_SQL), persisted=False))
+    pct_independent = db.Column(db.Float, db.Computed(_percent_sql(_NEW_SQL[:1], _NEW_SQL), persisted=False))
+    pct_up_to_minimal = db.Column(db.Float, db.Computed(_percent_sql(_NEW_SQL[:2], _NEW_SQL), persisted=False))
+    pct_up_to_moderate = db.Column(db.Float, db.Computed(_percent_sql(_NEW_SQL[:3], _NEW_SQL), persisted=False))
+    pct_correct_new = db.Column(db.Float, db.Computed(_percent_sql(_NEW_SQL[:4], _NEW_SQL), persisted=False))
+    pct_no_support = db.Column(db.Float, db.Computed(_percent_sql(_LEGACY_SQL[:1], _LEGACY_SQL), persisted=False))
+    pct_correct_legacy = db.Column(db.Float, db.Computed(_percent_sql(_LEGACY_SQL[:5], _LEGACY_SQL), persisted=False))
+
+    __table_args__ = (
+        db.Index('ix_trial_log_student_date', 'student_id', 'date_of_session'),
+        db.Index('ix_trial_log_scheme_date', 'scheme', 'date_of_session'),
+        db.Index('ix_trial_log_pct_independent', 'pct_independent', 'date_of_session'),
+        db.Index('ix_trial_log_pct_correct_new', 'pct_correct_new', 'date_of_session'),
+        db.Index('ix_trial_log_pct_correct_legacy', 'pct_correct_legacy', 'date_of_session'),
+        ARCHIVED_TABLE_ARGS,
+    )
+
     student = db.relationship('Student', back_populates='trial_logs')
     objective = db.relationship('Objective', back_populates='trial_logs')
 
@@ -95,27 +161,27 @@ class TrialLog(db.Model):
     def percent_no_support(self):
         """Calculate the percentage of correct trials with no support."""
         total = self.total_trials()
-        return round((self.correct_no_support / total) * 100, 1) if total > 0 else 0
+        return percent(self.correct_no_support, total)
     
     def percent_with_1_cue(self):
         """Calculate the percentage of correct trials with up to one cue (no support, visual, or verbal)."""
         total = self.total_trials()
         combined = self.correct_no_support + self.correct_visual_cue + self.correct_verbal_cue
-        return round((combined / total) * 100, 1) if total > 0 else 0
+        return percent(combined, total)
     
     def percent_visual_verbal_cues(self):
         """Calculate the percentage of correct trials with visual and/or verbal cues."""
         total = self.total_trials()
         combined = (self.correct_no_support + self.correct_visual_cue + 
                     self.correct_verbal_cue + self.correct_visual_verbal_cue)
-        return round((combined / total) * 100, 1) if total > 0 else 0
+        return percent(combined, total)
     
     def percent_with_modeling(self):
         """Calculate the percentage of correct trials including modeling cue."""
         total = self.total_trials()
         combined = (self.correct_no_support + self.correct_visual_cue + 
                     self.correct_verbal_cue + self.correct_visual_verbal_cue + self.correct_modeling)
-        return round((combined / total) * 100, 1) if total > 0 else 0
+        return percent(combined, total)
 
     # System usage checks
     def uses_new_system(self):
@@ -151,27 +217,27 @@ class TrialLog(db.Model):
     def percent_independent(self):
         """Calculate the percentage of trials that were independent."""
         total = self.total_trials_new()
-        return round(((self.independent or 0) / total) * 100, 1) if total > 0 else 0
+        return percent(self.independent or 0, total)
 
     def percent_minimal_support(self):
         """Calculate the percentage of trials with minimal support."""
         total = self.total_trials_new()
-        return round(((self.minimal_support or 0) / total) * 100, 1) if total > 0 else 0
+        return percent(self.minimal_support or 0, total)
 
     def percent_moderate_support(self):
         """Calculate the percentage of trials with moderate support."""
         total = self.total_trials_new()
-        return round(((self.moderate_support or 0) / total) * 100, 1) if total > 0 else 0
+        return percent(self.moderate_support or 0, total)
 
     def percent_maximal_support(self):
         """Calculate the percentage of trials with maximal support."""
         total = self.total_trials_new()
-        return round(((self.maximal_support or 0) / total) * 100, 1) if total > 0 else 0
+        return percent(self.maximal_support or 0, total)
 
     def percent_incorrect_new(self):
         """Calculate the percentage of trials that were incorrect (new)."""
         total = self.total_trials_new()
-        return round(((self.incorrect_new or 0) / total) * 100, 1) if total > 0 else 0
+        return percent(self.incorrect_new or 0, total)
 
     def percent_correct_up_to(self, support_level):
         """
@@ -183,13 +249,14 @@ class TrialLog(db.Model):
             return 0.0
         idx = self.SUPPORT_LEVELS.index(support_level) + 1
         correct_sum = sum((getattr(self, lvl) or 0) for lvl in self.SUPPORT_LEVELS[:idx])
-        return round((correct_sum / total) * 100, 1)
+        return percent(correct_sum, total)
     
 
 # Event class: Represents a calendar event for any event type (session, meeting, etc.).
 class Event(db.Model):
     """Represents a calendar event for any event type (session, meeting, etc.)."""
     __tablename__ = 'events'
+    __table_args__ = ARCHIVED_TABLE_ARGS
 
     event_id        = db.Column(db.Integer, primary_key=True)
     student_id      = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=True)  # CHANGED HERE
@@ -213,6 +280,7 @@ class Event(db.Model):
 # MonthlyQuota model: Tracks required monthly sessions for a student.
 class MonthlyQuota(db.Model):
     __tablename__ = 'monthly_quota'
+    __table_args__ = ARCHIVED_TABLE_ARGS
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=False)
     month = db.Column(db.String(7), nullable=False)  # format "YYYY-MM"
@@ -238,6 +306,7 @@ class Activity(db.Model):
 class SoapNote(db.Model):
     """Represents a saved SOAP note entry linked to a student."""
     __tablename__ = 'soap_notes'
+    __table_args__ = ARCHIVED_TABLE_ARGS
     
     soap_note_id = db.Column(db.Integer, primary_key=True)
     student_id   = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=False)
@@ -250,6 +319,7 @@ class SoapNote(db.Model):
 
 class QuarterlyReport(db.Model):
     __tablename__ = 'quarterly_reports'
+    __table_args__ = ARCHIVED_TABLE_ARGS
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=False)
@@ -0,0 +1,154 @@
+"""Trend fits over every objective's recent sessions, for stall detection.
+
+``fit_trends`` works on the whole ``TrialSnapshot`` at once: logs are
+sorted by objective and day, collapsed to one accuracy point per session,
+cut to each objective's last ``last_n`` sessions, and then a least-squares
+slope and an exponentially weighted mean are computed for all objectives
+together from ``bincount`` sums. There is no Python loop per objective.
+
+``stalled_objectives`` flags active objectives whose trend is flat or
+falling while accuracy is still below the objective's target.
+"""
+
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from trial_snapshot import COUNT_COLUMNS
+
+INCORRECT_COLUMNS = ('incorrect', 'incorrect_new')
+CORRECT_COLUMNS = tuple(name for name in COUNT_COLUMNS if name not in INCORRECT_COLUMNS)
+DEFAULT_TARGET = 80.0
+
+# Objective details for the report; works on sqlite3 and SQLAlchemy connections
+OBJECTIVE_SQL = """
+    SELECT o.objective_id, s.student_id, s.first_name, s.last_name,
+           o.objective_description, o.with_accuracy
+    FROM objective o
+    JOIN goal g ON g.goal_id = o.goal_id
+    JOIN student s ON s.student_id = g.student_id
+    WHERE o.active = 1 AND g.active = 1 AND s.active = 1
+"""
+
+ObjectiveInfo = namedtuple('ObjectiveInfo', ['student_id', 'student_name', 'objective', 'target'])
+StalledObjective = namedtuple('StalledObjective', [
+    'objective_id', 'student_id', 'student_name', 'objective', 'status', 'sessions',
+    'slope', 'ewma', 'target', 'last_session',
+])
+
+_NUMBER = re.compile(r'(\d+(?:\.\d+)?)\s*(?:/\s*(\d+(?:\.\d+)?))?')
+
+
+def parse_target(with_accuracy):
+    """Target accuracy in percent from text like ``80%`` or ``4/5 trials``."""
+    match = _NUMBER.search(with_accuracy or '')
+    if not match:
+        return DEFAULT_TARGET
+    value = float(match.group(1))
+    if match.group(2):
+        value = value * 100.0 / float(match.group(2)) if float(match.group(2)) else DEFAULT_TARGET
+    return value if 0 < value <= 100 else DEFAULT_TARGET
+
+
+def objective_details(rows):
+    """Map ``OBJECTIVE_SQL`` result rows to ``{objective_id: ObjectiveInfo}``."""
+    return {
+        objective_id: ObjectiveInfo(student_id, f"{first} {last}", description, parse_target(with_accuracy))
+        for objective_id, student_id, first, last, description, with_accuracy in rows
+    }
+
+
+def fit_trends(snapshot, last_n=8, alpha=0.3, end=None):
+    """Fit each objective's last ``last_n`` sessions (up to ``end``, a date).
+
+    Returns a dict of aligned arrays: ``objective_id``, ``sessions`` (points
+    used), ``slope`` (accuracy points per session, NaN below two points),
+    ``ewma`` (weighting the latest session by ``alpha``), ``last_day``.
+    """
+    objective = np.asarray(snapshot['objective_id'])
+    day = np.asarray(snapshot['day'])
+    correct = sum(np.asarray(snapshot[name], dtype=np.int64) for name in CORRECT_COLUMNS)
+    trials = correct + sum(np.asarray(snapshot[name], dtype=np.int64) for name in INCORRECT_COLUMNS)
+    keep = (objective >= 0) & (trials > 0)
+    if end is not None:
+        keep &= day <= np.datetime64(end, 'D')
+    objective, day, correct, trials = objective[keep], day[keep], correct[keep], trials[keep]
+    if not len(objective):
+        empty = np.array([], dtype=np.float64)
+        return {'objective_id': np.array([], dtype=np.int64), 'sessions': np.array([], dtype=np.int64),
+                'slope': empty, 'ewma': empty, 'last_day': np.array([], dtype='datetime64[D]')}
+
+    # One accuracy point per (objective, session day)
+    order = np.lexsort((day, objective))
+    objective, day = objective[order], day[order]
+    starts_session = np.r_[True, (objective[1:] != objective[:-1]) | (day[1:] != day[:-1])]
+    session = np.cumsum(starts_session) - 1
+    accuracy = (
+        np.bincount(session, weights=correct[order]) * 100.0 / np.bincount(session, weights=trials[order])
+    )
+    objective, day = objective[starts_session], day[starts_session]
+
+    # Position of each session within its objective, counted from the end
+    starts_group = np.r_[True, objective[1:] != objective[:-1]]
+    group = np.cumsum(starts_group) - 1
+    group_start = np.flatnonzero(starts_group)
+    group_size = np.diff(np.r_[group_start, len(objective)])
+    from_end = group_size[group] - 1 - (np.arange(len(objective)) - group_start[group])
+    window = from_end < last_n
+    group, from_end, y = group[window], from_end[window], accuracy[window]
+    groups = len(group_start)
+
+    n = np.bincount(group, minlength=groups).astype(np.float64)
+    x = (np.minimum(group_size, last_n)[group] - 1 - from_end).astype(np.float64)
+    sx, sy = np.bincount(group, x, groups), np.bincount(group, y, groups)
+    sxx, sxy = np.bincount(group, x * x, groups), np.bincount(group, x * y, groups)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+    weights = (1.0 - alpha) ** from_end
+    ewma = np.bincount(group, weights * y, groups) / np.bincount(group, weights, groups)
+
+    return {
+        'objective_id': objective[group_start].astype(np.int64),
+        'sessions': n.astype(np.int64),
+        'slope': slope,
+        'ewma': ewma,
+        'last_day': day[group_start + group_size - 1],
+    }
+
+
+def stalled_objectives(snapshot, objectives, last_n=8, min_sessions=4, min_gain=1.0, end=None):
+    """Active objectives that plateaued or declined over their last sessions.
+
+    ``objectives`` comes from ``objective_details``. An objective is
+    flagged when it has at least ``min_sessions`` sessions, its slope is
+    below ``min_gain`` points per session and its EWMA is under target;
+    it is ``'declining'`` when the slope is below ``-min_gain``.
+    """
+    trends = fit_trends(snapshot, last_n=last_n, end=end)
+    known = np.isin(trends['objective_id'], np.fromiter(objectives, dtype=np.int64, count=len(objectives)))
+    targets = np.array([
+        objectives[objective_id].target if objective_id in objectives else DEFAULT_TARGET
+        for objective_id in trends['objective_id'].tolist()
+    ])
+    flagged = (
+        known
+        & (trends['sessions'] >= min_sessions)
+        & (trends['slope'] < min_gain)
+        & (trends['ewma'] < targets)
+    )
+
+    stalled = []
+    for index in np.flatnonzero(flagged).tolist():
+        objective_id = int(trends['objective_id'][index])
+        info = objectives[objective_id]
+        slope = float(trends['slope'][index])
+        stalled.append(StalledObjective(
+            objective_id, info.student_id, info.student_name, info.objective,
+            'declining' if slope < -min_gain else 'plateaued',
+            int(trends['sessions'][index]), round(slope, 2), round(float(trends['ewma'][index]), 1),
+            info.target, trends['last_day'][index].item(),
+        ))
+    stalled.sort(key=lambda row: (row.slope, row.student_name))
+    return stalled
@@ -0,0 +1,146 @@
+"""Opt-in SQL statement profiler.
+
+When ``SQL_PROFILER_ENABLED`` is set, every statement executed by the app is
+timed, grouped by its normalized SQL text and periodically written to
+``instance/query_stats.json`` so ``manage.py status``/``maintain`` can list
+the most expensive queries without the app running. Each worker process
+keeps its own totals under its pid in that file, and ``load_query_stats``
+adds them up.
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from sqlalchemy import event
+
+from shards import on_shard_engine
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent flushes may drop a worker's totals
+    fcntl = None
+
+STATS_FILENAME = "query_stats.json"
+
+_WHITESPACE = re.compile(r"\s+")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def normalize_sql(statement):
+    """Collapse whitespace and ``IN (?, ?, ...)`` lists so similar queries group."""
+    return _PARAM_LIST.sub("(?...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryProfiler:
+    """Aggregates count, total and max time per normalized statement."""
+
+    def __init__(self, stats_path, flush_interval=30.0):
+        self.stats_path = Path(stats_path)
+        self.flush_interval = flush_interval
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.started = time.time()
+
+    def install(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        key = normalize_sql(statement)
+        with self._lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                self.stats[key] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Merge this process's totals into ``stats_path``."""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            entry = {
+                'updated': time.time(),
+                'queries': [
+                    {'sql': sql, 'count': count, 'total_seconds': total, 'max_seconds': worst}
+                    for sql, (count, total, worst) in self.stats.items()
+                ],
+            }
+        with _locked(self.stats_path.with_suffix('.lock')):
+            # Totals last written before this process started are from an
+            # earlier run of the app
+            processes = {
+                pid: other for pid, other in _read_processes(self.stats_path).items()
+                if other.get('updated', 0) >= self.started
+            }
+            processes[str(os.getpid())] = entry
+            tmp = self.stats_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps({'processes': processes}))
+            os.replace(tmp, self.stats_path)
+
+
+@contextmanager
+def _locked(lock_path):
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _read_processes(stats_path):
+    """``{pid: {'updated', 'queries'}}`` from ``stats_path``, or ``{}``."""
+    if not stats_path.exists():
+        return {}
+    stats = json.loads(stats_path.read_text())
+    if 'processes' not in stats:  # written by a single process before
+        return {str(stats.get('pid')): stats}
+    return stats['processes']
+
+
+def load_query_stats(stats_path, limit=10):
+    """Return the ``limit`` statements with the highest total time across workers, or ``[]``."""
+    merged = {}
+    for process in _read_processes(Path(stats_path)).values():
+        for query in process.get('queries', []):
+            total = merged.setdefault(query['sql'], {
+                'sql': query['sql'], 'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            total['count'] += query['count']
+            total['total_seconds'] += query['total_seconds']
+            total['max_seconds'] = max(total['max_seconds'], query['max_seconds'])
+    queries = sorted(merged.values(), key=lambda q: q['total_seconds'], reverse=True)
+    return queries[:limit]
+
+
+def init_query_profiler(app, db):
+    """Attach a ``QueryProfiler`` to the app's and each clinician's engine if enabled in config."""
+    if not app.config.get('SQL_PROFILER_ENABLED'):
+        return None
+    profiler = QueryProfiler(
+        Path(app.instance_path) / STATS_FILENAME,
+        flush_interval=app.config.get('SQL_PROFILER_FLUSH_SECONDS', 30),
+    )
+    with app.app_context():
+        profiler.install(db.engine)
+    on_shard_engine(app, lambda slug, engine: profiler.install(engine))
+    atexit.register(profiler.flush)
+    app.extensions['query_profiler'] = profiler
+    return profiler
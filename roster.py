@@ -0,0 +1,93 @@
+"""Process-wide cache of the active-student roster.
+
+Nearly every page renders a student dropdown or table built from the list of
+active students. Instead of querying and constructing ``Student`` objects on
+each request, routes read an immutable list of ``RosterEntry`` tuples that is
+rebuilt only when ``data_version('student')`` moves, that is after a
+``Student`` flush or a commit to the database from anywhere else. Each
+clinician database (``shards.current_shard``) has its own cache.
+"""
+
+import threading
+from collections import namedtuple
+
+from models import Student, db
+from shards import current_shard
+from template_cache import data_version
+
+RosterEntry = namedtuple(
+    'RosterEntry',
+    [
+        'student_id', 'first_name', 'last_name', 'preferred_name',
+        'grade', 'pronouns', 'monthly_services',
+    ],
+)
+
+ROSTER_ORDERS = ('first_name', 'last_name')
+
+
+class RosterCache:
+    """Versioned cache of active students, sorted by first or last name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._entries = {order: () for order in ROSTER_ORDERS}
+
+    @property
+    def version(self):
+        return data_version(Student.__tablename__)
+
+    def get(self, order='first_name'):
+        """Return the active roster as a tuple of ``RosterEntry`` rows."""
+        if order not in ROSTER_ORDERS:
+            raise ValueError(f"Unknown roster order: {order}")
+        version = self.version
+        with self._lock:
+            if self._loaded_version == version:
+                return self._entries[order]
+
+        rows = (
+            db.session.query(
+                Student.student_id,
+                Student.first_name,
+                Student.last_name,
+                Student.preferred_name,
+                Student.grade,
+                Student.pronouns,
+                Student.monthly_services,
+            )
+            .filter_by(active=True)
+            .order_by(Student.first_name, Student.student_id)
+            .all()
+        )
+        by_first = tuple(RosterEntry(*row) for row in rows)
+        by_last = tuple(sorted(by_first, key=lambda s: (s.last_name, s.first_name)))
+
+        with self._lock:
+            # A Student flush during the load leaves the cache stale; keep
+            # the result for this request but let the next one reload.
+            if version == self.version:
+                self._entries = {'first_name': by_first, 'last_name': by_last}
+                self._loaded_version = version
+        return by_first if order == 'first_name' else by_last
+
+
+_roster_caches = {}
+_roster_caches_lock = threading.Lock()
+
+
+def roster_cache():
+    """The ``RosterCache`` of the current clinician database."""
+    shard = current_shard()
+    with _roster_caches_lock:
+        cache = _roster_caches.get(shard)
+        if cache is None:
+            cache = _roster_caches[shard] = RosterCache()
+        return cache
+
+
+def active_students(order='first_name'):
+    """Return cached active students ordered by ``first_name`` or ``last_name``."""
+    return roster_cache().get(order)
+
@@ -0,0 +1,284 @@
+"""Bulk upsert of the roster hierarchy: Student -> Goal -> Objective.
+
+Input is CSV with one row per objective (student columns repeated, blank
+goal/objective cells for students or goals without children) or JSON with
+nested ``goals``/``objectives`` lists; see ``json/roster_example.json``.
+
+Rows are matched to existing records by natural key: a student by first and
+last name (case-insensitive), a goal by its description within the student,
+an objective by its description within the goal. ``plan_roster_import``
+computes the inserts and updates against the current database without
+writing anything; ``apply_roster_plan`` executes them with batched
+INSERT/UPDATE statements. ``import_roster`` does both in one transaction.
+"""
+
+import csv
+import json
+import sqlite3
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from pathlib import Path
+
+STUDENT_FIELDS = (
+    'grade', 'preferred_name', 'pronouns', 'monthly_services',
+    'reevaluation_date', 'annual_review_date', 'active',
+)
+DATE_FIELDS = ('reevaluation_date', 'annual_review_date')
+
+Change = namedtuple('Change', ['action', 'kind', 'label', 'detail'])
+
+
+class RosterImportError(ValueError):
+    """Raised for input that cannot be imported at all."""
+
+
+def _key(text):
+    return ' '.join((text or '').split()).lower()
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_field(name, value):
+    value = _clean(value)
+    if value is None:
+        return None
+    if name == 'active':
+        return 0 if value.lower() in ('0', 'false', 'no', 'n', 'inactive') else 1
+    if name in DATE_FIELDS:
+        for fmt in ('%Y-%m-%d', '%m/%d/%Y'):
+            try:
+                return datetime.strptime(value, fmt).date().isoformat()
+            except ValueError:
+                continue
+        raise RosterImportError(f"unrecognized date '{value}' for {name}")
+    return value
+
+
+def _merge(roster, record):
+    """Fold one student record (with nested goals) into ``roster``."""
+    first, last = _clean(record.get('first_name')), _clean(record.get('last_name'))
+    if not first or not last:
+        raise RosterImportError(f"student without first_name/last_name: {record}")
+    student = roster.setdefault((_key(first), _key(last)), {
+        'first_name': first, 'last_name': last, 'fields': {}, 'goals': {},
+    })
+    for name in STUDENT_FIELDS:
+        value = _parse_field(name, record.get(name))
+        if value is not None:
+            student['fields'][name] = value
+
+    for goal in record.get('goals') or ():
+        description = _clean(goal.get('goal_description') or goal.get('description'))
+        if not description:
+            continue
+        goal_entry = student['goals'].setdefault(_key(description), {
+            'description': description, 'objectives': {},
+        })
+        for objective in goal.get('objectives') or ():
+            text = _clean(objective.get('objective_description') or objective.get('description'))
+            if text:
+                goal_entry['objectives'][_key(text)] = {
+                    'description': text,
+                    'with_accuracy': _clean(objective.get('with_accuracy')),
+                }
+
+
+def load_roster(path):
+    """Read a CSV or JSON roster file into ``{(first, last): student}``."""
+    path = Path(path)
+    roster = {}
+    if path.suffix.lower() == '.json':
+        data = json.loads(path.read_text(encoding='utf-8'))
+        records = data.get('students', []) if isinstance(data, dict) else data
+        for record in records:
+            _merge(roster, record)
+        return roster
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            row = {key.strip().lower().replace(' ', '_'): value for key, value in row.items() if key}
+            goal = _clean(row.get('goal_description') or row.get('goal'))
+            objective = _clean(row.get('objective_description') or row.get('objective'))
+            if goal:
+                row['goals'] = [{
+                    'goal_description': goal,
+                    'objectives': [{
+                        'objective_description': objective,
+                        'with_accuracy': row.get('with_accuracy'),
+                    }] if objective else [],
+                }]
+            _merge(roster, row)
+    return roster
+
+
+class RosterPlan:
+    """Pending inserts and updates for one import, plus a readable diff."""
+
+    def __init__(self):
+        self.changes = []
+        self.new_students = []      # (first, last, fields)
+        self.student_updates = []   # (student_id, {field: value})
+        self.new_goals = []         # (student natural key, description)
+        self.new_objectives = []    # (student key, goal key, description, with_accuracy)
+        self.objective_updates = []  # (objective_id, with_accuracy)
+        self.unchanged = 0
+
+    def counts(self):
+        return {
+            'students added': len(self.new_students),
+            'students updated': len(self.student_updates),
+            'goals added': len(self.new_goals),
+            'objectives added': len(self.new_objectives),
+            'objectives updated': len(self.objective_updates),
+            'unchanged': self.unchanged,
+        }
+
+    def __bool__(self):
+        return bool(self.changes)
+
+
+def plan_roster_import(conn, roster):
+    """Compare ``roster`` with the database on ``conn``; return a ``RosterPlan``."""
+    plan = RosterPlan()
+    students = {}
+    for row in conn.execute(
+        f"SELECT student_id, first_name, last_name, {', '.join(STUDENT_FIELDS)} FROM student"
+    ):
+        key = (_key(row[1]), _key(row[2]))
+        if key in students:
+            students[key] = None  # duplicate names in the database; cannot match safely
+        else:
+            students[key] = (row[0], dict(zip(STUDENT_FIELDS, row[3:])))
+    goals = {
+        (student_id, _key(description)): goal_id
+        for goal_id, student_id, description in conn.execute(
+            "SELECT goal_id, student_id, goal_description FROM goal"
+        )
+    }
+    objectives = {
+        (goal_id, _key(description)): (objective_id, with_accuracy)
+        for objective_id, goal_id, description, with_accuracy in conn.execute(
+            "SELECT objective_id, goal_id, objective_description, with_accuracy FROM objective"
+        )
+    }
+
+    for student_key, student in roster.items():
+        label = f"{student['first_name']} {student['last_name']}"
+        if student_key in students and students[student_key] is None:
+            raise RosterImportError(f"more than one student named {label} in the database")
+        existing = students.get(student_key)
+        if existing is None:
+            plan.new_students.append((student['first_name'], student['last_name'], student['fields']))
+            plan.changes.append(Change('add', 'student', label, ''))
+            student_id = None
+        else:
+            student_id, current = existing
+            changed = {
+                name: value for name, value in student['fields'].items()
+                if str(current[name] if current[name] is not None else '') != str(value)
+            }
+            if changed:
+                plan.student_updates.append((student_id, changed))
+                detail = ', '.join(f"{name}: {current[name]!r} → {value!r}" for name, value in changed.items())
+                plan.changes.append(Change('update', 'student', label, detail))
+            else:
+                plan.unchanged += 1
+
+        for goal_key, goal in student['goals'].items():
+            goal_id = goals.get((student_id, goal_key)) if student_id else None
+            if goal_id is None:
+                plan.new_goals.append((student_key, goal['description']))
+                plan.changes.append(Change('add', 'goal', label, goal['description']))
+            else:
+                plan.unchanged += 1
+            for objective_key, objective in goal['objectives'].items():
+                current = objectives.get((goal_id, objective_key)) if goal_id else None
+                if current is None:
+                    plan.new_objectives.append(
+                        (student_key, goal_key, objective['description'], objective['with_accuracy'])
+                    )
+                    plan.changes.append(Change('add', 'objective', label, objective['description']))
+                elif objective['with_accuracy'] is not None and objective['with_accuracy'] != current[1]:
+                    plan.objective_updates.append((current[0], objective['with_accuracy']))
+                    plan.changes.append(Change(
+                        'update', 'objective', label,
+                        f"{objective['description']}: with_accuracy {current[1]!r} → {objective['with_accuracy']!r}",
+                    ))
+                else:
+                    plan.unchanged += 1
+    return plan
+
+
+def apply_roster_plan(conn, plan):
+    """Execute ``plan`` on ``conn``; the caller owns the transaction."""
+    if plan.new_students:
+        conn.executemany(
+            f"INSERT INTO student (first_name, last_name, {', '.join(STUDENT_FIELDS)}) "
+            f"VALUES (?, ?{', ?' * len(STUDENT_FIELDS)})",
+            [
+                (first, last, *(fields.get(name, 1 if name == 'active' else None) for name in STUDENT_FIELDS))
+                for first, last, fields in plan.new_students
+            ],
+        )
+    # One executemany per distinct set of changed columns
+    updates = defaultdict(list)
+    for student_id, changed in plan.student_updates:
+        updates[tuple(changed)].append((*changed.values(), student_id))
+    for names, rows in updates.items():
+        assignments = ', '.join(f"{name} = ?" for name in names)
+        conn.executemany(f"UPDATE student SET {assignments} WHERE student_id = ?", rows)
+
+    # Resolve ids of rows inserted above by natural key
+    student_ids = {
+        (_key(first), _key(last)): student_id
+        for student_id, first, last in conn.execute("SELECT student_id, first_name, last_name FROM student")
+    }
+    if plan.new_goals:
+        conn.executemany(
+            "INSERT INTO goal (student_id, goal_description, active) VALUES (?, ?, 1)",
+            [(student_ids[student_key], description) for student_key, description in plan.new_goals],
+        )
+    goal_ids = {
+        (student_id, _key(description)): goal_id
+        for goal_id, student_id, description in conn.execute(
+            "SELECT goal_id, student_id, goal_description FROM goal"
+        )
+    }
+    if plan.new_objectives:
+        conn.executemany(
+            "INSERT INTO objective (goal_id, objective_description, with_accuracy, active) VALUES (?, ?, ?, 1)",
+            [
+                (goal_ids[student_ids[student_key], goal_key], description, with_accuracy)
+                for student_key, goal_key, description, with_accuracy in plan.new_objectives
+            ],
+        )
+    if plan.objective_updates:
+        conn.executemany(
+            "UPDATE objective SET with_accuracy = ? WHERE objective_id = ?",
+            [(with_accuracy, objective_id) for objective_id, with_accuracy in plan.objective_updates],
+        )
+
+
+def import_roster(db_path, roster_path, dry_run=False):
+    """Load ``roster_path`` and upsert it into ``db_path``; return the ``RosterPlan``."""
+    roster = load_roster(roster_path)
+    conn = sqlite3.connect(str(db_path), isolation_level=None, timeout=30)
+    try:
+        # Plan and apply under one write lock so the diff cannot go stale
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            plan = plan_roster_import(conn, roster)
+            if plan and not dry_run:
+                apply_roster_plan(conn, plan)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("ROLLBACK" if dry_run else "COMMIT")
+    finally:
+        conn.close()
+    return plan
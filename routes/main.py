@@ -4,8 +4,11 @@ from flask import request, render_template, jsonify, redirect, url_for, flash
 from sqlalchemy.orm import joinedload
 
 from . import routes_bp
+from roster import active_students
+from session_status import SESSION_STATUSES, apply_status_changes
+from student_profile import student_profile_or_404
 from models import (
-    Student, Goal, Objective, TrialLog, Event, db
+    Student, Goal, Event, db
 )
 
 
@@ -42,7 +45,7 @@ def index():
 def calendar():
     """Display the calendar page."""
     filter_date = request.args.get('filter_date')
-    students = Student.query.filter_by(active=True).order_by(Student.first_name).all()
+    students = active_students()
     return render_template('calendar.html', students=students, filter_date=filter_date)
 
 
@@ -162,7 +165,7 @@ def sessions():
     filter_student = request.args.get('filter_student', type=int)
     filter_status = request.args.get('filter_status')
 
-    students = Student.query.filter_by(active=True).order_by(Student.last_name.asc(), Student.first_name.asc()).all()
+    students = active_students(order='last_name')
 
     base_q = Event.query.filter_by(active=True, event_type='Session')
     if filter_date:
@@ -225,13 +228,61 @@ def scheduled_sessions_pending():
         .order_by(Event.date_of_session, Event.time_of_start)
         .all()
     )
-    return render_template('scheduled_sessions_pending.html', sessions=sessions)
+    return render_template('scheduled_sessions_pending.html', sessions=sessions, statuses=SESSION_STATUSES)
+
+
+def _event_id(value):
+    # JSON ids may arrive as integers or strings; true, 1.5 or null are not ids
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError(value)
+    return int(value)
+
+
+@routes_bp.route('/sessions/bulk_status', methods=['POST'])
+def bulk_session_status():
+    """Apply many session status changes in one transaction.
+
+    Takes ``status-<event_id>`` form fields, or a JSON body of
+    ``{"updates": [{"event_id": ..., "status": ...}, ...]}`` which is
+    answered with JSON instead of a redirect.
+    """
+    try:
+        if request.is_json:
+            pairs = [(_event_id(item['event_id']), item['status']) for item in request.get_json()['updates']]
+        else:
+            pairs = [
+                (int(key.removeprefix('status-')), value)
+                for key, value in request.form.items()
+                if key.startswith('status-')
+            ]
+    except (KeyError, TypeError, ValueError):
+        if request.is_json:
+            return jsonify({'error': 'expected a list of {event_id, status} updates'}), 400
+        flash('Could not read the submitted status changes.', 'danger')
+        return redirect(url_for('routes.scheduled_sessions_pending'))
+
+    result = apply_status_changes(pairs)
+    if request.is_json:
+        return jsonify({
+            'updated': result.updated,
+            'unchanged': result.unchanged,
+            'errors': [error._asdict() for error in result.errors],
+        }), 400 if result.errors else 200
+
+    if result.errors:
+        for error in result.errors:
+            flash(f'Session {error.event_id}: {error.message}', 'danger')
+        flash('No statuses were changed.', 'warning')
+    else:
+        flash(f'Updated {result.updated} session(s).', 'success')
+    next_url = request.form.get('next') or url_for('routes.scheduled_sessions_pending')
+    return redirect(next_url)
 
 
 @routes_bp.route('/bulk_sessions', methods=['GET', 'POST'])
 def bulk_sessions():
     """Bulk-create one Session event per student for a chosen date."""
-    students = Student.query.filter_by(active=True).order_by(Student.first_name).all()
+    students = active_students()
 
     if request.method == 'POST':
         date_str = request.form['session_date']
@@ -265,38 +316,16 @@ def bulk_sessions():
 
 @routes_bp.route('/student/<int:student_id>/sessions')
 def student_sessions(student_id):
-    student = Student.query.get_or_404(student_id)
-
-    sessions = (
-        Event.query
-        .filter_by(student_id=student_id, event_type='Session')
-        .order_by(Event.date_of_session.desc(), Event.time_of_start)
-        .all()
-    )
-
-    trial_logs = (
-        TrialLog.query
-        .filter_by(student_id=student_id)
-        .order_by(TrialLog.date_of_session.desc())
-        .all()
+    student, _, objectives, _ = student_profile_or_404(student_id)
+    include_archive = request.args.get('include_archive', type=int)
+    # Sessions and trial logs are fetched in chunks by the page as it scrolls
+    objectives = sorted(
+        (objective for objective in objectives if objective.active),
+        key=lambda objective: objective.objective_description,
     )
-
-    objectives = (
-        Objective.query
-        .join(Goal)
-        .filter(Goal.student_id == student_id, Objective.active.is_(True))
-        .order_by(Objective.objective_description)
-        .all()
-    )
-
-    legacy_logs = [log for log in trial_logs if log.uses_legacy_system()]
-    new_logs = [log for log in trial_logs if log.uses_new_system()]
-
     return render_template(
         'student_sessions.html',
         student=student,
-        sessions=sessions,
-        legacy_logs=legacy_logs,
-        new_logs=new_logs,
         objectives=objectives,
+        include_archive=include_archive,
     )
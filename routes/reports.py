@@ -3,9 +3,15 @@ from collections import defaultdict
 from calendar import monthrange
 
 from flask import request, render_template, flash, redirect, url_for
-from sqlalchemy import extract
+from sqlalchemy import extract, text
 
 from . import routes_bp
+from roster import active_students
+from archive import history_entity
+from trial_stats import BELOW_COLUMNS, classified_trial_logs, objectives_below
+from caseload_dashboard import caseload_dashboard, current_snapshot
+from clinicians import report_signature
+from objective_trends import OBJECTIVE_SQL, objective_details, stalled_objectives
 from models import (
     Student, TrialLog, Event, Goal, Objective, MonthlyQuota,
     QuarterlyReport, db
@@ -104,6 +110,51 @@ def monthly_sessions_report():
     )
 
 
+@routes_bp.route('/reports/caseload')
+def caseload_report():
+    dashboard = caseload_dashboard()
+    return render_template('caseload_dashboard.html', dashboard=dashboard)
+
+
+@routes_bp.route('/reports/stalled_objectives')
+def stalled_objectives_report():
+    last_n = min(max(request.args.get('sessions', 8, type=int), 2), 50)
+    min_sessions = min(max(request.args.get('min_sessions', 4, type=int), 2), last_n)
+    min_gain = request.args.get('min_gain', 1.0, type=float)
+
+    objectives = objective_details(db.session.execute(text(OBJECTIVE_SQL)))
+    stalled = stalled_objectives(
+        current_snapshot(), objectives,
+        last_n=last_n, min_sessions=min_sessions, min_gain=min_gain,
+    )
+    return render_template(
+        'stalled_objectives_report.html',
+        stalled=stalled,
+        last_n=last_n,
+        min_sessions=min_sessions,
+        min_gain=min_gain,
+    )
+
+
+
+@routes_bp.route('/reports/objectives_below')
+def objectives_below_report():
+    threshold = min(max(request.args.get('threshold', 60.0, type=float), 0.0), 100.0)
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    column = request.args.get('column', 'pct_independent')
+    if column not in BELOW_COLUMNS:
+        column = 'pct_independent'
+
+    since = date.today() - timedelta(days=days)
+    rows = objectives_below(threshold, since, column=column)
+    return render_template(
+        'objectives_below_report.html',
+        rows=rows,
+        threshold=threshold,
+        days=days,
+        column=column,
+    )
+
 @routes_bp.route('/reports/makeup_needed')
 def makeup_needed_report():
     now = datetime.now()
@@ -156,23 +207,25 @@ def trial_logs_by_date():
         flash('Invalid date format!', 'danger')
         selected_date = datetime.now().date()
 
-    trial_logs = TrialLog.query.filter(
-        TrialLog.date_of_session == selected_date
-    ).order_by(TrialLog.student_id).all()
-    legacy_logs = [log for log in trial_logs if log.uses_legacy_system()]
-    new_logs = [log for log in trial_logs if log.uses_new_system()]
+    include_archive = request.args.get('include_archive', type=int)
+    Log = history_entity(TrialLog) if include_archive else TrialLog
+    new_logs, legacy_logs = classified_trial_logs(
+        Log, Log.date_of_session == selected_date,
+        order_by=(Log.student_id, Log.trial_log_id), with_student=True,
+    )
 
     return render_template(
         'trial_logs_by_date.html',
         legacy_logs=legacy_logs,
         new_logs=new_logs,
         selected_date=selected_date_str,
+        include_archive=include_archive,
     )
 
 
 @routes_bp.route('/quarterly_report', methods=['GET', 'POST'])
 def quarterly_report():
-    students = Student.query.filter_by(active=True).order_by(Student.first_name).all()
+    students = active_students()
     quarters = ['Q1', 'Q2', 'Q3', 'Q4']
     overall_progress_options = ['Significant Progress', 'Steady Progress', 'Minimal Progress', 'Other']
     closing_sentence_options = [
@@ -301,7 +354,7 @@ def quarterly_report():
 
 @routes_bp.route('/makeups_by_month')
 def makeups_by_month():
-    students = Student.query.filter_by(active=True).order_by(Student.last_name, Student.first_name).all()
+    students = active_students(order='last_name')
     months = [
         ('September', 9), ('October', 10), ('November', 11), ('December', 12),
         ('January', 1), ('February', 2), ('March', 3), ('April', 4),
@@ -338,7 +391,7 @@ def save_quarterly_report():
     quarter = request.form.get('quarter', '')
     paragraphs = request.form.getlist('paragraphs')
     report_text = '\n\n'.join(paragraphs)
-    signature = '\n\n- Sean Hendricks, MA CCC-SLP MD License #07304'
+    signature = f'\n\n- {report_signature()}'
     report_text_with_signature = report_text + signature
 
     new_report = QuarterlyReport(
@@ -355,7 +408,7 @@ def save_quarterly_report():
 
 @routes_bp.route('/quarterly_report_history', methods=['GET'])
 def quarterly_report_history():
-    students = Student.query.filter_by(active=True).order_by(Student.first_name).all()
+    students = active_students()
     quarters = [q[0] for q in db.session.query(QuarterlyReport.quarter).distinct().order_by(QuarterlyReport.quarter).all()]
 
     student_id = request.args.get('student_id', type=int)
@@ -2,16 +2,24 @@ from datetime import datetime, date
 import csv
 from io import StringIO
 
-from flask import request, render_template, redirect, url_for, flash, Response
-from sqlalchemy import extract
+from flask import request, render_template, redirect, url_for, flash, Response, jsonify
+from sqlalchemy import extract, insert
+from sqlalchemy.orm import contains_eager
 
 from . import routes_bp
+from roster import active_students
+from archive import history_entity
+from anonymize import NameAnonymizer
+from template_cache import bump_data_version
+from soap_import import import_soap_notes
+from clinicians import note_signature
+from soap_builder import PERFORMANCE_OPTIONS, Target, build_note, day_drafts
 from models import Student, Objective, Goal, Event, Activity, SoapNote, db
 
 
 @routes_bp.route('/soap_note', methods=['GET', 'POST'])
 def soap_note():
-    students = Student.query.filter_by(active=True).order_by(Student.first_name).all()
+    students = active_students()
     selected_student_id = request.args.get('student_id', type=int)
     selected_student = Student.query.get(selected_student_id) if selected_student_id else None
 
@@ -72,67 +80,31 @@ def soap_note():
         if verbal_cues_other:
             verbal_cues.append(verbal_cues_other)
 
-        def format_list(items):
-            if len(items) == 1:
-                return items[0].lower()
-            elif len(items) == 2:
-                return f"{items[0].lower()} and {items[1].lower()}"
-            else:
-                return f"{', '.join(item.lower() for item in items[:-1])}, and {items[-1].lower()}"
-
-        visual_cues_formatted = format_list(visual_cues) if visual_cues else 'N/A'
-        verbal_cues_formatted = format_list(verbal_cues) if verbal_cues else 'N/A'
-
-        pronoun_map = {
-            'he/him': ('he', 'his', 'him'),
-            'she/her': ('she', 'her', 'her'),
-            'they/them': ('they', 'their', 'them'),
-            'other': ('they', 'their', 'them')
-        }
-
-        if student and student.pronouns:
-            pronoun_key = student.pronouns.lower().strip()
-            if pronoun_key not in pronoun_map:
-                if 'she' in pronoun_key:
-                    pronoun_key = 'she/her'
-                elif 'he' in pronoun_key:
-                    pronoun_key = 'he/him'
-                else:
-                    pronoun_key = 'they/them'
-        else:
-            pronoun_key = 'they/them'
-
-        pronoun_subject, pronoun_possessive, pronoun_object = pronoun_map.get(pronoun_key, ('they', 'their', 'them'))
-        verb_be = 'was' if pronoun_subject in ['he', 'she'] else 'were'
-
-        s_note = f"{month} Session {session_number}/{total_sessions}: {student.first_name} attended {pronoun_possessive} {session_type.lower()} speech therapy session. {pronoun_subject.capitalize()} {verb_be} {performance}."
-        if additional_s:
-            s_note += f" {additional_s}"
-        o_note = f"{pronoun_subject.capitalize()} {verb_be} given {activity.lower()}. {pronoun_subject.capitalize()} {verb_be} able to {objective} with {accuracy}% accuracy {support_level}."
-        if additional_O:
-            o_note += f" {additional_O}"
-
-        if visual_cues and verbal_cues:
-            a_note = f"{pronoun_subject.capitalize()} benefited from visual and verbal cues. Visual cues included {visual_cues_formatted}. Verbal cues included {verbal_cues_formatted}."
-        elif visual_cues:
-            a_note = f"{pronoun_subject.capitalize()} benefited from visual cues. Visual cues included {visual_cues_formatted}."
-        elif verbal_cues:
-            a_note = f"{pronoun_subject.capitalize()} benefited from verbal cues. Verbal cues included {verbal_cues_formatted}."
-        else:
-            a_note = f"{pronoun_subject.capitalize()} did not require visual or verbal cues during this session."
-
-        p_note = 'Continue to target IEP goals. -Sean Hendricks, MA CCC-SLP'
-        full_note = f"S: {s_note}\nO: {o_note}\nA: {a_note}\nP: {p_note}"
+        parts = build_note(
+            student.first_name, student.pronouns,
+            month=month,
+            session_number=session_number,
+            total_sessions=total_sessions,
+            performance=performance,
+            session_type=session_type,
+            activity=activity,
+            targets=[Target(objective, accuracy, support_level)],
+            visual_cues=visual_cues,
+            verbal_cues=verbal_cues,
+            additional_s=additional_s,
+            additional_o=additional_O,
+            signature=note_signature(),
+        )
         selected_date = datetime.now().date()
         return render_template(
             'soap_note_result.html',
             student_id=selected_student_id,
             note_date=selected_date.isoformat(),
-            s_note=s_note,
-            o_note=o_note,
-            a_note=a_note,
-            p_note=p_note,
-            full_note=full_note,
+            s_note=parts.s_note,
+            o_note=parts.o_note,
+            a_note=parts.a_note,
+            p_note=parts.p_note,
+            full_note=parts.full_note,
         )
 
     return render_template(
@@ -181,9 +153,7 @@ def add_soap_note():
 
 @routes_bp.route('/soap_notes/bulk_add', methods=['GET', 'POST'])
 def bulk_add_soap():
-    students = Student.query.filter_by(active=True).order_by(
-        Student.last_name, Student.first_name
-    ).all()
+    students = active_students(order='last_name')
 
     if request.method == 'POST':
         student_id_str = request.form.get('student_id')
@@ -224,30 +194,117 @@ def bulk_add_soap():
     return render_template('bulk_add_soap.html', students=students)
 
 
+@routes_bp.route('/soap_notes/import', methods=['POST'])
+def import_soap_notes_file():
+    """Import many SOAP notes from an uploaded CSV or JSONL file."""
+    upload = request.files.get('notes_file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV or JSONL file to import.', 'warning')
+        return redirect(url_for('routes.bulk_add_soap'))
+
+    extension = upload.filename.rsplit('.', 1)[-1].lower()
+    fmt = 'jsonl' if extension in ('jsonl', 'ndjson', 'json') else 'csv'
+    try:
+        report = import_soap_notes(upload.stream, fmt)
+    except UnicodeDecodeError:
+        db.session.rollback()
+        flash('The file is not UTF-8 text; nothing after the last saved batch was imported.', 'danger')
+        return redirect(url_for('routes.bulk_add_soap'))
+    except csv.Error as exc:
+        db.session.rollback()
+        flash(f'The CSV file could not be read ({exc}); nothing after the last saved batch was imported.', 'danger')
+        return redirect(url_for('routes.bulk_add_soap'))
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(report.to_dict())
+
+    category = 'success' if not report.errors else 'warning'
+    flash(f'Imported {report.inserted} of {report.rows} SOAP note(s) from {upload.filename}.', category)
+    return render_template('bulk_add_soap.html', students=active_students(order='last_name'), report=report)
+
+
+@routes_bp.route('/soap_notes/day', methods=['GET', 'POST'])
+def soap_notes_day():
+    """Draft SOAP notes for every completed session on a day and save the approved ones."""
+    if request.method == 'POST':
+        note_date_str = request.form.get('note_date')
+        try:
+            note_dt = datetime.strptime(note_date_str, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            flash('Invalid date format; notes were not saved.', 'danger')
+            return redirect(url_for('routes.soap_notes_day'))
+
+        rows = []
+        for index in request.form.getlist('approve'):
+            student_id = request.form.get(f'student_id_{index}', type=int)
+            note_text = request.form.get(f'note_{index}', '').strip()
+            if student_id and note_text:
+                rows.append({'student_id': student_id, 'note_date': note_dt, 'note_text': note_text})
+
+        if not rows:
+            flash('No notes were approved.', 'warning')
+            return redirect(url_for('routes.soap_notes_day', date=note_date_str))
+
+        db.session.execute(insert(SoapNote), rows)
+        db.session.commit()
+        # Core inserts bypass the flush-based cache invalidation
+        bump_data_version(SoapNote.__tablename__)
+        flash(f'Saved {len(rows)} SOAP note(s) for {note_date_str}.', 'success')
+        return redirect(url_for('routes.view_soap_notes', start_date=note_date_str, end_date=note_date_str))
+
+    selected_date_str = request.args.get('date', date.today().isoformat())
+    try:
+        selected_date = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date format!', 'danger')
+        selected_date = date.today()
+
+    performance = request.args.get('performance', PERFORMANCE_OPTIONS[0][1])
+    activity = request.args.get('activity') or '[activity]'
+    session_type = request.args.get('session_type', 'Individual')
+    drafts = day_drafts(selected_date, performance, activity, session_type, note_signature())
+    activities = Activity.query.filter_by(active=True).order_by(Activity.name).all()
+
+    return render_template(
+        'soap_notes_day.html',
+        drafts=drafts,
+        selected_date=selected_date.isoformat(),
+        performance=performance,
+        performance_options=PERFORMANCE_OPTIONS,
+        activity=request.args.get('activity', ''),
+        activities=activities,
+        session_type=session_type,
+    )
+
+
 @routes_bp.route('/soap_notes')
 def view_soap_notes():
     filter_student = request.args.get('filter_student', type=int)
     filter_start_date = request.args.get('start_date')
     filter_end_date = request.args.get('end_date')
 
-    students = Student.query.filter_by(active=True).order_by(Student.last_name, Student.first_name).all()
-    query = SoapNote.query.join(SoapNote.student)
+    include_archive = request.args.get('include_archive', type=int)
+
+    students = active_students(order='last_name')
+    Note = history_entity(SoapNote) if include_archive else SoapNote
+    # Outer join: archived notes may belong to students that were archived too
+    query = db.session.query(Note).outerjoin(Note.student).options(contains_eager(Note.student))
     if filter_student:
-        query = query.filter(SoapNote.student_id == filter_student)
+        query = query.filter(Note.student_id == filter_student)
     if filter_start_date:
         try:
             dt1 = datetime.strptime(filter_start_date, '%Y-%m-%d').date()
-            query = query.filter(SoapNote.note_date >= dt1)
+            query = query.filter(Note.note_date >= dt1)
         except ValueError:
             flash('Invalid start date format.', 'warning')
     if filter_end_date:
         try:
             dt2 = datetime.strptime(filter_end_date, '%Y-%m-%d').date()
-            query = query.filter(SoapNote.note_date <= dt2)
+            query = query.filter(Note.note_date <= dt2)
         except ValueError:
             flash('Invalid end date format.', 'warning')
 
-    soap_notes = query.order_by(SoapNote.note_date.desc()).all()
+    soap_notes = query.order_by(Note.note_date.desc()).all()
 
     return render_template(
         'view_soap_notes.html',
@@ -256,6 +313,7 @@ def view_soap_notes():
         filter_student=filter_student,
         filter_start_date=filter_start_date,
         filter_end_date=filter_end_date,
+        include_archive=include_archive,
     )
 
 
@@ -264,32 +322,35 @@ def export_soap_notes_csv():
     filter_student = request.args.get('filter_student', type=int)
     filter_start_date = request.args.get('start_date')
     filter_end_date = request.args.get('end_date')
+    include_archive = request.args.get('include_archive', type=int)
 
-    query = SoapNote.query.join(SoapNote.student)
+    Note = history_entity(SoapNote) if include_archive else SoapNote
+    # Outer join: archived notes may belong to students that were archived too
+    query = db.session.query(Note).outerjoin(Note.student).options(contains_eager(Note.student))
     if filter_student:
-        query = query.filter(SoapNote.student_id == filter_student)
+        query = query.filter(Note.student_id == filter_student)
     if filter_start_date:
         try:
             dt1 = datetime.strptime(filter_start_date, '%Y-%m-%d').date()
-            query = query.filter(SoapNote.note_date >= dt1)
+            query = query.filter(Note.note_date >= dt1)
         except ValueError:
             pass
     if filter_end_date:
         try:
             dt2 = datetime.strptime(filter_end_date, '%Y-%m-%d').date()
-            query = query.filter(SoapNote.note_date <= dt2)
+            query = query.filter(Note.note_date <= dt2)
         except ValueError:
             pass
 
-    soap_notes = query.order_by(SoapNote.note_date.desc()).all()
+    soap_notes = query.order_by(Note.note_date.desc()).all()
+    anonymizer = NameAnonymizer.from_session(db.session)
 
     si = StringIO()
     cw = csv.writer(si)
     cw.writerow(['Note ID', 'Student ID', 'Date', 'Student', 'Note Text'])
     for note in soap_notes:
-        first_name = note.student.first_name
-        anonymized_text = note.note_text.replace(first_name, str(note.student_id))
-        full_name = f"{note.student.first_name} {note.student.last_name}"
+        anonymized_text = anonymizer.scrub(note.note_text, note.student_id)
+        full_name = f"{note.student.first_name} {note.student.last_name}" if note.student else 'Archived student'
         cw.writerow([
             note.soap_note_id,
             note.student_id,
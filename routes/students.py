@@ -1,16 +1,20 @@
 from datetime import datetime
 
-from flask import request, render_template, redirect, url_for, flash
-from sqlalchemy.orm import joinedload
+from flask import request, render_template, redirect, url_for, flash, jsonify
+from sqlalchemy import select
 
 from . import routes_bp
-from models import Student, Objective, Goal, TrialLog, db
+from roster import active_students
+from archive import history_entity
+from trial_stats import trial_log_page
+from student_profile import student_profile, student_profile_or_404
+from models import Student, Objective, Goal, TrialLog, Event, db
 
 
 @routes_bp.route('/trial_log', methods=['GET', 'POST'])
 def trial_log():
     """Handle trial log submissions and display objectives for a student."""
-    students = Student.query.filter_by(active=True).order_by(Student.first_name).all()
+    students = active_students()
     selected_student_id = request.args.get('student_id')
 
     if request.method == 'POST':
@@ -77,13 +81,11 @@ def trial_log():
     objectives = []
     if selected_student_id:
         try:
-            selected_student_id_int = int(selected_student_id)
-            objectives = Objective.query.filter(
-                Objective.goal.has(Goal.student_id == selected_student_id_int),
-                Objective.active
-            ).all()
+            profile = student_profile(int(selected_student_id))
         except ValueError:
-            objectives = []
+            profile = None
+        if profile:
+            objectives = [objective for objective in profile.objectives if objective.active]
 
     return render_template(
         'trial_log.html',
@@ -121,9 +123,7 @@ def add_student():
 
 @routes_bp.route('/edit_student/<int:student_id>', methods=['GET', 'POST'])
 def edit_student(student_id):
-    student = Student.query.get_or_404(student_id)
-    goals = Goal.query.filter_by(student_id=student_id).all()
-    objectives = Objective.query.join(Goal).filter(Goal.student_id == student_id).all()
+    student, goals, objectives, _ = student_profile_or_404(student_id)
 
     if request.method == 'POST':
         student.first_name = request.form['first_name']
@@ -259,23 +259,76 @@ def student_search():
 @routes_bp.route('/student/<int:student_id>/trial_logs')
 def student_trial_logs(student_id):
     student = Student.query.get_or_404(student_id)
-    trial_logs = (
-        TrialLog.query
-        .filter_by(student_id=student_id)
-        .options(joinedload(TrialLog.objective))
-        .order_by(TrialLog.date_of_session.desc())
-        .all()
-    )
-    legacy_logs = [log for log in trial_logs if log.uses_legacy_system()]
-    new_logs = [log for log in trial_logs if log.uses_new_system()]
+    include_archive = request.args.get('include_archive', type=int)
     return render_template(
         'student_trial_logs.html',
         student=student,
-        legacy_logs=legacy_logs,
-        new_logs=new_logs,
+        include_archive=include_archive,
     )
 
 
+# Columns sent for each scheme; the history tables render exactly these
+HISTORY_FIELDS = {
+    'new': (
+        'total_trials', 'percent_independent', 'percent_minimal_support',
+        'percent_moderate_support', 'percent_maximal_support', 'percent_up_to_minimal_support',
+        'percent_up_to_moderate_support', 'percent_up_to_maximal_support',
+    ),
+    'legacy': (
+        'total_trials', 'percent_no_support', 'percent_with_1_cue',
+        'percent_visual_verbal_cues', 'percent_with_modeling',
+    ),
+}
+
+
+def _session_status(Ev, student_id, days):
+    """Status of the first session on each of ``days``."""
+    status = {}
+    if days:
+        rows = db.session.execute(
+            select(Ev.date_of_session, Ev.status)
+            .where(Ev.student_id == student_id, Ev.event_type == 'Session', Ev.date_of_session.in_(days))
+            .order_by(Ev.date_of_session, Ev.time_of_start)
+        )
+        for day, value in rows:
+            status.setdefault(day, value)
+    return status
+
+
+@routes_bp.route('/api/student/<int:student_id>/trial_logs')
+def student_trial_log_history(student_id):
+    """One chunk of a student's trial logs as JSON, newest first."""
+    scheme = request.args.get('scheme', 'new')
+    if scheme not in HISTORY_FIELDS:
+        return jsonify({'error': "scheme must be 'new' or 'legacy'"}), 400
+    include_archive = request.args.get('include_archive', type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    Log = history_entity(TrialLog) if include_archive else TrialLog
+    try:
+        rows, next_cursor = trial_log_page(Log, scheme, student_id, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({'error': 'invalid cursor'}), 400
+
+    status = {}
+    if request.args.get('with_status', type=int):
+        Ev = history_entity(Event) if include_archive else Event
+        status = _session_status(Ev, student_id, {row.date_of_session for row in rows})
+
+    return jsonify({
+        'rows': [
+            {
+                'date': row.date_of_session.isoformat(),
+                'status': status.get(row.date_of_session, ''),
+                'objective': row.objective_description,
+                'notes': row.notes or '',
+                **{field: getattr(row, field) for field in HISTORY_FIELDS[scheme]},
+            }
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
 @routes_bp.route('/students')
 def students():
     grade_filter = request.args.get('grade')
@@ -288,7 +341,11 @@ def students():
 
 @routes_bp.route('/student/<int:student_id>')
 def student_info(student_id):
-    student = Student.query.get_or_404(student_id)
-    goals = Goal.query.filter_by(student_id=student_id).all()
-    objectives = Objective.query.join(Goal).filter(Goal.student_id == student_id).all()
-    return render_template('student_info.html', student=student, goals=goals, objectives=objectives)
+    student, goals, objectives, recent_logs = student_profile_or_404(student_id, recent_logs=1)
+    return render_template(
+        'student_info.html',
+        student=student,
+        goals=goals,
+        objectives=objectives,
+        recent_logs=recent_logs,
+    )
@@ -0,0 +1,99 @@
+"""Bulk status changes for session events.
+
+``apply_status_changes`` takes many ``(event_id, status)`` pairs, checks
+every one against the current status and ``STATUS_TRANSITIONS``, and only
+if all are valid applies them in one transaction with a single
+``UPDATE ... WHERE event_id IN (...)`` per status change. Each UPDATE also
+requires the status it was validated against, so a session changed by
+another request in between is not moved along a forbidden transition. A
+batch with any invalid or conflicting pair changes nothing and reports
+each problem.
+"""
+
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select, update
+
+from models import Event, db
+from template_cache import bump_data_version
+
+SESSION_STATUSES = ('Scheduled', 'Completed', 'Makeup Needed', 'Excused Absence')
+
+# Statuses a session may move to from each status; anything marked can be
+# put back to Scheduled to undo a mistake
+STATUS_TRANSITIONS = {
+    'Scheduled': {'Completed', 'Makeup Needed', 'Excused Absence'},
+    'Makeup Needed': {'Scheduled', 'Completed', 'Excused Absence'},
+    'Completed': {'Scheduled'},
+    'Excused Absence': {'Scheduled'},
+}
+
+StatusError = namedtuple('StatusError', ['event_id', 'message'])
+StatusChangeResult = namedtuple('StatusChangeResult', ['updated', 'unchanged', 'errors'])
+
+
+def _validate(changes, current):
+    errors = []
+    for event_id, status in changes.items():
+        if status not in SESSION_STATUSES:
+            errors.append(StatusError(event_id, f"unknown status {status!r}"))
+        elif event_id not in current:
+            errors.append(StatusError(event_id, "no active session with this id"))
+        elif status != current[event_id] and status not in STATUS_TRANSITIONS.get(current[event_id], ()):
+            errors.append(StatusError(event_id, f"cannot change {current[event_id]!r} to {status!r}"))
+    return errors
+
+
+def apply_status_changes(pairs):
+    """Apply ``(int event_id, status)`` pairs atomically and return a ``StatusChangeResult``.
+
+    A later pair for the same event wins. Pairs that match the current
+    status are counted as unchanged and not written.
+    """
+    changes = dict(pairs)
+    if not changes:
+        return StatusChangeResult(0, 0, [])
+
+    current = dict(db.session.execute(
+        select(Event.event_id, Event.status).where(
+            Event.event_id.in_(changes),
+            Event.event_type == 'Session',
+            Event.active.is_(True),
+        )
+    ).all())
+    errors = _validate(changes, current)
+    if errors:
+        return StatusChangeResult(0, 0, errors)
+
+    by_change = defaultdict(list)
+    for event_id, status in changes.items():
+        if status != current[event_id]:
+            by_change[current[event_id], status].append(event_id)
+
+    updated = 0
+    try:
+        for (previous, status), event_ids in by_change.items():
+            count = db.session.execute(
+                update(Event).where(
+                    Event.event_id.in_(event_ids),
+                    Event.status == previous,
+                    Event.active.is_(True),
+                ).values(status=status),
+                execution_options={'synchronize_session': False},
+            ).rowcount
+            if count != len(event_ids):
+                # Another request changed one of these since it was validated
+                db.session.rollback()
+                return StatusChangeResult(0, 0, [
+                    StatusError(event_id, f"no longer {previous!r}; reload and try again")
+                    for event_id in event_ids
+                ])
+            updated += count
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if updated:
+        # Core updates bypass the flush-based cache invalidation
+        bump_data_version(Event.__tablename__)
+    return StatusChangeResult(updated, len(changes) - updated, [])
@@ -0,0 +1,35 @@
+"""Which clinician's database the current request uses.
+
+With clinician sharding on, ``clinicians.init_clinician_routing`` puts the
+request's clinician and its engine on ``flask.g``. ``ShardSession`` sends
+every ``db.session`` query to that engine. In-process caches (roster, data
+versions, template fragments, the dashboard) key their entries on
+``current_shard()``. Without sharding it returns None and the app's own
+engine is used. Features that hook an engine (SQL profiling, metrics,
+scheduled backups) register with ``on_shard_engine`` to hook each
+clinician's engine as well.
+"""
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+
+def on_shard_engine(app, hook):
+    """Call ``hook(slug, engine)`` for every clinician engine ``app`` opens."""
+    app.extensions.setdefault('shard_engine_hooks', []).append(hook)
+
+
+def current_shard():
+    """Slug of the clinician whose database this request uses, or None."""
+    return g.get('clinician') if has_app_context() else None
+
+
+class ShardSession(Session):
+    """Flask-SQLAlchemy session bound to the request's clinician database."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            engine = g.get('shard_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
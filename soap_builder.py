@@ -0,0 +1,218 @@
+"""SOAP note text assembly shared by the single-note form and day drafts.
+
+``build_note`` turns session details into the S/O/A/P sections using the
+note templates below, which are formatted directly instead of being
+assembled piece by piece in each route. ``day_drafts`` builds a draft for
+every completed session on a day from its ``Event`` and ``TrialLog`` rows,
+using a fixed number of queries regardless of how many sessions there were.
+"""
+
+import re
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+
+from models import Event, Objective, Student, TrialLog, db
+
+PRONOUN_MAP = {
+    'he/him': ('he', 'his', 'him'),
+    'she/her': ('she', 'her', 'her'),
+    'they/them': ('they', 'their', 'them'),
+    'other': ('they', 'their', 'them'),
+}
+
+PERFORMANCE_OPTIONS = (
+    ('Attentive', 'engaged and focused on all tasks with minimal redirection needed'),
+    ('Slightly Distracted', 'somewhat distracted during the session but was able to be redirected back to the task'),
+    ('Distracted', 'easily distracted and required frequent redirection to stay on task'),
+    ('Motivated', 'highly motivated and enthusiastic, showing strong interest in tasks'),
+    ('Tired', 'visibly tired, showing reduced enthusiasm for tasks and needing support to stay focused'),
+    ('Minimal Participation', 'not consistently engaged and needed multiple prompts to participate in tasks'),
+)
+
+COUNTED_STATUSES = ('Completed', 'Excused Absence')
+
+S_TEMPLATE = (
+    "{month} Session {session_number}/{total_sessions}: {first_name} attended {possessive} "
+    "{session_type} speech therapy session. {Subject} {be} {performance}."
+)
+O_ACTIVITY_TEMPLATE = "{Subject} {be} given {activity}."
+O_TARGET_TEMPLATE = " {Subject} {be} able to {objective} with {accuracy}% accuracy {support_level}."
+A_TEMPLATES = {
+    (True, True): "{Subject} benefited from visual and verbal cues. Visual cues included {visual}. Verbal cues included {verbal}.",
+    (True, False): "{Subject} benefited from visual cues. Visual cues included {visual}.",
+    (False, True): "{Subject} benefited from verbal cues. Verbal cues included {verbal}.",
+    (False, False): "{Subject} did not require visual or verbal cues during this session.",
+}
+P_TEMPLATE = 'Continue to target IEP goals. -{signature}'
+FULL_TEMPLATE = "S: {s}\nO: {o}\nA: {a}\nP: {p}"
+
+Pronouns = namedtuple('Pronouns', ['subject', 'possessive', 'object', 'be'])
+SoapParts = namedtuple('SoapParts', ['s_note', 'o_note', 'a_note', 'p_note', 'full_note'])
+Target = namedtuple('Target', ['objective', 'accuracy', 'support_level'])
+SoapDraft = namedtuple('SoapDraft', ['event_id', 'student_id', 'student_name', 'time_of_start', 'parts'])
+
+# Trial log notes start with "Supports provided: Visual: a, b; Verbal: c."
+_CUES = re.compile(r'(Visual|Verbal): ([^;.]*)')
+
+
+def resolve_pronouns(pronouns):
+    """Map a free-text pronoun field to subject/possessive/object forms."""
+    if pronouns:
+        key = pronouns.lower().strip()
+        if key not in PRONOUN_MAP:
+            if 'she' in key:
+                key = 'she/her'
+            elif 'he' in key:
+                key = 'he/him'
+            else:
+                key = 'they/them'
+    else:
+        key = 'they/them'
+    subject, possessive, obj = PRONOUN_MAP.get(key, ('they', 'their', 'them'))
+    return Pronouns(subject, possessive, obj, 'was' if subject in ('he', 'she') else 'were')
+
+
+def format_list(items):
+    """Join cue names as ``a``, ``a and b`` or ``a, b, and c`` in lower case."""
+    if len(items) == 1:
+        return items[0].lower()
+    if len(items) == 2:
+        return f"{items[0].lower()} and {items[1].lower()}"
+    return f"{', '.join(item.lower() for item in items[:-1])}, and {items[-1].lower()}"
+
+
+def parse_cues(notes):
+    """Return ``(visual, verbal)`` cue lists recorded in trial log notes."""
+    cues = {'Visual': [], 'Verbal': []}
+    for kind, names in _CUES.findall(notes or ''):
+        cues[kind].extend(name.strip() for name in names.split(',') if name.strip())
+    return cues['Visual'], cues['Verbal']
+
+
+def build_note(first_name, pronouns, *, month, session_number, total_sessions, performance,
+               session_type, activity, targets, visual_cues=(), verbal_cues=(),
+               additional_s='', additional_o='', signature=''):
+    """Assemble the S/O/A/P sections; ``targets`` is a sequence of ``Target``.
+
+    ``signature`` is the clinician's name and credentials closing the P section.
+    """
+    p = resolve_pronouns(pronouns)
+    words = {'Subject': p.subject.capitalize(), 'be': p.be}
+
+    s_note = S_TEMPLATE.format(
+        month=month, session_number=session_number, total_sessions=total_sessions,
+        first_name=first_name, possessive=p.possessive, session_type=session_type.lower(),
+        performance=performance, **words,
+    )
+    if additional_s:
+        s_note += f" {additional_s}"
+
+    o_note = O_ACTIVITY_TEMPLATE.format(activity=activity.lower(), **words)
+    for target in targets:
+        o_note += O_TARGET_TEMPLATE.format(**target._asdict(), **words)
+    if additional_o:
+        o_note += f" {additional_o}"
+
+    a_note = A_TEMPLATES[bool(visual_cues), bool(verbal_cues)].format(
+        visual=format_list(visual_cues) if visual_cues else 'N/A',
+        verbal=format_list(verbal_cues) if verbal_cues else 'N/A',
+        **words,
+    )
+    p_note = P_TEMPLATE.format(signature=signature)
+    full_note = FULL_TEMPLATE.format(s=s_note, o=o_note, a=a_note, p=p_note)
+    return SoapParts(s_note, o_note, a_note, p_note, full_note)
+
+
+def log_target(log, objective):
+    """Describe one trial log as an O-section ``Target``."""
+    if log.scheme in ('new', 'both'):
+        accuracy = log.pct_correct_new
+        if log.pct_independent >= accuracy:
+            support = 'independently'
+        elif log.pct_up_to_minimal >= accuracy:
+            support = 'given minimal support'
+        elif log.pct_up_to_moderate >= accuracy:
+            support = 'given moderate support'
+        else:
+            support = 'given maximal support'
+    else:
+        accuracy = log.pct_correct_legacy
+        support = 'independently' if log.pct_no_support >= accuracy else 'given cues'
+    return Target(objective or '[objective]', f"{accuracy:g}", support)
+
+
+def day_drafts(day, performance, activity, session_type='Individual', signature=''):
+    """Return a ``SoapDraft`` for each completed session on ``day``.
+
+    Session numbers count completed or excused sessions in the month up to
+    and including each event; ``monthly_services`` supplies the total.
+    """
+    events = db.session.execute(
+        select(Event, Student)
+        .join(Student, Student.student_id == Event.student_id)
+        .where(
+            Event.date_of_session == day,
+            Event.event_type == 'Session',
+            Event.active.is_(True),
+            Event.status == 'Completed',
+        )
+        .order_by(Event.time_of_start, Event.event_id)
+    ).all()
+    if not events:
+        return []
+    student_ids = {student.student_id for _, student in events}
+
+    month_events = db.session.execute(
+        select(Event.event_id, Event.student_id)
+        .where(
+            Event.student_id.in_(student_ids),
+            Event.event_type == 'Session',
+            Event.active.is_(True),
+            Event.status.in_(COUNTED_STATUSES),
+            Event.date_of_session >= day.replace(day=1),
+            Event.date_of_session <= day,
+        )
+        .order_by(Event.date_of_session, Event.time_of_start, Event.event_id)
+    ).all()
+    session_numbers, seen = {}, defaultdict(int)
+    for event_id, student_id in month_events:
+        seen[student_id] += 1
+        session_numbers[event_id] = seen[student_id]
+
+    logs_by_student = defaultdict(list)
+    for log, objective in db.session.execute(
+        select(TrialLog, Objective.objective_description)
+        .outerjoin(Objective, Objective.objective_id == TrialLog.objective_id)
+        .where(TrialLog.student_id.in_(student_ids), TrialLog.date_of_session == day)
+        .order_by(TrialLog.trial_log_id)
+    ):
+        logs_by_student[log.student_id].append((log, objective))
+
+    month = day.strftime('%B')
+    drafts = []
+    for event, student in events:
+        logs = [(log, objective) for log, objective in logs_by_student[student.student_id] if log.scheme]
+        visual, verbal = [], []
+        for log, _ in logs:
+            log_visual, log_verbal = parse_cues(log.notes)
+            visual += [cue for cue in log_visual if cue not in visual]
+            verbal += [cue for cue in log_verbal if cue not in verbal]
+        parts = build_note(
+            student.first_name, student.pronouns,
+            month=month,
+            session_number=session_numbers.get(event.event_id, 1),
+            total_sessions=student.monthly_services or '?',
+            performance=performance,
+            session_type=session_type,
+            activity=activity,
+            targets=[log_target(log, objective) for log, objective in logs] or [Target('[objective]', '[accuracy]', '[support]')],
+            visual_cues=visual,
+            verbal_cues=verbal,
+            signature=signature,
+        )
+        drafts.append(SoapDraft(
+            event.event_id, student.student_id, f"{student.first_name} {student.last_name}",
+            event.time_of_start, parts,
+        ))
+    return drafts
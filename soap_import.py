@@ -0,0 +1,183 @@
+"""Streamed bulk import of SOAP notes from CSV or JSONL.
+
+Rows are read one at a time from the uploaded file, student references are
+resolved against a name/id map loaded once up front, and valid rows are
+inserted in batches with one executemany INSERT and commit per batch.
+Invalid rows are skipped and reported with their line number so the rest of
+a large historical import still goes through.
+"""
+
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from models import SoapNote, Student, db
+from template_cache import bump_data_version
+
+RowError = namedtuple('RowError', ['line', 'message'])
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y')
+
+# Accepted column names (lower-cased, spaces as underscores) for each field;
+# the first set matches the CSV written by the SOAP note export
+FIELD_ALIASES = {
+    'student_id': ('student_id', 'id'),
+    'student': ('student', 'student_name', 'name'),
+    'date': ('date', 'note_date'),
+    'text': ('note_text', 'text', 'note'),
+}
+
+
+class ImportReport:
+    """Counts and per-row errors for one import."""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.errors.append(RowError(line, message))
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'errors': [error._asdict() for error in self.errors],
+        }
+
+
+def _name_key(name):
+    return ' '.join(name.lower().replace(',', ' ').split())
+
+
+def student_lookup():
+    """Return ``(ids, names)``: known student ids and name -> id (None if ambiguous)."""
+    ids, names = set(), {}
+    rows = db.session.execute(
+        select(Student.student_id, Student.first_name, Student.last_name, Student.preferred_name)
+    )
+    for student_id, first, last, preferred in rows:
+        ids.add(student_id)
+        keys = {_name_key(f"{first} {last}"), _name_key(f"{last} {first}")}
+        if preferred:
+            keys.add(_name_key(f"{preferred} {last}"))
+        for key in keys:
+            names[key] = None if key in names and names[key] != student_id else student_id
+    return ids, names
+
+
+def _normalize(record):
+    fields = {key.strip().lower().replace(' ', '_'): value for key, value in record.items() if key}
+    return {
+        field: next((fields[alias] for alias in aliases if fields.get(alias) not in (None, '')), None)
+        for field, aliases in FIELD_ALIASES.items()
+    }
+
+
+def iter_records(stream, fmt):
+    """Yield ``(line_number, record_or_error)`` from a binary ``stream``.
+
+    ``fmt`` is ``'csv'`` or ``'jsonl'``. A record is a dict of the fields in
+    ``FIELD_ALIASES``; unparseable lines yield an error string instead.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, _normalize(record)
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, f"invalid JSON: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "expected a JSON object"
+            continue
+        yield line_number, _normalize({key: str(value) if value is not None else None for key, value in record.items()})
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognized date '{value}'")
+
+
+def import_soap_notes(stream, fmt, batch_size=500):
+    """Insert the notes in ``stream``; return an ``ImportReport``."""
+    report = ImportReport()
+    ids, names = student_lookup()
+    batch = []
+
+    def flush():
+        if batch:
+            db.session.execute(insert(SoapNote), batch)
+            db.session.commit()
+            report.inserted += len(batch)
+            batch.clear()
+
+    try:
+        for line, record in iter_records(stream, fmt):
+            report.rows += 1
+            if isinstance(record, str):
+                report.error(line, record)
+                continue
+
+            student_id = None
+            if record['student_id']:
+                try:
+                    student_id = int(record['student_id'])
+                except ValueError:
+                    report.error(line, f"invalid student id '{record['student_id']}'")
+                    continue
+                if student_id not in ids:
+                    report.error(line, f"unknown student id {student_id}")
+                    continue
+            elif record['student']:
+                key = _name_key(record['student'])
+                if key not in names:
+                    report.error(line, f"unknown student '{record['student']}'")
+                    continue
+                student_id = names[key]
+                if student_id is None:
+                    report.error(line, f"ambiguous student name '{record['student']}'; use student_id")
+                    continue
+            else:
+                report.error(line, "missing student or student_id")
+                continue
+
+            if not record['date']:
+                report.error(line, "missing date")
+                continue
+            try:
+                note_date = _parse_date(record['date'])
+            except ValueError as exc:
+                report.error(line, str(exc))
+                continue
+
+            note_text = (record['text'] or '').strip()
+            if not note_text:
+                report.error(line, "missing note text")
+                continue
+
+            batch.append({'student_id': student_id, 'note_date': note_date, 'note_text': note_text})
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        # Also after a decode or CSV error, which leaves earlier batches
+        # committed; Core inserts bypass the flush-based cache invalidation
+        if report.inserted:
+            bump_data_version(SoapNote.__tablename__)
+    return report
@@ -0,0 +1,73 @@
+"""One eager-loaded Student -> Goals -> Objectives graph per request.
+
+The profile, edit and trial-log pages all need a student with every goal
+and objective. ``student_profile`` loads that graph with ``selectinload``
+(one statement per level, however many goals there are) so the templates'
+``student.goals``/``goal.objectives`` loops never lazy-load. With
+``recent_logs`` it also fetches the latest trial logs of each objective in
+one windowed query. Profiles are kept on ``flask.g`` for the rest of the
+request, so helpers asking for the same student reuse the loaded objects.
+"""
+
+from collections import defaultdict, namedtuple
+
+from flask import abort, g
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased, selectinload
+
+from models import Goal, Student, TrialLog, db
+
+StudentProfile = namedtuple('StudentProfile', ['student', 'goals', 'objectives', 'recent_logs'])
+
+
+def _recent_logs(student_id, per_objective):
+    """``{objective_id: [TrialLog, ...]}``, newest first, at most ``per_objective`` each."""
+    ranked = (
+        select(
+            TrialLog,
+            func.row_number().over(
+                partition_by=TrialLog.objective_id,
+                order_by=(TrialLog.date_of_session.desc(), TrialLog.trial_log_id.desc()),
+            ).label('position'),
+        )
+        .where(TrialLog.student_id == student_id, TrialLog.objective_id.is_not(None))
+        .subquery()
+    )
+    Log = aliased(TrialLog, ranked)
+    logs = defaultdict(list)
+    for log in db.session.scalars(
+        select(Log).where(ranked.c.position <= per_objective).order_by(ranked.c.position)
+    ):
+        logs[log.objective_id].append(log)
+    return logs
+
+
+def student_profile(student_id, recent_logs=0):
+    """Return the ``StudentProfile`` for ``student_id``, or None if there is no such student."""
+    cache = g.setdefault('student_profiles', {})
+    key = (student_id, recent_logs)
+    if key in cache:
+        return cache[key]
+
+    student = db.session.scalars(
+        select(Student)
+        .where(Student.student_id == student_id)
+        .options(selectinload(Student.goals).selectinload(Goal.objectives))
+    ).first()
+    profile = None
+    if student is not None:
+        profile = StudentProfile(
+            student,
+            student.goals,
+            [objective for goal in student.goals for objective in goal.objectives],
+            _recent_logs(student_id, recent_logs) if recent_logs else {},
+        )
+    cache[key] = profile
+    return profile
+
+
+def student_profile_or_404(student_id, recent_logs=0):
+    profile = student_profile(student_id, recent_logs)
+    if profile is None:
+        abort(404)
+    return profile
@@ -0,0 +1,201 @@
+"""Template fragment caching and persistent Jinja bytecode cache.
+
+Templates wrap expensive, rarely-changing markup (roster dropdowns, the
+activity list, the navbar) in ``{% cache 'name', key... %}...{% endcache %}``.
+Keys normally include ``data_version('table', ...)``, a per-table counter that
+is bumped whenever rows of that table are flushed, so a fragment is reused
+until the data behind it changes. Writes this process cannot see flush, from
+other workers, ``manage.py`` (restore, archive, imports) or any other
+SQLite client, are caught by a ``DatabaseWatcher`` polling SQLite's own
+``PRAGMA data_version`` before each request; when it moves, every version
+of that database is bumped. Versions and fragments are kept per clinician
+database (``shards.current_shard``).
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from shards import current_shard
+
+_table_versions = {}
+_versions_lock = threading.Lock()
+
+
+def data_version(*tables):
+    """Return the current version tuple for the given table names."""
+    shard = current_shard()
+    return tuple(_table_versions.get((shard, table), 0) for table in tables)
+
+
+def bump_data_version(*tables):
+    """Mark the given tables as changed."""
+    shard = current_shard()
+    with _versions_lock:
+        for table in tables:
+            key = (shard, table)
+            _table_versions[key] = _table_versions.get(key, 0) + 1
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    tables = {
+        getattr(obj, '__tablename__', None)
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    }
+    tables.discard(None)
+    if tables:
+        session.info.setdefault('flushed_tables', set()).update(tables)
+        bump_data_version(*tables)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _bump_committed_tables(session):
+    # Fragments rendered between flush and commit may have captured
+    # uncommitted or pre-commit data under the new version.
+    tables = session.info.pop('flushed_tables', None)
+    if tables:
+        bump_data_version(*tables)
+
+
+class DatabaseWatcher:
+    """Notices commits to an SQLite database made through other connections.
+
+    ``PRAGMA data_version`` on a connection changes whenever any other
+    connection, in this process or another, commits to the file. The
+    watcher keeps one idle connection of its own for asking, so every
+    commit counts, including the app's own.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._version = None
+
+    def changed(self):
+        """True if the database was committed to since the last call (or on the first)."""
+        with self._lock:
+            # A connection must not be used across fork
+            if self._conn is None or self._conn_pid != os.getpid():
+                self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+                self._conn_pid = os.getpid()
+                self._version = None
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            changed = version != self._version
+            self._version = version
+            return changed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class FragmentCache:
+    """Bounded, thread-safe LRU store for rendered template fragments."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the ``{% cache key, ... %}...{% endcache %}`` tag."""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # The token changes whenever the template is recompiled, so edited
+        # templates never serve fragments rendered from the old source.
+        token = f"{parser.name}:{lineno}:{uuid.uuid4().hex}"
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_render_cached', [nodes.Const(token), nodes.List(keys)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, token, keys, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = (token, current_shard(), *keys)
+        rv = cache.get(key)
+        if rv is None:
+            rv = caller()
+            cache.set(key, rv)
+        return rv
+
+
+def init_template_cache(app, db):
+    """Enable fragment caching and the on-disk bytecode cache for ``app``."""
+    env = app.jinja_env
+    env.add_extension(FragmentCacheExtension)
+    env.globals['data_version'] = data_version
+
+    if app.config.get('TEMPLATE_FRAGMENT_CACHE', True):
+        env.fragment_cache = FragmentCache(app.config.get('TEMPLATE_FRAGMENT_CACHE_SIZE', 512))
+
+    bytecode_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if bytecode_dir:
+        bytecode_dir = Path(bytecode_dir)
+        bytecode_dir.mkdir(parents=True, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(str(bytecode_dir))
+
+    # One watcher per engine, so a clinician engine evicted from the cache
+    # takes its watcher (and connection) with it
+    watchers = weakref.WeakKeyDictionary()
+    watchers_lock = threading.Lock()
+
+    @app.before_request
+    def _reload_after_external_writes():
+        engine = db.session.get_bind()
+        db_path = engine.url.database
+        if engine.dialect.name != 'sqlite' or not db_path or db_path == ':memory:':
+            return
+        with watchers_lock:
+            watcher = watchers.get(engine)
+            if watcher is None:
+                watcher = watchers[engine] = DatabaseWatcher(db_path)
+        if watcher.changed():
+            bump_data_version(*db.metadata.tables)
@@ -0,0 +1,226 @@
+"""Columnar, memory-mapped snapshot of ``trial_log`` for caseload analytics.
+
+Each column (ids, session day, the eleven trial counts) is a ``.npy`` file
+opened with ``mmap_mode='r'``, so readers share the OS page cache and pay
+nothing for columns they do not touch. A snapshot lives in its own
+``v<N>`` directory; ``current.json`` names the live one and is swapped
+atomically, so readers never see a half-written snapshot.
+
+``refresh_snapshot`` appends only the rows added since the last build.
+Triggers created by ``ensure_change_counter`` count every UPDATE and DELETE
+on ``trial_log``, and every INSERT below its highest id, in
+``trial_log_changes``. When that count (or the database's random token)
+differs from the one the snapshot was built at, logs were edited, deleted
+or archived in the meantime and the snapshot is rebuilt from scratch.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the app and manage.py may build at the same time
+    fcntl = None
+
+CURRENT = 'current.json'
+FORMAT_VERSION = 3
+
+COUNT_COLUMNS = (
+    'correct_no_support', 'correct_visual_cue', 'correct_verbal_cue',
+    'correct_visual_verbal_cue', 'correct_modeling', 'incorrect',
+    'independent', 'minimal_support', 'moderate_support', 'maximal_support', 'incorrect_new',
+)
+COLUMNS = {
+    'trial_log_id': np.int64,
+    'student_id': np.int32,
+    'objective_id': np.int32,  # -1 where the log has no objective
+    'day': 'datetime64[D]',
+    **{name: np.int32 for name in COUNT_COLUMNS},
+}
+
+_SELECT = (
+    "SELECT trial_log_id, student_id, coalesce(objective_id, -1), "
+    "CAST(julianday(date_of_session) - 2440587.5 AS INTEGER), "
+    + ', '.join(f'coalesce({name}, 0)' for name in COUNT_COLUMNS)
+    + " FROM trial_log"
+)
+
+CHANGES_TABLE = 'trial_log_changes'
+_BUMP = f"UPDATE {CHANGES_TABLE} SET changes = changes + 1 WHERE id = 1;"
+_CHANGE_TRIGGERS = {
+    'trial_log_changes_update': "AFTER UPDATE ON trial_log",
+    'trial_log_changes_delete': "AFTER DELETE ON trial_log",
+    # Appends are picked up by id; only an insert below the newest id is a change
+    'trial_log_changes_insert': (
+        "AFTER INSERT ON trial_log WHEN NEW.trial_log_id < (SELECT max(trial_log_id) FROM trial_log)"
+    ),
+}
+
+RefreshResult = namedtuple('RefreshResult', ['version', 'rows', 'added', 'mode', 'seconds'])
+
+
+class TrialSnapshot:
+    """Read-only view of one snapshot; ``snapshot['independent']`` is an array."""
+
+    def __init__(self, path, meta):
+        self.path = Path(path)
+        self.meta = meta
+        self.version = meta['version']
+        self.rows = meta['rows']
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            if name not in COLUMNS:
+                raise KeyError(name)
+            self._arrays[name] = np.load(self.path / f'{name}.npy', mmap_mode='r')
+        return self._arrays[name]
+
+    def __len__(self):
+        return self.rows
+
+
+def ensure_change_counter(execute):
+    """Create ``trial_log_changes`` and the triggers that keep it, if missing.
+
+    ``execute`` runs one SQL string, e.g. ``sqlite3.Connection.execute`` or
+    ``Connection.exec_driver_sql``. The table holds one row: a random token
+    naming this database and the number of changes counted so far.
+    """
+    execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} ("
+        "id INTEGER PRIMARY KEY CHECK (id = 1), token TEXT NOT NULL, changes INTEGER NOT NULL)"
+    )
+    execute(f"INSERT OR IGNORE INTO {CHANGES_TABLE} (id, token, changes) VALUES (1, lower(hex(randomblob(8))), 0)")
+    for name, when in _CHANGE_TRIGGERS.items():
+        execute(f"CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {_BUMP} END")
+
+
+def _changes(conn):
+    """``[token, changes]`` from ``trial_log_changes``, or None without the table."""
+    try:
+        row = conn.execute(f"SELECT token, changes FROM {CHANGES_TABLE} WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return list(row) if row else None
+
+
+def _read_json(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def current_meta(snapshot_dir):
+    """Metadata of the live snapshot, or None if there is none yet."""
+    meta = _read_json(Path(snapshot_dir) / CURRENT)
+    if not meta or meta.get('format_version') != FORMAT_VERSION:
+        return None
+    return meta
+
+
+def load_snapshot(snapshot_dir):
+    """Open the live snapshot in ``snapshot_dir``, or return None."""
+    meta = current_meta(snapshot_dir)
+    if meta is None:
+        return None
+    return TrialSnapshot(Path(snapshot_dir) / f"v{meta['version']}", meta)
+
+
+def _fill(arrays, start, cursor, chunk_rows):
+    """Copy rows from ``cursor`` into ``arrays`` beginning at ``start``."""
+    names = list(COLUMNS)
+    position = start
+    while True:
+        chunk = cursor.fetchmany(chunk_rows)
+        if not chunk:
+            return position - start
+        block = np.array(chunk, dtype=np.int64)
+        end = position + len(block)
+        for index, name in enumerate(names):
+            arrays[name][position:end] = block[:, index].astype(arrays[name].dtype)
+        position = end
+
+
+def refresh_snapshot(db_path, snapshot_dir, full=False, chunk_rows=100_000):
+    """Bring the snapshot in ``snapshot_dir`` up to date with ``db_path``.
+
+    Returns a ``RefreshResult`` whose ``mode`` is ``'fresh'`` (nothing to do),
+    ``'append'`` or ``'rebuild'``.
+    """
+    started = time.perf_counter()
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(snapshot_dir / '.lock', 'w') as lock:
+        # One builder at a time (app and manage.py may race)
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        meta = None if full else current_meta(snapshot_dir)
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            # One read transaction so counts and rows come from the same state
+            conn.execute("BEGIN")
+            # Without the counter (database not migrated) every refresh rebuilds
+            changes = _changes(conn)
+            mode = 'append' if meta and changes is not None and meta.get('changes') == changes else 'rebuild'
+            since = meta['max_trial_log_id'] if mode == 'append' else 0
+            kept = meta['rows'] if mode == 'append' else 0
+            (added,) = conn.execute(
+                "SELECT count(*) FROM trial_log WHERE trial_log_id > ?", (since,)
+            ).fetchone()
+            if mode == 'append' and not added:
+                return RefreshResult(meta['version'], meta['rows'], 0, 'fresh', time.perf_counter() - started)
+
+            previous = snapshot_dir / f"v{meta['version']}" if meta else None
+            version = max([meta['version'] if meta else 0] + [
+                int(path.name[1:]) for path in snapshot_dir.glob('v*') if path.name[1:].isdigit()
+            ]) + 1
+            target = snapshot_dir / f'v{version}'
+            target.mkdir()
+            rows = kept + added
+            arrays = {
+                name: np.lib.format.open_memmap(target / f'{name}.npy', mode='w+', dtype=dtype, shape=(rows,))
+                for name, dtype in COLUMNS.items()
+            }
+            if kept:
+                for name, array in arrays.items():
+                    array[:kept] = np.load(previous / f'{name}.npy', mmap_mode='r')
+            cursor = conn.execute(
+                f"{_SELECT} WHERE trial_log_id > ? ORDER BY trial_log_id", (since,)
+            )
+            _fill(arrays, kept, cursor, chunk_rows)
+        finally:
+            conn.close()
+
+        for array in arrays.values():
+            array.flush()
+        new_meta = {
+            'format_version': FORMAT_VERSION,
+            'version': version,
+            'rows': rows,
+            'max_trial_log_id': int(arrays['trial_log_id'][-1]) if rows else since,
+            'changes': changes,
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        del arrays
+        (target / 'meta.json').write_text(json.dumps(new_meta, indent=2))
+        tmp = snapshot_dir / f'{CURRENT}.tmp'
+        tmp.write_text(json.dumps(new_meta, indent=2))
+        os.replace(tmp, snapshot_dir / CURRENT)
+
+        # Keep the previous version for readers that still have it mapped
+        for path in snapshot_dir.glob('v*'):
+            if path.is_dir() and path not in (target, previous):
+                shutil.rmtree(path, ignore_errors=True)
+
+    return RefreshResult(version, rows, added, mode, time.perf_counter() - started)
@@ -0,0 +1,223 @@
+"""SQL-side scheme classification, totals and percentages for trial logs.
+
+A trial log is recorded either with the legacy cue columns
+(``correct_no_support`` ... ``incorrect``) or with the support-level columns
+added in 2024-06 (``independent`` ... ``incorrect_new``). The ``TrialLog``
+methods compute totals and percentages per object; the expressions here do
+the same arithmetic in SQLite so list pages can fetch ready-to-render rows
+for each scheme without loading full ORM objects.
+
+Every function takes the mapped entity to query, so the same expressions
+work on ``TrialLog`` and on ``history_entity(TrialLog)``. The scheme, totals
+and key percentages come from the generated columns declared on
+``TrialLog``; ``ensure_generated_columns`` adds them (and their indexes) to
+databases created before they existed.
+"""
+
+from datetime import date
+
+from sqlalchemy import and_, case, func, literal, or_, select, tuple_
+from sqlalchemy.dialects import sqlite
+
+from models import Objective, Student, TrialLog, db
+
+LEGACY_COLUMNS = (
+    'correct_no_support', 'correct_visual_cue', 'correct_verbal_cue',
+    'correct_visual_verbal_cue', 'correct_modeling', 'incorrect',
+)
+
+
+def _value(Log, name):
+    return func.coalesce(getattr(Log, name), 0)
+
+
+def _sum(Log, names):
+    expr = literal(0)
+    for name in names:
+        expr = expr + _value(Log, name)
+    return expr
+
+
+def _percent(part, total):
+    """SQL twin of ``models.percent``; SQLite's ``round`` rounds halves away from zero."""
+    return case((total > 0, func.round(part * 100.0 / total, 1)), else_=0)
+
+
+def uses_new_system(Log=TrialLog):
+    """SQL twin of ``TrialLog.uses_new_system``."""
+    return Log.scheme.in_(('new', 'both'))
+
+
+def uses_legacy_system(Log=TrialLog):
+    """SQL twin of ``TrialLog.uses_legacy_system``."""
+    return Log.scheme.in_(('legacy', 'both'))
+
+
+def new_system_columns(Log=TrialLog):
+    """Labeled totals and percentages matching the new-scheme ``TrialLog`` methods."""
+    total = Log.new_total
+    return [
+        total.label('total_trials'),
+        Log.pct_independent.label('percent_independent'),
+        _percent(_value(Log, 'minimal_support'), total).label('percent_minimal_support'),
+        _percent(_value(Log, 'moderate_support'), total).label('percent_moderate_support'),
+        _percent(_value(Log, 'maximal_support'), total).label('percent_maximal_support'),
+        _percent(_value(Log, 'incorrect_new'), total).label('percent_incorrect_new'),
+        # percent_correct_up_to(level) for each level past 'independent'
+        Log.pct_up_to_minimal.label('percent_up_to_minimal_support'),
+        Log.pct_up_to_moderate.label('percent_up_to_moderate_support'),
+        Log.pct_correct_new.label('percent_up_to_maximal_support'),
+    ]
+
+
+def legacy_system_columns(Log=TrialLog):
+    """Labeled totals and percentages matching the legacy ``TrialLog`` methods."""
+    total = Log.legacy_total
+    return [
+        total.label('total_trials'),
+        Log.pct_no_support.label('percent_no_support'),
+        _percent(_sum(Log, LEGACY_COLUMNS[:3]), total).label('percent_with_1_cue'),
+        _percent(_sum(Log, LEGACY_COLUMNS[:4]), total).label('percent_visual_verbal_cues'),
+        Log.pct_correct_legacy.label('percent_with_modeling'),
+    ]
+
+
+def trial_log_rows(Log, scheme, *criteria, order_by=(), limit=None, with_student=False):
+    """Rows for logs of ``scheme`` (``'new'`` or ``'legacy'``) matching ``criteria``.
+
+    Each row carries ``trial_log_id``, ``student_id``, ``date_of_session``,
+    ``notes``, ``objective_description`` (``None`` without an objective),
+    optionally ``first_name``/``last_name`` (``None`` for archived students)
+    and the scheme's totals and percentages.
+    """
+    if scheme == 'new':
+        scheme_filter, stats = uses_new_system(Log), new_system_columns(Log)
+    else:
+        scheme_filter, stats = uses_legacy_system(Log), legacy_system_columns(Log)
+    base = [
+        Log.trial_log_id, Log.student_id, Log.date_of_session, Log.notes,
+        Objective.objective_description,
+    ]
+    if with_student:
+        base += [Student.first_name, Student.last_name]
+
+    query = (
+        select(*base, *stats)
+        .select_from(Log)
+        .outerjoin(Objective, Objective.objective_id == Log.objective_id)
+        .where(scheme_filter, *criteria)
+        .order_by(*order_by)
+        .limit(limit)
+    )
+    if with_student:
+        query = query.outerjoin(Student, Student.student_id == Log.student_id)
+    return db.session.execute(query).all()
+
+
+def classified_trial_logs(Log, *criteria, order_by=(), with_student=False):
+    """Return ``(new_rows, legacy_rows)`` for logs matching ``criteria``.
+
+    Rows are as for ``trial_log_rows``. A log with values in both schemes
+    appears in both lists, as with the ``TrialLog`` methods.
+    """
+    return (
+        trial_log_rows(Log, 'new', *criteria, order_by=order_by, with_student=with_student),
+        trial_log_rows(Log, 'legacy', *criteria, order_by=order_by, with_student=with_student),
+    )
+
+
+def trial_log_page(Log, scheme, student_id, cursor=None, limit=50):
+    """One date-descending chunk of a student's logs; return ``(rows, next_cursor)``.
+
+    ``cursor`` is the ``next_cursor`` of the previous chunk (``None`` for the
+    first). Chunks are keyset-paginated on ``(date_of_session, trial_log_id)``,
+    so every chunk costs the same however far back it is.
+    """
+    criteria = [Log.student_id == student_id]
+    if cursor:
+        day, _, last_id = cursor.partition(':')
+        day = date.fromisoformat(day)
+        criteria.append(or_(
+            Log.date_of_session < day,
+            and_(Log.date_of_session == day, Log.trial_log_id < int(last_id)),
+        ))
+    rows = trial_log_rows(
+        Log, scheme, *criteria,
+        order_by=(Log.date_of_session.desc(), Log.trial_log_id.desc()),
+        limit=limit + 1,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].date_of_session.isoformat()}:{rows[-1].trial_log_id}"
+    return rows, next_cursor
+
+
+# Indexed percentage columns and the total that puts a log in their scheme
+BELOW_COLUMNS = {
+    'pct_independent': 'new_total',
+    'pct_correct_new': 'new_total',
+    'pct_correct_legacy': 'legacy_total',
+}
+
+
+def objectives_below(threshold, since, column='pct_independent', Log=TrialLog):
+    """Objectives whose average ``column`` over logs since ``since`` is below ``threshold``.
+
+    Returns rows of ``objective_id``, ``student_id``, ``objective_description``,
+    ``first_name``/``last_name`` (``None`` for archived students), ``logs`` and
+    ``average``, lowest average first. Only logs of the scheme ``column``
+    belongs to count. An average can only be under the threshold if one of its
+    logs is, so candidates come from a range scan of the ``(column,
+    date_of_session)`` index and only their logs are averaged. The scheme is
+    tested on the unindexed total so SQLite doesn't prefer the scheme index.
+    """
+    value = getattr(Log, column)
+    in_scheme = getattr(Log, BELOW_COLUMNS[column]) > 0
+    recent = Log.date_of_session >= since
+    candidates = select(Log.student_id, Log.objective_id).where(value < threshold, recent, in_scheme)
+    average = func.avg(value)
+    query = (
+        select(
+            Log.objective_id, Log.student_id, Objective.objective_description,
+            Student.first_name, Student.last_name,
+            func.count().label('logs'), average.label('average'),
+        )
+        .select_from(Log)
+        .outerjoin(Objective, Objective.objective_id == Log.objective_id)
+        .outerjoin(Student, Student.student_id == Log.student_id)
+        .where(tuple_(Log.student_id, Log.objective_id).in_(candidates), recent, in_scheme)
+        .group_by(Log.objective_id, Log.student_id)
+        .having(average < threshold)
+        .order_by(average)
+    )
+    return db.session.execute(query).all()
+
+
+def ensure_generated_columns(execute, schema='main'):
+    """Add missing ``trial_log`` generated columns and indexes to ``schema``.
+
+    ``execute`` runs one SQL string and returns a cursor-like result, e.g.
+    ``sqlite3.Connection.execute`` or ``Connection.exec_driver_sql``. SQLite
+    can only add generated columns as VIRTUAL; the indexes store the computed
+    values, so filtering and sorting on them is still an index scan.
+    """
+    table = TrialLog.__table__
+    existing = {row[1] for row in execute(f'PRAGMA {schema}.table_xinfo("{table.name}")').fetchall()}
+    if not existing:
+        return []
+    added = []
+    for column in table.columns:
+        if column.computed is None or column.name in existing:
+            continue
+        col_type = column.type.compile(dialect=sqlite.dialect())
+        execute(
+            f'ALTER TABLE {schema}."{table.name}" ADD COLUMN "{column.name}" {col_type} '
+            f'GENERATED ALWAYS AS ({column.computed.sqltext}) VIRTUAL'
+        )
+        added.append(column.name)
+    for index in table.indexes:
+        columns = ', '.join(f'"{column.name}"' for column in index.columns)
+        execute(f'CREATE INDEX IF NOT EXISTS {schema}."{index.name}" ON "{table.name}" ({columns})')
+    return added
+
@@ -0,0 +1,343 @@
+"""Serialize SQLite writes across gunicorn workers.
+
+SQLite lets many connections read at once (in WAL mode, even while a write
+is in progress) but only one of them write. Several workers writing at the
+same time race SQLite's busy handler, and a worker that waits longer than
+the busy timeout fails with "database is locked". ``init_write_coordination``
+makes every write transaction first take an exclusive lock file next to the
+database, right before its first INSERT/UPDATE/DELETE, and release it once
+the transaction commits or rolls back. Writers from every worker process
+and thread then wait their turn on the lock instead of on SQLite. A COMMIT
+that still finds the database busy, for example because ``manage.py`` is
+writing, is retried with exponential backoff.
+
+``benchmark`` runs a mixed read/write load from several processes against
+a copy of the database, with and without coordination.
+"""
+
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+try:
+    import fcntl
+except ImportError:  # Windows: threads in one process are still serialized
+    fcntl = None
+
+WRITE_STATEMENT = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+BenchmarkResult = namedtuple('BenchmarkResult', [
+    'mode', 'workers', 'seconds', 'reads', 'writes', 'lock_errors', 'lock_waits', 'commit_retries',
+])
+
+
+def lock_path_for(db_path):
+    return Path(f"{db_path}.write-lock")
+
+
+def _is_locked(exc):
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class NestedWriteError(RuntimeError):
+    """A thread started a second write transaction while its first is still open."""
+
+
+class WriteLock:
+    """Exclusive lock shared by every process that opens ``path``.
+
+    A thread lock orders writers inside one process; an ``flock`` on the
+    lock file, polled with exponential backoff, orders the processes.
+    The lock belongs to the ``owner`` passed to ``acquire``: the
+    coordinator passes the DBAPI connection whose transaction took it, so
+    another connection ending its transaction on the same thread cannot
+    release it. Without an owner the calling thread owns it.
+
+    Nested write transactions are not supported: a thread that already
+    holds the lock and asks for it for a second owner, e.g. writing through
+    ``engine.begin()`` while the ORM session has uncommitted writes, would
+    wait on itself, so ``acquire`` raises ``NestedWriteError`` instead.
+    """
+
+    def __init__(self, path, timeout=30.0, initial_delay=0.001, max_delay=0.05):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._thread_lock = threading.Lock()
+        self._owner = None
+        self._owner_thread = None
+        self._fd = None
+        self._fd_pid = None
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def _file(self):
+        # Workers forked from a preloaded app must not share the parent's
+        # open file: flock treats all holders of one open file as one owner
+        if self._fd is None or self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    def held(self, owner=None):
+        owner = threading.get_ident() if owner is None else owner
+        return self._owner is not None and self._owner == owner
+
+    def acquire(self, owner=None):
+        """Take the lock for ``owner``; return False if it could not be had within ``timeout``."""
+        thread = threading.get_ident()
+        owner = thread if owner is None else owner
+        if self._owner_thread == thread and self._owner is not None and self._owner != owner:
+            raise NestedWriteError(
+                f"{self.path.name}: this thread already has a write transaction open on another "
+                "connection; commit it before writing through a second one"
+            )
+        started = time.monotonic()
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            self.timeouts += 1
+            return False
+        delay = self.initial_delay
+        waited = False
+        while fcntl is not None:
+            try:
+                fcntl.flock(self._file(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() - started >= self.timeout:
+                    self._thread_lock.release()
+                    self.timeouts += 1
+                    return False
+                waited = True
+                time.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, self.max_delay)
+        if waited:
+            self.waits += 1
+        self.wait_seconds += time.monotonic() - started
+        self._owner = owner
+        self._owner_thread = thread
+        return True
+
+    def release(self, owner=None):
+        if not self.held(owner):
+            return
+        self._owner = None
+        self._owner_thread = None
+        if fcntl is not None:
+            fcntl.flock(self._file(), fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+class WriteCoordinator:
+    """Hooks an SQLite engine so its write transactions take ``lock`` and commits retry."""
+
+    def __init__(self, engine, lock, busy_timeout_ms=10000, commit_retries=5,
+                 initial_delay=0.01, max_delay=1.0, logger=None):
+        self.engine = engine
+        self.lock = lock
+        self.busy_timeout_ms = busy_timeout_ms
+        self.commit_retries = commit_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.logger = logger
+        self.commit_retried = 0
+
+    def install(self, journal_mode=None):
+        @event.listens_for(self.engine, 'connect')
+        def _connect(dbapi_conn, record):
+            dbapi_conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+
+        @event.listens_for(self.engine, 'before_cursor_execute')
+        def _before_write(conn, cursor, statement, parameters, context, executemany):
+            dbapi_conn = conn.connection.dbapi_connection
+            if not self.lock.held(dbapi_conn) and WRITE_STATEMENT.match(statement):
+                if not self.lock.acquire(dbapi_conn) and self.logger:
+                    # Fall back to SQLite's own busy handling rather than fail
+                    self.logger.warning(f"Write lock not acquired within {self.lock.timeout}s")
+
+        # The pool's reset-on-return also rolls back through the dialect, so
+        # these cover every way a transaction can end. They may be handed the
+        # pool's proxy rather than the DBAPI connection that owns the lock
+        dialect = self.engine.dialect
+        commit, rollback = dialect.do_commit, dialect.do_rollback
+
+        def do_commit(dbapi_conn):
+            try:
+                self._commit_with_retry(commit, dbapi_conn)
+            finally:
+                self.lock.release(getattr(dbapi_conn, 'dbapi_connection', dbapi_conn))
+
+        def do_rollback(dbapi_conn):
+            try:
+                rollback(dbapi_conn)
+            finally:
+                self.lock.release(getattr(dbapi_conn, 'dbapi_connection', dbapi_conn))
+
+        dialect.do_commit = do_commit
+        dialect.do_rollback = do_rollback
+
+        if journal_mode:
+            # Persistent in the database file; WAL lets reads run alongside the writer
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql(f"PRAGMA journal_mode = {journal_mode}")
+        return self
+
+    def _commit_with_retry(self, commit, dbapi_conn):
+        # A COMMIT that fails with SQLITE_BUSY leaves the transaction open,
+        # so the same COMMIT can simply be tried again
+        delay = self.initial_delay
+        for attempt in range(self.commit_retries + 1):
+            try:
+                return commit(dbapi_conn)
+            except sqlite3.OperationalError as exc:
+                if attempt == self.commit_retries or not _is_locked(exc):
+                    raise
+                self.commit_retried += 1
+                time.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, self.max_delay)
+
+
+def coordinate_engine(engine, lock_path, busy_timeout_ms=10000, lock_timeout=30.0,
+                      commit_retries=5, journal_mode='wal', logger=None):
+    """Install write coordination on an SQLite ``engine``; return the ``WriteCoordinator``."""
+    coordinator = WriteCoordinator(
+        engine, WriteLock(lock_path, timeout=lock_timeout),
+        busy_timeout_ms=busy_timeout_ms, commit_retries=commit_retries, logger=logger,
+    )
+    return coordinator.install(journal_mode=journal_mode)
+
+
+def init_write_coordination(app, db):
+    """Coordinate writes to ``app``'s SQLite database if ``SQLITE_WRITE_LOCK`` is set.
+
+    Clinician databases get their own ``WriteCoordinator`` when
+    ``clinicians.init_clinician_routing`` opens their engines.
+    """
+    if not app.config.get('SQLITE_WRITE_LOCK', True):
+        return None
+    with app.app_context():
+        engine = db.engine
+    db_path = engine.url.database
+    if engine.dialect.name != 'sqlite' or not db_path or db_path == ':memory:':
+        return None
+
+    coordinator = coordinate_engine(
+        engine,
+        lock_path_for(db_path),
+        busy_timeout_ms=app.config.get('SQLITE_BUSY_TIMEOUT_MS', 10000),
+        lock_timeout=app.config.get('SQLITE_WRITE_LOCK_TIMEOUT', 30),
+        commit_retries=app.config.get('SQLITE_COMMIT_RETRIES', 5),
+        journal_mode=app.config.get('SQLITE_JOURNAL_MODE', 'wal'),
+        logger=app.logger,
+    )
+
+    app.extensions['write_coordinator'] = coordinator
+    return coordinator
+
+
+def _benchmark_worker(db_path, coordinated, seconds, write_ratio, busy_timeout_ms, start_at, seed, results):
+    engine = create_engine(f"sqlite:///{db_path}")
+    coordinator = None
+    if coordinated:
+        coordinator = coordinate_engine(
+            engine, lock_path_for(db_path), busy_timeout_ms=busy_timeout_ms, journal_mode=None,
+        )
+    else:
+        @event.listens_for(engine, 'connect')
+        def _connect(dbapi_conn, record):
+            dbapi_conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    rng = random.Random(seed)
+    with engine.connect() as conn:
+        students = conn.execute(text("SELECT student_id FROM student")).scalars().all() or [None]
+
+    reads = writes = errors = 0
+    time.sleep(max(start_at - time.time(), 0))
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        student_id = rng.choice(students)
+        try:
+            if rng.random() < write_ratio:
+                with engine.begin() as conn:
+                    # Read-then-write, the shape of a typical form POST
+                    conn.execute(text("SELECT COUNT(*) FROM trial_log WHERE student_id = :s"), {'s': student_id})
+                    conn.execute(
+                        text("INSERT INTO trial_log (student_id, date_of_session, independent, incorrect_new) "
+                             "VALUES (:s, DATE('now'), 1, 1)"),
+                        {'s': student_id},
+                    )
+                    conn.execute(text("DELETE FROM trial_log WHERE trial_log_id = last_insert_rowid()"))
+                writes += 1
+            else:
+                with engine.connect() as conn:
+                    conn.execute(
+                        text("SELECT date_of_session, new_total FROM trial_log "
+                             "WHERE student_id = :s ORDER BY date_of_session DESC LIMIT 50"),
+                        {'s': student_id},
+                    ).all()
+                reads += 1
+        except OperationalError as exc:
+            if not _is_locked(exc):
+                raise
+            errors += 1
+    engine.dispose()
+    results.put((
+        reads, writes, errors,
+        coordinator.lock.waits if coordinator else 0,
+        coordinator.commit_retried if coordinator else 0,
+    ))
+
+
+def benchmark(db_path, workers=(1, 2, 4), seconds=3.0, write_ratio=0.1, busy_timeout_ms=50):
+    """Run mixed load from ``workers`` processes on a copy of ``db_path``.
+
+    The copy is switched to WAL. Both modes use the same short
+    ``busy_timeout_ms``, standing in for a write burst that outlasts the
+    app's timeout; coordinated workers queue on the write lock instead.
+    Returns a list of ``BenchmarkResult``.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = Path(tmp) / 'benchmark.db'
+        source, target = sqlite3.connect(db_path), sqlite3.connect(copy)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = wal")
+        finally:
+            source.close()
+            target.close()
+
+        for coordinated in (False, True):
+            for count in workers:
+                queue = context.Queue()
+                start_at = time.time() + 1.0  # let every process finish importing
+                processes = [
+                    context.Process(
+                        target=_benchmark_worker,
+                        args=(copy, coordinated, seconds, write_ratio, busy_timeout_ms, start_at, index, queue),
+                    )
+                    for index in range(count)
+                ]
+                for process in processes:
+                    process.start()
+                # A worker that died never reports; fail instead of waiting forever
+                reports = [queue.get(timeout=seconds + 60) for _ in processes]
+                totals = [sum(values) for values in zip(*reports)]
+                for process in processes:
+                    process.join()
+                results.append(BenchmarkResult(
+                    'coordinated' if coordinated else 'uncoordinated', count, seconds, *totals,
+                ))
+    return results